@@ -0,0 +1,126 @@
+# ann_index.py
+# Busca aproximada (IVF) em NumPy puro para stores de memória grandes
+
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class IVFIndex:
+    """
+    Índice invertido (IVF-Flat) sobre vetores unitários.
+
+    Os centróides são treinados com k-means esférico sobre uma amostra; cada
+    linha da matriz fica na lista do centróide mais próximo. A consulta compara
+    o vetor com os centróides, visita apenas as `nprobe` listas mais próximas e
+    calcula a similaridade exata só para esses candidatos.
+
+    O índice guarda apenas posições de linha: a matriz de vetores continua
+    pertencendo ao chamador (ver `VectorIndex`).
+    """
+
+    def __init__(self, centroids, assignments, nprobe=16):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        assignments = np.asarray(assignments, dtype=np.int64)
+        # Listas invertidas em formato CSR: linhas ordenadas por lista + offsets
+        self._order = np.argsort(assignments, kind="stable")
+        self._offsets = np.searchsorted(assignments[self._order], np.arange(len(self.centroids) + 1))
+        # Linhas adicionadas depois do build, por lista
+        self._extra = [[] for _ in range(len(self.centroids))]
+        self.n_rows = len(assignments)
+        self.built_rows = self.n_rows
+
+    @classmethod
+    def build(cls, matrix, n_lists=None, nprobe=16, iterations=10, sample_size=20000, seed=0):
+        """Treina os centróides e distribui as linhas de `matrix` (N x D, unitária)."""
+        n = matrix.shape[0]
+        n_lists = n_lists or max(1, int(np.sqrt(n)))
+        n_lists = min(n_lists, n)
+        rng = np.random.default_rng(seed)
+
+        sample = matrix
+        if n > sample_size:
+            sample = matrix[rng.choice(n, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample.shape[0], n_lists, replace=False)].astype(np.float32)
+
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Listas vazias mantêm o centróide anterior
+            sums[~empty] /= norms[~empty]
+            sums[empty] = centroids[empty]
+            centroids = sums
+
+        return cls(centroids, cls._assign(centroids, matrix), nprobe=nprobe)
+
+    @staticmethod
+    def _assign(centroids, matrix, chunk=8192):
+        labels = np.empty(matrix.shape[0], dtype=np.int32)
+        for start in range(0, matrix.shape[0], chunk):
+            block = matrix[start:start + chunk]
+            labels[start:start + chunk] = np.argmax(block @ centroids.T, axis=1)
+        return labels
+
+    def add(self, row, unit_vector):
+        list_id = int(np.argmax(self.centroids @ unit_vector))
+        self._extra[list_id].append(row)
+        self.n_rows += 1
+
+    def assignments(self):
+        labels = np.empty(self.n_rows, dtype=np.int32)
+        for list_id in range(len(self.centroids)):
+            labels[self._order[self._offsets[list_id]:self._offsets[list_id + 1]]] = list_id
+            labels[self._extra[list_id]] = list_id
+        return labels
+
+    def candidates(self, unit_query, nprobe=None):
+        """Posições das linhas nas `nprobe` listas mais próximas da consulta."""
+        n_lists = len(self.centroids)
+        nprobe = min(nprobe or self.nprobe, n_lists)
+        centroid_scores = self.centroids @ unit_query
+        if nprobe < n_lists:
+            probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probes = np.arange(n_lists)
+        parts = [self._order[self._offsets[p]:self._offsets[p + 1]] for p in probes]
+        extra = [row for p in probes for row in self._extra[p]]
+        if extra:
+            parts.append(np.asarray(extra, dtype=np.int64))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def save(self, path, ids):
+        """Persiste centróides e atribuições junto com os ids das linhas indexadas."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, assignments=self.assignments(),
+                 ids=np.asarray(ids, dtype=np.int64), nprobe=self.nprobe)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, ids, matrix):
+        """
+        Carrega um índice salvo se ele ainda corresponder a `ids`. Como a tabela de
+        memórias só recebe inserções, um índice salvo cujos ids são prefixo dos
+        atuais é reaproveitado e apenas as linhas novas são atribuídas.
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                saved_ids = data["ids"]
+                if len(saved_ids) > len(ids) or not np.array_equal(saved_ids, np.asarray(ids[:len(saved_ids)], dtype=np.int64)):
+                    return None
+                index = cls(data["centroids"], data["assignments"], nprobe=int(data["nprobe"]))
+        except Exception as e:
+            logger.warning(f"Índice ANN inválido em {path}: {e}")
+            return None
+        for row in range(len(saved_ids), len(ids)):
+            index.add(row, matrix[row])
+        return index
@@ -1,21 +1,36 @@
 # bot.py
+import asyncio
 import discord
 from discord.ext import commands
 import os
 import sys
 import logging
 import json
+import time
 
 # Adiciona o diretório raiz ao path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from core.cancellation import CancellationRegistry, CancellationToken
 from core.config import Config
 from core.logger import setup_logger
 from core.database import DatabaseManager
+from core.debouncer import MessageDebouncer
+from core.dispatcher import MessageDispatcher
 from core.llama_server import LlamaServerManager
+from core.startup import StartupOrchestrator
+from core.stream_renderer import StreamRendererPool
+from modules.answer_cache import AnswerCache, persona_key
+from modules.pipeline import MessageContext
 
 logger = setup_logger(__name__)
 
+# Intervalo mínimo (s) entre avisos de sobrecarga para o mesmo usuário no mesmo canal
+OVERLOAD_NOTICE_INTERVAL = 30.0
+# Rate limits (s) acima disso viram discord.RateLimited em vez de um sleep dentro da chamada;
+# 30 é o mínimo aceito pelo discord.py
+DISCORD_RATELIMIT_TIMEOUT = 30.0
+
 class DiscordBot:
     def __init__(self):
         self.db = DatabaseManager()
@@ -23,6 +38,21 @@ class DiscordBot:
         self.llama_server = LlamaServerManager(self.config)
         self.bot = None
         self._modules = {}
+        self.startup = None
+        # Edições das respostas em stream, com ritmo por canal
+        self.stream_renderers = StreamRendererPool(min_interval=self.config.get_config_value("stream_edit_interval", 1.0))
+        # Mensagens que acionam a IA esperam em filas por usuário; workers fixos geram as respostas
+        self.dispatcher = MessageDispatcher(
+            self._generate_reply,
+            workers=self.config.get_config_value("generation_workers", 1),
+            max_per_user=self.config.get_config_value("user_queue_limit", 3),
+            max_pending=self.config.get_config_value("message_queue_limit", 50),
+        )
+        # Gerações em andamento, canceláveis pela mensagem (apagada/substituída) ou pelo canal
+        self.cancellations = CancellationRegistry()
+        # Rajadas do mesmo usuário no mesmo canal são juntadas antes de entrar na fila
+        self.debouncer = MessageDebouncer(self._submit_batch, window=self.config.get_config_value("debounce_seconds", 1.0))
+        self._overload_notices = {}  # (usuário, canal) -> último aviso de sobrecarga
 
     def register_events(self):
         @self.bot.event
@@ -40,117 +70,323 @@ class DiscordBot:
             # Processa comandos primeiro
             await self.bot.process_commands(message)
             
-            # Lógica de conversação (IA)
-            await self._handle_message_response(message)
+            # Lógica de conversação (IA): enfileirada, a geração roda nos workers
+            await self._dispatch_message(message)
+
+        @self.bot.event
+        async def on_raw_message_delete(payload):
+            # Mensagem que acionou a IA foi apagada: a resposta não serve mais
+            self._drop_messages(lambda msg: msg.id == payload.message_id)
+            self.cancellations.cancel_message(payload.message_id, "deleted")
+
+        @self.bot.event
+        async def on_raw_bulk_message_delete(payload):
+            ids = set(payload.message_ids)
+            self._drop_messages(lambda msg: msg.id in ids)
+            for message_id in ids:
+                self.cancellations.cancel_message(message_id, "deleted")
+
+        @self.bot.event
+        async def on_guild_channel_delete(channel):
+            self._drop_messages(lambda msg: getattr(msg.channel, "id", None) == channel.id)
+            self.cancellations.cancel_channel(channel.id)
+
+    def _build_startup(self):
+        """
+        Fases de inicialização. Banco, servidor LLM e aquecimento do modelo de
+        embeddings rodam em paralelo; só o que depende deles espera.
+        """
+        startup = StartupOrchestrator()
+        startup.add("database", self.db.connect)
+        startup.add("llama_server", self._start_llama_server, depends_on=("database",))
+        startup.add("modules", self.load_modules, depends_on=("database",))
+        startup.add("ai_backend", self._initialize_ai_backend, depends_on=("modules", "llama_server"))
+        startup.add("embeddings", self._warm_up_embeddings, depends_on=("modules",))
+        return startup
+
+    async def _start_llama_server(self):
+        backend = await self.config.get_config_db("llm_backend", "lm_studio")
+        if backend == "llama_cpp":
+            logger.info("Configurado para usar llama.cpp. Iniciando servidor...")
+            self.llama_server.start()
+            if not await self.llama_server.wait_for_ready(timeout=60):
+                raise RuntimeError("Llama Server não ficou pronto. O bot pode não funcionar corretamente.")
+
+    async def _initialize_ai_backend(self):
+        await self._modules['ai_handler'].initialize()
+
+    async def _warm_up_embeddings(self):
+        # Carrega o modelo na thread de embeddings para o primeiro usuário não pagar a carga
+        if not await self._modules['memory'].embeddings.load():
+            raise RuntimeError("Modelo de embeddings indisponível.")
 
     async def load_modules(self):
         """Carrega todos os Cogs de forma explícita."""
-        try:
-            from modules.memory import Memory
-            from modules.ai_handler import AIHandler
-            from modules.setup import CharacterWizard
-            from modules.commands import CommandHandler
-
-            # 0. Start Llama Server if needed
-            backend = await self.config.get_config_db("llm_backend", "lm_studio")
-            if backend == "llama_cpp":
-                logger.info("Configurado para usar llama.cpp. Iniciando servidor...")
-                self.llama_server.start()
-                if not await self.llama_server.wait_for_ready(timeout=60):
-                    logger.error("Falha ao iniciar Llama Server. O bot pode não funcionar corretamente.")
-
-            # 1. Base
-            self._modules['memory'] = Memory(self.config, self.db)
-            self._modules['ai_handler'] = AIHandler(self.config)
-            await self._modules['ai_handler'].initialize()
-
-            # 2. Registrar Cogs no Discord (Pycord add_cog is synchronous)
-            self.bot.add_cog(CharacterWizard(self.bot, self.db, self._modules['ai_handler'], self._modules['memory']))
-            self.bot.add_cog(CommandHandler(self.bot, self.config, self._modules['memory'], self._modules['ai_handler']))
-            
-            logger.info("Todos os módulos carregados com sucesso.")
-        except Exception as e:
-            logger.error(f"Erro crítico no carregamento de módulos: {e}", exc_info=True)
+        from modules.memory import Memory
+        from modules.ai_handler import AIHandler
+        from modules.setup import CharacterWizard
+        from modules.commands import CommandHandler
+
+        # 1. Base
+        self._modules['memory'] = Memory(self.config, self.db)
+        self._modules['ai_handler'] = AIHandler(self.config)
+
+        # 2. Registrar Cogs no Discord (Pycord add_cog is synchronous)
+        self.bot.add_cog(CharacterWizard(self.bot, self.db, self._modules['ai_handler'], self._modules['memory']))
+        self.bot.add_cog(CommandHandler(self.bot, self.config, self._modules['memory'], self._modules['ai_handler']))
 
-    async def _handle_message_response(self, message):
-        """Lógica de resposta da IA (Menção ou Keyword)"""
+        logger.info("Todos os módulos carregados com sucesso.")
+
+    async def _report_startup(self):
+        await self.startup.wait()
+        logger.info(self.startup.report())
+
+    def metrics_report(self):
+        """Métricas internas em linhas curtas; usadas pelo !status e pelo log periódico."""
+        dispatch = self.dispatcher.snapshot()
+        counts = self.dispatcher.metrics
+        lines = [
+            f"Mensagens: {dispatch['busy']}/{dispatch['workers']} workers ocupados, {dispatch['queued']} na fila "
+            f"({dispatch['users_waiting']} usuários), espera p95={counts['wait_ms'].percentile(95):g}ms, "
+            f"recusadas {counts['rejected']}, substituídas {counts['superseded']}, descartadas {counts['dropped']}"
+        ]
+        stream = self.stream_renderers.metrics
+        if stream["replies"]:
+            lines.append(
+                f"Stream: {stream['replies']} respostas, edições/resposta {stream['edits_per_reply'].describe()}, "
+                f"rate limits {stream['rate_limited']}, erros {stream['errors']}, continuações {stream['rollovers']}, descartadas {stream['discarded']}"
+            )
+        memory = self._modules.get('memory')
+        if memory is not None:
+            embeddings = memory.embeddings.metrics
+            lines.append(
+                f"Embeddings: lote {embeddings['batch_size'].describe()}, "
+                f"espera {embeddings['queue_wait_ms'].describe('ms')}, cancelados {embeddings['cancelled']}"
+            )
+            gate = memory.retrieval_gate
+            if gate.metrics["checked"]:
+                lines.append(
+                    f"Pré-filtro de memórias: {gate.skip_ratio:.0%} puladas de {gate.metrics['checked']} "
+                    f"(vazias {gate.metrics['skipped_empty']}, triviais {gate.metrics['skipped_trivial']}, "
+                    f"centroide {gate.metrics['skipped_centroid']})"
+                )
+            answers = memory.answer_cache
+            if answers.enabled:
+                lines.append(
+                    f"Cache semântico: {answers.hit_rate:.0%} de acerto "
+                    f"({answers.metrics['hits']}/{answers.metrics['lookups']}), {answers.metrics['stores']} gravadas"
+                )
+        ai_handler = self._modules.get('ai_handler')
+        if ai_handler is not None:
+            scheduler = ai_handler.provider.scheduler
+            snapshot = scheduler.snapshot()
+            queued = ", ".join(f"{name} {n}" for name, n in snapshot["queued"].items())
+            waits = ", ".join(
+                f"{name} p95={h.percentile(95):g}ms" for name, h in scheduler.metrics["wait_ms"].items() if h.count
+            )
+            lines.append(f"LLM: {snapshot['in_flight']}/{snapshot['slots']} slots ocupados, fila: {queued}" + (f", espera: {waits}" if waits else ""))
+            provider = ai_handler.provider.metrics
+            if provider["cancelled"]:
+                lines.append(
+                    f"Gerações canceladas: {provider['cancelled']} ({provider['cancelled_tokens']} tokens descartados, "
+                    f"~{provider['cancelled_tokens_saved']} não gerados), motivos: "
+                    + ", ".join(f"{reason} {n}" for reason, n in self.cancellations.metrics["cancelled"].items())
+                )
+            cache = ai_handler.provider.response_cache
+            if cache is not None:
+                lines.append(
+                    f"Cache de respostas LLM: {cache.hit_rate:.0%} de acerto "
+                    f"({cache.metrics['hits']}/{cache.metrics['hits'] + cache.metrics['misses']}), {cache.metrics['stores']} gravadas"
+                )
+        return lines
+
+    async def _report_metrics(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            lines = self.metrics_report()
+            if lines:
+                logger.info("Métricas: " + " | ".join(lines))
+
+    async def _is_triggered(self, message):
+        """A mensagem aciona a IA? (Menção ou Keyword)"""
         # Se a mensagem foi um comando (começa com o prefixo), ignoramos a resposta automática de IA
         if message.content.startswith(self.bot.command_prefix):
-            return
+            return False
 
         was_mentioned = self.bot.user in message.mentions
         keyword = await self.config.get_config_db('bot_keyword', 'blepp')
         contains_keyword = keyword.lower() in message.content.lower()
-
         if was_mentioned or contains_keyword:
             logger.info(f"IA ativada por {message.author.name} (Mention: {was_mentioned}, Keyword: {contains_keyword})")
-            
-            # Limpa o texto
-            user_message = message.content.replace(f'<@{self.bot.user.id}>', '').replace(f'<@!{self.bot.user.id}>', '').strip()
-            
-            # Se não houver canal (raro), não podemos mostrar typing mas podemos processar
-            typing_ctx = message.channel.typing() if message.channel else None
-            
-            try:
-                if typing_ctx:
-                    await typing_ctx.__aenter__()
+        return was_mentioned or contains_keyword
+
+    async def _dispatch_message(self, message):
+        if not await self._is_triggered(message):
+            return
+        channel_id = getattr(message.channel, "id", None)
+        # Resposta ainda em geração (ou na fila) para o mesmo canal fica obsoleta: cancela e junta ao novo lote
+        superseded = self.dispatcher.supersede(
+            message.author.id, lambda batch: getattr(batch[-1].channel, "id", None) == channel_id
+        )
+        earlier = [msg for batch in superseded for msg in batch]
+        for msg in earlier:
+            self.cancellations.cancel_message(msg.id, "superseded")
+        if earlier:
+            logger.info(f"Nova mensagem de {message.author.name}: {len(superseded)} resposta(s) substituída(s)")
+        if self.debouncer.window > 0:
+            self.debouncer.add((message.author.id, channel_id), message, earlier=earlier)
+        else:
+            await self._submit_batch((message.author.id, channel_id), earlier + [message])
 
-                # Contexto e Memória
-                context_data = await self._modules['memory'].get_context(message.author.id, query_text=user_message)
-                base_personality = await self._get_active_profile_prompt()
-                
+    def _drop_messages(self, predicate):
+        """Esquece mensagens que ainda não começaram a ser respondidas (no debounce ou na fila)."""
+        held = self.debouncer.discard(predicate)
+        queued = self.dispatcher.rewrite_queued(lambda batch: [m for m in batch if not predicate(m)] or None)
+        if held or queued:
+            logger.info(f"Mensagens apagadas descartadas antes da geração: {held} no debounce, {queued} lote(s) na fila")
+
+    async def _submit_batch(self, key, messages):
+        if self.dispatcher.submit(key[0], messages) or not messages[-1].channel:
+            return
+        # Um aviso de sobrecarga por usuário/canal a cada OVERLOAD_NOTICE_INTERVAL, não um por mensagem
+        now = time.monotonic()
+        if now - self._overload_notices.get(key, float("-inf")) < OVERLOAD_NOTICE_INTERVAL:
+            return
+        self._overload_notices[key] = now
+        if len(self._overload_notices) > 1024:
+            self._overload_notices = {k: t for k, t in self._overload_notices.items() if now - t < OVERLOAD_NOTICE_INTERVAL}
+        try:
+            await messages[-1].channel.send("Estou com muitas mensagens agora, tente de novo em instantes.")
+        except discord.HTTPException as e:
+            logger.warning(f"Falha ao enviar aviso de sobrecarga: {e}")
+
+    async def _generate_reply(self, messages):
+        """Gera e envia uma resposta para um lote de mensagens seguidas do mesmo usuário e canal."""
+        message = messages[-1]
+        # Limpa o texto; mensagens juntadas pelo debounce viram um só prompt, em ordem
+        user_message = "\n".join(
+            text for text in (
+                m.content.replace(f'<@{self.bot.user.id}>', '').replace(f'<@!{self.bot.user.id}>', '').strip() for m in messages
+            ) if text
+        )
+        
+        # Se não houver canal (raro), não podemos mostrar typing mas podemos processar
+        typing_ctx = message.channel.typing() if message.channel else None
+        renderer = None
+        # Apagar uma mensagem do lote cancela a geração (as restantes voltam à fila); apagar o canal descarta tudo
+        cancel_token = CancellationToken()
+        message_ids = [m.id for m in messages]
+        self.cancellations.register(cancel_token, message_ids, getattr(message.channel, "id", None))
+        
+        try:
+            if typing_ctx:
+                await typing_ctx.__aenter__()
+
+            # Servidor LLM ainda subindo: a mensagem espera em vez de receber "Erro de conexão"
+            if self.startup is not None and not self.startup.ready("ai_backend"):
+                await self.startup.wait("ai_backend")
+                if cancel_token.cancelled:
+                    await self._requeue_remaining(messages, cancel_token)
+                    return
+
+            # Contexto e Memória (o pipeline carrega embedding e ids recuperados entre as etapas)
+            pipeline = MessageContext(str(message.author.id), user_message)
+            with pipeline.stage("context"):
+                context_data = await self._modules['memory'].get_context(message.author.id, query_text=user_message, pipeline=pipeline)
+                persona, base_personality = await self._get_active_persona()
+
+            # Cache semântico: só é compartilhada a resposta cujo prompt não teve nada do usuário
+            # (histórico, resumos ou memórias) — senão B receberia algo escrito a partir da conversa de A
+            answer_cache = self._modules['memory'].answer_cache
+            cacheable = (
+                answer_cache.enabled and pipeline.query_embedding is not None and not pipeline.retrieved_memory_ids
+                and not context_data['history'] and not context_data['journal'] and not context_data['memories']
+            )
+            cached_answer = answer_cache.lookup(persona, pipeline.query_embedding) if cacheable else None
+            
+            with pipeline.stage("generation"):
                 logger.debug(f"Gerando resposta para: {user_message}")
-                # Geração Stream
-                response_gen = self._modules['ai_handler'].generate_response_stream(
-                    prompt=user_message,
-                    personality=base_personality,
-                    context=context_data['history']
-                )
-                
+                # Geração Stream (ou replay da resposta em cache, sem chamar o provider)
+                if cached_answer is not None:
+                    response_gen = AnswerCache.replay(cached_answer)
+                else:
+                    response_gen = self._modules['ai_handler'].generate_response_stream(
+                        prompt=user_message,
+                        personality=base_personality,
+                        context=context_data['history'],
+                        user_id=str(message.author.id),
+                        memories=context_data['memories'],
+                        journal=context_data['journal'],
+                        cancel_token=cancel_token
+                    )
+            
                 full_response = ""
-                sent_msg = None
+                # Só tenta enviar texto se houver um canal real
+                renderer = self.stream_renderers.renderer(message.channel) if message.channel else None
                 async for chunk in response_gen:
+                    if cancel_token.cancelled:
+                        # O provider fecha a conexão e encerra o stream em seguida
+                        continue
                     full_response += chunk
-                    # Só tenta enviar texto se houver um canal real
-                    if message.channel:
-                        if not sent_msg and len(full_response) > 5:
-                            try:
-                                sent_msg = await message.channel.send(full_response)
-                            except: pass
-                        elif sent_msg and len(full_response) % 40 == 0: 
-                            try:
-                                await sent_msg.edit(content=full_response)
-                            except: pass
-                
-                if not full_response:
-                    full_response = "Desculpe, não consegui pensar em nada."
-
-                if sent_msg: 
-                    try: await sent_msg.edit(content=full_response)
-                    except: pass
-                elif message.channel:
-                    try: await message.channel.send(full_response)
-                    except: pass
-
-                logger.info(f"Resposta gerada ({len(full_response)} chars).")
+                    if renderer:
+                        renderer.feed(chunk)
 
-            except Exception as e:
-                logger.error(f"Erro ao processar resposta: {e}", exc_info=True)
-            finally:
-                if typing_ctx:
-                    await typing_ctx.__aexit__(None, None, None)
+            if cancel_token.cancelled:
+                logger.info(f"Resposta cancelada ({cancel_token.reason}) após {len(full_response)} chars")
+                if renderer:
+                    await renderer.discard()
+                await self._requeue_remaining(messages, cancel_token)
+                return
+            
+            if not full_response:
+                full_response = "Desculpe, não consegui pensar em nada."
+            elif cacheable and cached_answer is None and not full_response.startswith("Erro"):
+                answer_cache.store(persona, pipeline.query_embedding, full_response)
 
-    async def _get_active_profile_prompt(self):
+            # Edição final sempre enviada (continua em novas mensagens após 2000 caracteres)
+            if renderer:
+                await renderer.finish(full_response)
+
+            logger.info(f"Resposta gerada ({len(full_response)} chars). {pipeline.report()}")
+
+        except asyncio.CancelledError:
+            # Substituída por uma mensagem mais nova: some com a resposta parcial
+            if renderer:
+                await renderer.discard()
+            raise
+        except Exception as e:
+            logger.error(f"Erro ao processar resposta: {e}", exc_info=True)
+        finally:
+            self.cancellations.unregister(message_ids)
+            if typing_ctx:
+                await typing_ctx.__aexit__(None, None, None)
+
+    async def _requeue_remaining(self, messages, cancel_token):
+        """Lote cancelado por mensagens apagadas: as que sobraram voltam para a fila sem as apagadas."""
+        if cancel_token.reason != "deleted":
+            return
+        remaining = [m for m in messages if m.id not in cancel_token.sources]
+        if not remaining:
+            return
+        # Sem await entre o unregister e o submit: um delete posterior acha as mensagens na fila
+        self.cancellations.unregister([m.id for m in messages])
+        logger.info(f"{len(messages) - len(remaining)} mensagem(ns) do lote apagada(s); respondendo às {len(remaining)} restantes")
+        await self._submit_batch((remaining[-1].author.id, getattr(remaining[-1].channel, "id", None)), remaining)
+
+    async def _get_active_persona(self):
+        """Retorna (chave da persona ativa, prompt de sistema)."""
         try:
-            async with self.db._db.execute("SELECT identity_json, personality_json FROM character_profiles WHERE is_active = 1") as cursor:
-                row = await cursor.fetchone()
-                if row:
-                    id_p = json.loads(row[0])
-                    pers_p = json.loads(row[1])
-                    return f"Você é {id_p.get('name')}. Personalidade: {pers_p.get('traits')}"
-            return "Você é um assistente útil."
+            row = await self.db.get_active_profile()
+            if row:
+                id_p = json.loads(row[0])
+                pers_p = json.loads(row[1])
+                return persona_key(row[0], row[1]), f"Você é {id_p.get('name')}. Personalidade: {pers_p.get('traits')}"
+            return persona_key(None, None), "Você é um assistente útil."
         except:
-            return "Você é um assistente útil."
+            return persona_key(None, None), "Você é um assistente útil."
+
+    async def _get_active_profile_prompt(self):
+        return (await self._get_active_persona())[1]
 
     def run(self):
         token = self.config.get_token()
@@ -162,28 +398,51 @@ class DiscordBot:
             intents.members = True
             
             prefix = os.getenv('COMMAND_PREFIX', '-')
-            self.bot = commands.Bot(command_prefix=prefix, intents=intents, help_command=None)
+            self.bot = commands.Bot(
+                command_prefix=prefix, intents=intents, help_command=None,
+                max_ratelimit_timeout=DISCORD_RATELIMIT_TIMEOUT,
+            )
             self.bot.owner_instance = self
             self.register_events()
 
-            # Connect DB first
-            await self.db.connect()
-            
-            # Load modules
-            await self.load_modules()
-            
+            # Fases de inicialização em paralelo; o Discord só espera banco + cogs
+            self.startup = self._build_startup()
+            self.startup.start()
+            report_task = metrics_task = None
+
             try:
+                # Sem banco ou módulos não há o que servir: aborta como antes da paralelização
+                if not await self.startup.wait("modules"):
+                    logger.error("Inicialização abortada: banco de dados ou módulos falharam.")
+                    return
+                # Os workers esperam as fases do LLM por conta própria (ver _generate_reply)
+                self.dispatcher.start()
+                report_task = asyncio.create_task(self._report_startup())
+                metrics_interval = self.config.get_config_value("metrics_log_interval", 300)
+                if metrics_interval > 0:
+                    metrics_task = asyncio.create_task(self._report_metrics(metrics_interval))
                 logger.info("Tentando conectar ao Discord...")
                 await self.bot.start(token)
             except Exception as e:
                 logger.error(f"Erro fatal no bot.start: {e}", exc_info=True)
             finally:
+                for task in (report_task, metrics_task):
+                    if task is not None:
+                        task.cancel()
+                await self.debouncer.close()
+                await self.dispatcher.stop()
+                await self.startup.cancel()
                 if self.llama_server:
                     self.llama_server.stop()
                 if not self.bot.is_closed():
                     await self.bot.close()
+                if 'memory' in self._modules:
+                    await self._modules['memory'].embeddings.close()
+                if 'ai_handler' in self._modules:
+                    await self._modules['ai_handler'].close()
+                # Grava escritas pendentes do buffer write-behind antes de sair
+                await self.db.close()
 
-        import asyncio
         try:
             asyncio.run(runner())
         except KeyboardInterrupt:
@@ -0,0 +1,80 @@
+# cancellation.py
+# Tokens de cancelamento passados do evento do Discord até o stream do backend
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CancellationToken:
+    """
+    Sinaliza que o resultado de uma geração não é mais necessário (mensagem
+    apagada, canal removido, mensagem mais nova). Quem faz I/O registra um
+    callback para interromper na hora (ex.: fechar a resposta HTTP).
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self.reason = None
+        self.sources = set()  # ids das mensagens cujo evento cancelou o token (ex.: apagadas)
+        self._callbacks = []
+
+    def cancel(self, reason="cancelled"):
+        if self.cancelled:
+            return
+        self.cancelled = True
+        self.reason = reason
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug(f"Callback de cancelamento falhou: {e}")
+
+    def add_callback(self, callback):
+        """Chama `callback` no cancelamento (na hora, se já cancelado). Retorna a função que o remove."""
+        if self.cancelled:
+            callback()
+            return lambda: None
+        self._callbacks.append(callback)
+
+        def remove():
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+        return remove
+
+
+class CancellationRegistry:
+    """Tokens das gerações em andamento, encontrados pelo id da mensagem ou do canal."""
+
+    def __init__(self):
+        self._by_message = {}  # message_id -> (channel_id, token)
+        self.metrics = {"cancelled": {}}
+
+    def register(self, token, message_ids, channel_id=None):
+        for message_id in message_ids:
+            self._by_message[message_id] = (channel_id, token)
+
+    def unregister(self, message_ids):
+        for message_id in message_ids:
+            self._by_message.pop(message_id, None)
+
+    def _cancel(self, token, reason):
+        if not token.cancelled:
+            token.cancel(reason)
+            self.metrics["cancelled"][reason] = self.metrics["cancelled"].get(reason, 0) + 1
+
+    def cancel_message(self, message_id, reason="deleted"):
+        entry = self._by_message.get(message_id)
+        if entry is None:
+            return False
+        entry[1].sources.add(message_id)
+        self._cancel(entry[1], reason)
+        return True
+
+    def cancel_channel(self, channel_id, reason="channel_deleted"):
+        tokens = {id(token): token for channel, token in self._by_message.values() if channel == channel_id}
+        for token in tokens.values():
+            self._cancel(token, reason)
+        return len(tokens)
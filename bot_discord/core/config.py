@@ -29,6 +29,27 @@ class Config:
             "llama_server_host": os.getenv("LLAMA_SERVER_HOST", "127.0.0.1"),
             "llama_server_port": int(os.getenv("LLAMA_SERVER_PORT", 8080)),
             "llama_server_flags": os.getenv("LLAMA_SERVER_FLAGS", "-c 4096"),
+            # Slots paralelos do backend; sem LLM_PARALLEL_SLOTS vale o -np das flags do llama-server
+            "llm_parallel_slots": int(os.getenv("LLM_PARALLEL_SLOTS") or self._parallel_from_flags(os.getenv("LLAMA_SERVER_FLAGS", "-c 4096"), 1)),
+            # Workers de geração e limites das filas de mensagens (backpressure)
+            "generation_workers": int(os.getenv("GENERATION_WORKERS") or os.getenv("LLM_PARALLEL_SLOTS") or self._parallel_from_flags(os.getenv("LLAMA_SERVER_FLAGS", "-c 4096"), 1)),
+            "user_queue_limit": int(os.getenv("USER_QUEUE_LIMIT", 3)),
+            "message_queue_limit": int(os.getenv("MESSAGE_QUEUE_LIMIT", 50)),
+            # Mensagens do mesmo usuário no mesmo canal dentro desta janela (s) viram um só prompt; 0 desliga
+            "debounce_seconds": float(os.getenv("DEBOUNCE_SECONDS", 1.0)),
+            # Janela de contexto do backend (-c do llama-server) e tokens reservados para a resposta
+            "llm_context_tokens": int(os.getenv("LLM_CONTEXT_TOKENS") or self._context_from_flags(os.getenv("LLAMA_SERVER_FLAGS", "-c 4096"))),
+            "llm_reply_tokens": int(os.getenv("LLM_REPLY_TOKENS", 1024)),
+            "llm_response_cache": os.getenv("LLM_RESPONSE_CACHE", "false").lower() == "true",
+            "answer_cache": os.getenv("ANSWER_CACHE", "false").lower() == "true",
+            # Intervalo mínimo (s) entre edições da resposta em stream no mesmo canal
+            "stream_edit_interval": float(os.getenv("STREAM_EDIT_INTERVAL", 1.0)),
+            # Pré-filtro da busca de memórias: mínimo de palavras com conteúdo e, opcional, similaridade
+            # mínima da pergunta com o centroide das memórias do usuário ou das globais
+            "retrieval_min_tokens": int(os.getenv("RETRIEVAL_MIN_TOKENS", 1)),
+            "retrieval_centroid_threshold": float(os.getenv("RETRIEVAL_CENTROID_THRESHOLD")) if os.getenv("RETRIEVAL_CENTROID_THRESHOLD") else None,
+            # Intervalo (s) da linha de métricas internas no log; 0 desliga (o !status mostra as mesmas)
+            "metrics_log_interval": float(os.getenv("METRICS_LOG_INTERVAL", 300)),
             "model_path": os.getenv('LLM_MODEL_PATH', os.path.join(self.base_path, "data", "models", "model.gguf")),
             "device": os.getenv('DEVICE', 'xpu'),
             "search_enabled": False,
@@ -38,6 +59,32 @@ class Config:
             "moderation_enabled": False,
         }
         
+    @staticmethod
+    def _flag_value(flags, names, default=None):
+        """Valor inteiro da primeira flag de `names` nas flags do llama-server."""
+        parts = (flags or "").split()
+        for i, part in enumerate(parts[:-1]):
+            if part in names and parts[i + 1].isdigit():
+                return int(parts[i + 1])
+        return default
+
+    @staticmethod
+    def _context_from_flags(flags, default=4096):
+        """Extrai o tamanho de contexto (-c / --ctx-size) das flags do llama-server."""
+        return Config._flag_value(flags, ("-c", "--ctx-size"), default)
+
+    @staticmethod
+    def _parallel_from_flags(flags, default=None):
+        """Extrai o número de slots (-np / --parallel) das flags do llama-server."""
+        return Config._flag_value(flags, ("-np", "--parallel"), default)
+
+    @staticmethod
+    def context_per_slot(context_tokens, slots, flags=""):
+        """O llama-server divide o -c entre os slots, salvo com KV unificado (-kvu / --kv-unified)."""
+        if any(flag in ("-kvu", "--kv-unified") for flag in (flags or "").split()):
+            return context_tokens
+        return context_tokens // max(1, slots)
+
     def get_token(self):
         """Obtém o token do Discord das variáveis de ambiente"""
         token = os.getenv('DISCORD_TOKEN')
@@ -2,30 +2,79 @@
 # Gerenciamento assíncrono do banco de dados SQLite
 
 import aiosqlite
+import asyncio
 import logging
 import os
+import re
+import time
 import numpy as np
 from datetime import datetime
 
+from core.db_pool import ConnectionPool
+from core.global_index import GlobalMemoryIndex
+from core.quantization import encode_blob
+from core.similarity import select_top_k, top_k_similarity
+from core.vector_index import VectorIndex, normalize
+
 logger = logging.getLogger(__name__)
 
+GLOBAL_MEMORY_KEY = 'global_legacy'
+
+# Palavras ignoradas na consulta lexical (casam com quase tudo)
+FTS_STOPWORDS = {
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "no", "na", "nos", "nas",
+    "um", "uma", "que", "se", "eu", "voce", "você", "me", "te", "pra", "para", "por", "com",
+    "ele", "ela", "isso", "isto", "é", "ser", "tem", "mais", "muito", "sim", "nao", "não",
+}
+
 class DatabaseManager:
-    def __init__(self, db_path=None):
+    def __init__(self, db_path=None, index_max_bytes=64 * 1024 * 1024, flush_interval=0.05, max_pending_writes=64, read_connections=3, ann_threshold=20000, embedding_storage=None, rescore_factor=4, fts_prefilter_min=2000, importance_weight=0.1):
         self.db_path = db_path or os.path.join(
             os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
             'data',
             'bot_database.db'
         )
         self._db = None
+        self._pool = ConnectionPool(self.db_path, readers=read_connections)
+        # Índices ANN dos stores grandes ficam ao lado do bot_database.db
+        ann_dir = None if self.db_path == ":memory:" else os.path.join(os.path.dirname(self.db_path), 'ann')
+        # float32 (padrão) ou float16/int8 para a busca de candidatos com re-pontuação exata
+        self.embedding_storage = embedding_storage or os.getenv('EMBEDDING_STORAGE', 'float32')
+        self.rescore_factor = rescore_factor
+        # Peso da coluna importance no ranking final: score * (1 + importance_weight * (importance - 1))
+        self.importance_weight = importance_weight
+        # Busca lexical (FTS5); desativada automaticamente se o SQLite não tiver o módulo
+        self.fts_enabled = True
+        self.fts_prefilter_min = fts_prefilter_min
+        self.vector_index = VectorIndex(max_bytes=index_max_bytes, ann_threshold=ann_threshold, ann_dir=ann_dir, storage=self.embedding_storage)
+        self._index_locks = {}
+        # Memórias globais: build único em .npy mapeado em memória, refeito só quando mudam
+        self.global_index = GlobalMemoryIndex(None if self.db_path == ":memory:" else os.path.dirname(self.db_path))
+        self._global_stale = True
+        self._global_lock = asyncio.Lock()
+
+        # Buffer write-behind (group commit)
+        self.flush_interval = flush_interval
+        self.max_pending_writes = max_pending_writes
+        self._pending = []
+        self._dirty = set()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+        self._backfill_task = None
+        self.failed_writes = 0
 
     async def connect(self):
         """Estabelece conexão com o banco de dados e cria tabelas se necessário."""
         try:
-            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-            self._db = await aiosqlite.connect(self.db_path)
-            self._db.row_factory = aiosqlite.Row
+            if self.db_path != ":memory:":
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            # Conexão de escrita dedicada (WAL); leituras usam o pool de leitores
+            await self._pool.open()
+            self._db = self._pool.writer
             await self._create_tables()
-            logger.info(f"Conectado ao banco de dados: {self.db_path}")
+            await self._pool.open_readers()
+            self._backfill_task = asyncio.get_running_loop().create_task(self._run_backfill())
+            logger.info(f"Conectado ao banco de dados: {self.db_path} (journal: {self._pool.journal_mode}, leitores: {len(self._pool._readers)})")
         except Exception as e:
             logger.error(f"Erro ao conectar ao banco de dados: {e}")
             raise
@@ -65,6 +114,11 @@ class DatabaseManager:
                 embedding BLOB,
                 importance INTEGER DEFAULT 1,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                dim INTEGER,
+                norm REAL,
+                dtype TEXT,
+                embedding_q BLOB,
+                q_dtype TEXT,
                 FOREIGN KEY (user_id) REFERENCES users (user_id)
             )
             """,
@@ -81,6 +135,16 @@ class DatabaseManager:
             """,
             "CREATE INDEX IF NOT EXISTS idx_history_user_time ON conversation_history(user_id, timestamp)",
             
+            # Cache de respostas determinísticas do LLM (tarefas de fundo)
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_llm_cache_created ON llm_cache(created_at)",
+
             # Tabela de Perfis de Personagem
             """
             CREATE TABLE IF NOT EXISTS character_profiles (
@@ -99,60 +163,252 @@ class DatabaseManager:
         ]
         for query in queries:
             await self._db.execute(query)
+        await self._migrate_memories()
+        await self._create_fts()
         await self._db.commit()
 
+    async def _create_fts(self):
+        """
+        Espelha memories.content em uma tabela FTS5 (external content) mantida por
+        triggers. Na primeira criação o índice é reconstruído com as linhas existentes.
+        """
+        async with self._db.execute("SELECT 1 FROM sqlite_master WHERE name = 'memories_fts'") as cursor:
+            exists = await cursor.fetchone() is not None
+        try:
+            await self._db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5("
+                "content, content='memories', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+            )
+        except aiosqlite.OperationalError as e:
+            self.fts_enabled = False
+            logger.warning(f"FTS5 indisponível, busca apenas vetorial: {e}")
+            return
+
+        triggers = [
+            """CREATE TRIGGER IF NOT EXISTS memories_fts_ai AFTER INSERT ON memories BEGIN
+                INSERT INTO memories_fts(rowid, content) VALUES (new.id, new.content);
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS memories_fts_ad AFTER DELETE ON memories BEGIN
+                INSERT INTO memories_fts(memories_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS memories_fts_au AFTER UPDATE OF content ON memories BEGIN
+                INSERT INTO memories_fts(memories_fts, rowid, content) VALUES ('delete', old.id, old.content);
+                INSERT INTO memories_fts(rowid, content) VALUES (new.id, new.content);
+            END""",
+        ]
+        for trigger in triggers:
+            await self._db.execute(trigger)
+        if not exists:
+            await self._db.execute("INSERT INTO memories_fts(memories_fts) VALUES ('rebuild')")
+
+    async def _migrate_memories(self):
+        """
+        Bancos antigos guardavam o embedding bruto sem metadados. Adiciona as colunas
+        dim/norm/dtype; as linhas existentes são convertidas por `_backfill_embeddings`.
+        `embedding_q`/`q_dtype` guardam a cópia quantizada opcional (ver
+        `tools/quantize_embeddings.py`).
+        """
+        async with self._db.execute("PRAGMA table_info(memories)") as cursor:
+            columns = {row[1] for row in await cursor.fetchall()}
+        for name, decl in (("dim", "INTEGER"), ("norm", "REAL"), ("dtype", "TEXT"), ("embedding_q", "BLOB"), ("q_dtype", "TEXT")):
+            if name not in columns:
+                await self._db.execute(f"ALTER TABLE memories ADD COLUMN {name} {decl}")
+        await self._db.execute("CREATE INDEX IF NOT EXISTS idx_memories_user_dim ON memories(user_id, dim)")
+
+    async def _run_backfill(self):
+        try:
+            await self._backfill_embeddings()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Erro na migração de embeddings: {e}")
+
+    async def _backfill_embeddings(self, batch_size=256):
+        """
+        Converte, em lotes, embeddings antigos (norm IS NULL) para vetores unitários
+        com dim/norm preenchidos. Cada lote é uma transação curta e o loop cede o
+        controle entre lotes, então o bot continua respondendo durante a migração.
+        """
+        total = 0
+        while True:
+            async with self._pool.reader() as conn, conn.execute(
+                "SELECT id, embedding FROM memories WHERE embedding IS NOT NULL AND norm IS NULL LIMIT ?",
+                (batch_size,)
+            ) as cursor:
+                rows = await cursor.fetchall()
+            if not rows:
+                break
+
+            updates = []
+            for mem_id, blob in rows:
+                vec = np.frombuffer(blob, dtype=np.float32)
+                norm = float(np.linalg.norm(vec))
+                unit = vec / norm if norm > 0 else vec
+                updates.append((unit.astype(np.float32).tobytes(), vec.shape[0], norm, 'float32', mem_id))
+
+            async with self._flush_lock:
+                await self._db.executemany(
+                    "UPDATE memories SET embedding = ?, dim = ?, norm = ?, dtype = ? WHERE id = ?", updates
+                )
+                await self._db.commit()
+            total += len(rows)
+            await asyncio.sleep(0)
+
+        if total:
+            logger.info(f"Migração de embeddings concluída: {total} memórias normalizadas.")
+
     async def close(self):
         if self._db:
-            await self._db.close()
+            if self._backfill_task is not None and not self._backfill_task.done():
+                self._backfill_task.cancel()
+                await asyncio.gather(self._backfill_task, return_exceptions=True)
+            await self.flush()
+            await self._pool.close()
+            self._db = None
             logger.info("Conexão com banco de dados fechada.")
 
+    async def _queue_write(self, query, params, dirty=None, on_commit=None):
+        """
+        Enfileira uma escrita no buffer write-behind. As escritas são agrupadas em
+        uma única transação a cada `flush_interval` segundos ou `max_pending_writes`
+        operações, trocando vários fsyncs por um único commit.
+        """
+        self._pending.append((query, params, on_commit))
+        if dirty is not None:
+            self._dirty.add(dirty)
+        if len(self._pending) >= self.max_pending_writes:
+            await self.flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.flush_interval)
+            self._flush_task = None
+            await self.flush()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Erro no flush em segundo plano: {e}")
+
+    async def flush(self):
+        """Grava todas as escritas pendentes em uma única transação."""
+        async with self._flush_lock:
+            task, self._flush_task = self._flush_task, None
+            if task is not None and task is not asyncio.current_task():
+                task.cancel()
+
+            batch, self._pending = self._pending, []
+            self._dirty.clear()
+            if not batch:
+                return
+
+            committed = []
+            try:
+                for query, params, on_commit in batch:
+                    cursor = await self._db.execute(query, params)
+                    if on_commit is not None:
+                        committed.append((on_commit, cursor.lastrowid))
+                await self._db.commit()
+            except Exception as e:
+                await self._db.rollback()
+                logger.warning(f"Lote de {len(batch)} escritas falhou ({e}); regravando uma a uma")
+                committed = await self._replay(batch)
+
+            for on_commit, rowid in committed:
+                on_commit(rowid)
+
+    async def _replay(self, batch):
+        """
+        Regrava um lote que falhou, uma escrita por transação: só a escrita inválida
+        é descartada (e registrada); as dos outros usuários não se perdem.
+        """
+        committed = []
+        for query, params, on_commit in batch:
+            try:
+                cursor = await self._db.execute(query, params)
+                await self._db.commit()
+            except Exception as e:
+                await self._db.rollback()
+                self.failed_writes += 1
+                logger.error(f"Escrita descartada: {e} | {' '.join(query.split())[:120]} | {params!r:.200}")
+                continue
+            if on_commit is not None:
+                committed.append((on_commit, cursor.lastrowid))
+        return committed
+
+    async def _read_your_writes(self, *keys):
+        """Garante que escritas pendentes que afetam a leitura já foram gravadas."""
+        if self._flush_lock.locked() or any(k in self._dirty for k in keys):
+            await self.flush()
+
     async def get_setting(self, key, default=None, return_blob=False):
-        async with self._db.execute("SELECT value, blob_value FROM settings WHERE key = ?", (key,)) as cursor:
+        async with self._pool.reader() as conn, conn.execute("SELECT value, blob_value FROM settings WHERE key = ?", (key,)) as cursor:
             row = await cursor.fetchone()
             if row:
                 return row[1] if return_blob else row[0]
             return default
 
     async def set_setting(self, key, value, blob_value=None):
-        await self._db.execute(
+        await self._queue_write(
             "INSERT OR REPLACE INTO settings (key, value, blob_value) VALUES (?, ?, ?)", 
             (key, str(value) if value is not None else None, blob_value)
         )
-        await self._db.commit()
+        await self.flush()
+
+    async def get_llm_response(self, key, ttl):
+        """Resposta em cache para `key` se tiver no máximo `ttl` segundos."""
+        await self._read_your_writes(('llm_cache', key))
+        async with self._pool.reader() as conn, conn.execute(
+            "SELECT response FROM llm_cache WHERE key = ? AND created_at >= ?", (key, time.time() - ttl)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row else None
+
+    async def set_llm_response(self, key, response, ttl, max_entries):
+        """Grava uma resposta e aplica os limites de idade (`ttl`) e tamanho (`max_entries`)."""
+        now = time.time()
+        await self._queue_write(
+            "INSERT OR REPLACE INTO llm_cache (key, response, created_at) VALUES (?, ?, ?)",
+            (key, response, now), dirty=('llm_cache', key)
+        )
+        await self._queue_write(
+            """DELETE FROM llm_cache WHERE created_at < ? OR key IN (
+                   SELECT key FROM llm_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)""",
+            (now - ttl, max_entries)
+        )
 
     async def update_user_interaction(self, user_id, username):
         now = datetime.now().isoformat()
-        await self._db.execute(f"""
+        await self._queue_write(f"""
             INSERT INTO users (user_id, username, last_seen, interactions)
             VALUES (?, ?, ?, 1)
             ON CONFLICT(user_id) DO UPDATE SET
                 username = excluded.username,
                 last_seen = excluded.last_seen,
                 interactions = interactions + 1
-        """, (str(user_id), username, now))
-        await self._db.commit()
+        """, (str(user_id), username, now), dirty=('users', str(user_id)))
 
     async def get_user(self, user_id):
-        async with self._db.execute("SELECT * FROM users WHERE user_id = ?", (str(user_id),)) as cursor:
+        await self._read_your_writes(('users', str(user_id)))
+        async with self._pool.reader() as conn, conn.execute("SELECT * FROM users WHERE user_id = ?", (str(user_id),)) as cursor:
             return await cursor.fetchone()
 
     async def update_affinity(self, user_id, change):
-        await self._db.execute("UPDATE users SET affinity = affinity + ? WHERE user_id = ?", (change, str(user_id)))
-        await self._db.commit()
+        await self._queue_write("UPDATE users SET affinity = affinity + ? WHERE user_id = ?", (change, str(user_id)), dirty=('users', str(user_id)))
 
     async def update_mood(self, user_id, mood):
         """Atualiza o estado emocional do usuario."""
-        await self._db.execute("UPDATE users SET mood = ? WHERE user_id = ?", (mood, str(user_id)))
-        await self._db.commit()
+        await self._queue_write("UPDATE users SET mood = ? WHERE user_id = ?", (mood, str(user_id)), dirty=('users', str(user_id)))
 
     async def add_summary(self, user_id, content):
         """Adiciona um resumo de conversa ao jornal de longo prazo."""
-        await self._db.execute("INSERT INTO summaries (user_id, content) VALUES (?, ?)", (str(user_id), content))
-        await self._db.commit()
+        await self._queue_write("INSERT INTO summaries (user_id, content) VALUES (?, ?)", (str(user_id), content), dirty=('summaries', str(user_id)))
 
     async def get_summaries(self, user_id, limit=3):
         """Recupera os ultimos resumos do jornal."""
-        async with self._db.execute(
+        await self._read_your_writes(('summaries', str(user_id)))
+        async with self._pool.reader() as conn, conn.execute(
             "SELECT content FROM summaries WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
             (str(user_id), limit)
         ) as cursor:
@@ -160,11 +416,11 @@ class DatabaseManager:
             return [r[0] for r in rows]
 
     async def add_history(self, user_id, role, content):
-        await self._db.execute("INSERT INTO conversation_history (user_id, role, content) VALUES (?, ?, ?)", (str(user_id), role, content))
-        await self._db.commit()
+        await self._queue_write("INSERT INTO conversation_history (user_id, role, content) VALUES (?, ?, ?)", (str(user_id), role, content), dirty=('history', str(user_id)))
 
     async def get_history(self, user_id, limit=20):
-        async with self._db.execute(
+        await self._read_your_writes(('history', str(user_id)))
+        async with self._pool.reader() as conn, conn.execute(
             "SELECT role, content FROM conversation_history WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?",
             (str(user_id), limit)
         ) as cursor:
@@ -172,35 +428,279 @@ class DatabaseManager:
             return [{"role": r[0], "content": r[1]} for r in reversed(rows)]
 
     async def add_memory(self, user_id, content, importance=1, embedding=None):
-        blob = embedding.tobytes() if embedding is not None else None
-        await self._db.execute("INSERT INTO memories (user_id, content, importance, embedding) VALUES (?, ?, ?, ?)", (str(user_id), content, importance, blob))
-        await self._db.commit()
+        # Grava o vetor já normalizado: a busca vira um produto escalar simples
+        blob, dim, norm, dtype, qblob, q_dtype = None, None, None, None, None, None
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32).ravel()
+            dim = embedding.shape[0]
+            norm = float(np.linalg.norm(embedding))
+            dtype = 'float32'
+            unit = embedding / norm if norm > 0 else embedding
+            blob = unit.tobytes()
+            if self.embedding_storage != 'float32':
+                qblob, q_dtype = encode_blob(unit, self.embedding_storage), self.embedding_storage
+        user_id = str(user_id)
+        # O índice residente é atualizado com o id real assim que o lote é gravado
+        await self._queue_write(
+            "INSERT INTO memories (user_id, content, importance, embedding, dim, norm, dtype, embedding_q, q_dtype) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (user_id, content, importance, blob, dim, norm, dtype, qblob, q_dtype),
+            dirty=('memories', user_id),
+            on_commit=lambda rowid: self._on_memory_committed(user_id, rowid, content, embedding)
+        )
+
+    def _on_memory_committed(self, user_id, rowid, content, embedding):
+        if user_id == GLOBAL_MEMORY_KEY:
+            self._global_stale = True
+        else:
+            self.vector_index.add(user_id, rowid, content, embedding)
+
+    async def _ensure_global(self, dim):
+        """
+        Garante que o índice global mapeado em memória corresponde às memórias
+        globais atuais. A assinatura só é consultada na primeira busca, quando uma
+        memória global é inserida por este processo ou quando a dimensão muda.
+        """
+        if not self._global_stale and self.global_index.dim in (dim, None):
+            return
+        async with self._global_lock:
+            if not self._global_stale and self.global_index.dim in (dim, None):
+                return
+            async with self._pool.reader() as conn, conn.execute(
+                """SELECT COUNT(*), COALESCE(MAX(id), 0) FROM memories
+                   WHERE user_id = ? AND embedding IS NOT NULL AND (dim = ? OR dim IS NULL)""",
+                (GLOBAL_MEMORY_KEY, dim)
+            ) as cursor:
+                count, max_id = await cursor.fetchone()
+            signature = (count, max_id, dim)
+
+            if self.global_index.signature is None:
+                self.global_index.open()
+            if self.global_index.signature != signature:
+                async with self._pool.reader() as conn, conn.execute(
+                    """SELECT id, content, embedding, norm FROM memories
+                       WHERE user_id = ? AND embedding IS NOT NULL AND (dim = ? OR dim IS NULL)
+                       ORDER BY id""",
+                    (GLOBAL_MEMORY_KEY, dim)
+                ) as cursor:
+                    rows = await cursor.fetchall()
+                await asyncio.to_thread(self.global_index.build, rows, dim, signature)
+                logger.info(f"Índice global reconstruído: {self.global_index.count} memórias.")
+            self._global_stale = False
+
+    async def _ensure_indexed(self, key, dim):
+        """
+        Carrega as memórias de `key` com dimensão `dim` no índice vetorial caso ainda
+        não estejam residentes. A construção (normalização e treino do IVF) roda fora
+        do event loop.
+        """
+        lock = self._index_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            if self.vector_index.dim(key) not in (dim, 0):
+                # Modelo de embeddings trocado: recarrega com a nova dimensão
+                self.vector_index.discard(key)
+            if key not in self.vector_index:
+                # Linhas de outra dimensão são filtradas pelo próprio SQLite; com cópia
+                # quantizada no modo atual, o blob float32 nem é lido
+                async with self._pool.reader() as conn, conn.execute(
+                    """SELECT id, content,
+                              CASE WHEN q_dtype = ? THEN NULL ELSE embedding END,
+                              norm,
+                              CASE WHEN q_dtype = ? THEN embedding_q END
+                       FROM memories
+                       WHERE user_id = ? AND embedding IS NOT NULL AND (dim = ? OR dim IS NULL)
+                       ORDER BY id""",
+                    (self.embedding_storage, self.embedding_storage, key, dim)
+                ) as cursor:
+                    rows = await cursor.fetchall()
+                entry = await asyncio.to_thread(self.vector_index.build_entry, key, rows, dim)
+                self.vector_index.insert(key, entry)
+                # Memórias gravadas durante a construção: o `add` do commit foi no-op
+                # porque a chave ainda não estava residente
+                await self._index_catch_up(key, dim, max((r[0] for r in rows), default=0))
+            elif self.vector_index.needs_ann(key):
+                prepared = await asyncio.to_thread(self.vector_index.prepare_ann, key)
+                self.vector_index.attach_ann(key, *prepared)
+
+    async def _index_catch_up(self, key, dim, after_id):
+        """Acrescenta à entrada residente de `key` as memórias com id maior que `after_id`."""
+        async with self._pool.reader() as conn, conn.execute(
+            """SELECT id, content, embedding FROM memories
+               WHERE user_id = ? AND id > ? AND embedding IS NOT NULL AND (dim = ? OR dim IS NULL)
+               ORDER BY id""",
+            (key, after_id, dim)
+        ) as cursor:
+            rows = await cursor.fetchall()
+        if not rows or key not in self.vector_index:
+            return
+        # Commits feitos durante esta leitura já entraram pelo `add`
+        present = set(self.vector_index.ids(key))
+        for mem_id, content, blob in rows:
+            if mem_id not in present:
+                self.vector_index.add(key, mem_id, content, np.frombuffer(blob, dtype=np.float32))
+
+    @staticmethod
+    def _fts_query(text):
+        """Converte texto livre em uma consulta FTS5 segura (termos entre aspas unidos por OR)."""
+        terms = [t for t in re.findall(r"\w+", text.lower()) if len(t) > 1 and t not in FTS_STOPWORDS]
+        # Prefixo nos termos maiores cobre plurais e flexões simples
+        return " OR ".join(f'"{t}"*' if len(t) >= 4 else f'"{t}"' for t in dict.fromkeys(terms))
+
+    async def _lexical_candidates(self, keys, query_text, limit=200):
+        """Ids das memórias de `keys` que casam com `query_text`, ordenados por BM25."""
+        match = self._fts_query(query_text)
+        if not match:
+            return []
+        placeholders = ",".join("?" * len(keys))
+        try:
+            async with self._pool.reader() as conn, conn.execute(
+                f"""SELECT m.id FROM memories_fts f JOIN memories m ON m.id = f.rowid
+                    WHERE memories_fts MATCH ? AND m.user_id IN ({placeholders})
+                    ORDER BY bm25(memories_fts) LIMIT ?""",
+                (match, *keys, limit)
+            ) as cursor:
+                return [r[0] for r in await cursor.fetchall()]
+        except aiosqlite.OperationalError as e:
+            logger.debug(f"Consulta FTS falhou ({match}): {e}")
+            return []
+
+    async def get_semantic_memories(self, user_id, query_embedding, limit=3, threshold=0.7, query_text=None, lexical_threshold=0.3, rrf_k=60):
+        """
+        Busca memórias do usuário e globais no índice vetorial residente.
+        Retorna tuplas (content, score, memory_id); `score` é a similaridade de cosseno.
+
+        Com `query_text` a busca é híbrida: os candidatos do FTS5 (BM25) e os do
+        vetor são combinados por Reciprocal Rank Fusion. Acertos lexicais só
+        precisam de `lexical_threshold` de similaridade, o que recupera nomes e
+        termos curtos que o cosseno sozinho deixa abaixo de `threshold`. Em stores
+        com pelo menos `fts_prefilter_min` memórias, os candidatos lexicais
+        substituem a varredura vetorial completa.
 
-    async def get_semantic_memories(self, user_id, query_embedding, limit=3, threshold=0.7):
-        """Busca memórias otimizada usando vetorização Numpy."""
-        async with self._db.execute(
-            "SELECT content, embedding FROM memories WHERE user_id = ? OR user_id = 'global_legacy'",
-            (str(user_id),)
+        O ranking final pondera a `importance` de cada memória (ver
+        `importance_weight`); o score retornado continua sendo o cosseno.
+        """
+        query = normalize(query_embedding)
+        if query is None:
+            return []
+
+        keys = list(dict.fromkeys((str(user_id), GLOBAL_MEMORY_KEY)))
+        await self._read_your_writes(*(('memories', k) for k in keys))
+
+        lexical = []
+        if query_text and self.fts_enabled:
+            lexical = await self._lexical_candidates(keys, query_text)
+
+        quantized = self.embedding_storage != 'float32'
+        # Nos modos quantizados busca mais candidatos, com folga no threshold, e re-pontua em float32
+        candidates = max(limit * self.rescore_factor, 16) if quantized or lexical or self.importance_weight else limit
+        floor = min(threshold, lexical_threshold) if lexical else threshold
+        if quantized:
+            floor -= 0.05
+
+        user_key = str(user_id)
+        results = {}
+        if user_key != GLOBAL_MEMORY_KEY:
+            await self._ensure_indexed(user_key, query.shape[0])
+            if len(lexical) >= limit and self.vector_index.size(user_key) >= self.fts_prefilter_min:
+                found = self.vector_index.score_ids(user_key, query, lexical)
+            else:
+                found = self.vector_index.search(user_key, query, limit=candidates, threshold=floor)
+                if lexical:
+                    found += self.vector_index.score_ids(user_key, query, lexical)
+            for mem_id, content, score in found:
+                results[mem_id] = (mem_id, content, score)
+            if quantized and results:
+                results = {r[0]: r for r in await self._rescore(list(results.values()), query, floor + 0.05)}
+
+        # Memórias globais: um produto matriz-vetor extra sobre o .npy mapeado (scores já exatos)
+        await self._ensure_global(query.shape[0])
+        found = self.global_index.search(query, limit=candidates, threshold=min(threshold, lexical_threshold) if lexical else threshold)
+        if lexical:
+            found += self.global_index.score_ids(query, lexical)
+        for mem_id, content, score in found:
+            results[mem_id] = (mem_id, content, score)
+        results = list(results.values())
+
+        weights = await self._importance_weights([r[0] for r in results])
+        if not lexical:
+            if not results:
+                return []
+            top, _ = select_top_k(
+                np.array([r[2] for r in results], dtype=np.float32), limit, threshold,
+                weights=[weights.get(r[0], 1.0) for r in results] if weights else None
+            )
+            return [(results[i][1], results[i][2], results[i][0]) for i in top]
+
+        lexical_rank = {mem_id: rank for rank, mem_id in enumerate(lexical)}
+        results = [r for r in results if r[2] >= threshold or (r[0] in lexical_rank and r[2] >= lexical_threshold)]
+        results.sort(key=lambda r: r[2], reverse=True)
+        fused = {}
+        for rank, (mem_id, _, _) in enumerate(results):
+            fused[mem_id] = 1.0 / (rrf_k + rank + 1)
+            if mem_id in lexical_rank:
+                fused[mem_id] += 1.0 / (rrf_k + lexical_rank[mem_id] + 1)
+            fused[mem_id] *= weights.get(mem_id, 1.0)
+        results.sort(key=lambda r: fused[r[0]], reverse=True)
+        return [(content, score, mem_id) for mem_id, content, score in results[:limit]]
+
+    async def memory_centroids(self, user_id, dim):
+        """
+        Centroides (soma, quantidade) das memórias do usuário e das globais com
+        dimensão `dim`, lidos do índice residente (carregado se preciso). Usado pelo
+        pré-filtro de recuperação; stores vazios não entram.
+        """
+        keys = list(dict.fromkeys((str(user_id), GLOBAL_MEMORY_KEY)))
+        await self._read_your_writes(*(('memories', k) for k in keys))
+        centroids = []
+        if str(user_id) != GLOBAL_MEMORY_KEY:
+            await self._ensure_indexed(str(user_id), dim)
+            centroids.append(self.vector_index.centroid(str(user_id)))
+        await self._ensure_global(dim)
+        centroids.append(self.global_index.centroid())
+        return [c for c in centroids if c is not None and c[1] and c[0].shape[0] == dim]
+
+    async def _importance_weights(self, mem_ids):
+        """Peso de ranking de cada memória a partir da coluna importance (vazio se desligado)."""
+        if not self.importance_weight or not mem_ids:
+            return {}
+        placeholders = ",".join("?" * len(mem_ids))
+        async with self._pool.reader() as conn, conn.execute(
+            f"SELECT id, importance FROM memories WHERE id IN ({placeholders})", tuple(mem_ids)
         ) as cursor:
             rows = await cursor.fetchall()
-        
-        if not rows: return []
-
-        contents = [r[0] for r in rows if r[1] is not None]
-        embeddings = [np.frombuffer(r[1], dtype=np.float32) for r in rows if r[1] is not None]
-        
-        if not embeddings: return []
-
-        matrix = np.vstack(embeddings)
-        norm_matrix = np.linalg.norm(matrix, axis=1)
-        norm_query = np.linalg.norm(query_embedding)
-        
-        scores = np.dot(matrix, query_embedding) / (norm_matrix * norm_query + 1e-9)
-        
-        results = [(contents[i], float(scores[i])) for i in range(len(scores)) if scores[i] >= threshold]
-        results.sort(key=lambda x: x[1], reverse=True)
-        return results[:limit]
+        return {mem_id: max(0.0, 1.0 + self.importance_weight * ((importance or 1) - 1)) for mem_id, importance in rows}
+
+    async def _rescore(self, candidates, query, threshold):
+        """Recalcula o score dos candidatos com os embeddings float32 exatos."""
+        contents = {mem_id: content for mem_id, content, _ in candidates}
+        placeholders = ",".join("?" * len(contents))
+        async with self._pool.reader() as conn, conn.execute(
+            f"SELECT id, embedding FROM memories WHERE id IN ({placeholders})", tuple(contents)
+        ) as cursor:
+            rows = await cursor.fetchall()
+
+        rows = [(mem_id, blob) for mem_id, blob in rows if len(blob) == query.nbytes]
+        if not rows:
+            return []
+        matrix = np.vstack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows])
+        top, scores = top_k_similarity(query, matrix, len(rows), threshold, normalized=False)[0]
+        return [(rows[i][0], contents[rows[i][0]], float(s)) for i, s in zip(top, scores)]
+
+    async def save_active_profile(self, identity_json, personality_json, history_json, emotions_json, social_json, interaction_json, technical_json):
+        """Grava um novo perfil como o único ativo, pelo buffer de escrita (mesmo commit que as demais escritas)."""
+        await self._queue_write("UPDATE character_profiles SET is_active = 0", ())
+        await self._queue_write("""
+            INSERT INTO character_profiles
+            (identity_json, personality_json, history_json, emotions_json, social_json, interaction_json, technical_json, is_active)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+        """, (identity_json, personality_json, history_json, emotions_json, social_json, interaction_json, technical_json))
+        await self.flush()
+
+    async def get_active_profile(self):
+        """Retorna (identity_json, personality_json) do perfil ativo, ou None."""
+        async with self._pool.reader() as conn, conn.execute(
+            "SELECT identity_json, personality_json FROM character_profiles WHERE is_active = 1"
+        ) as cursor:
+            return await cursor.fetchone()
 
     async def clear_history(self, user_id):
-        await self._db.execute("DELETE FROM conversation_history WHERE user_id = ?", (str(user_id),))
-        await self._db.commit()
+        await self._queue_write("DELETE FROM conversation_history WHERE user_id = ?", (str(user_id),), dirty=('history', str(user_id)))
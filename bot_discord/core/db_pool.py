@@ -0,0 +1,89 @@
+# db_pool.py
+# Conexões SQLite: um escritor dedicado e um pool de leitores em modo WAL
+
+import aiosqlite
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from urllib.request import pathname2url
+
+logger = logging.getLogger(__name__)
+
+# Aplicados a todas as conexões
+DEFAULT_PRAGMAS = {
+    "synchronous": "NORMAL",    # Seguro em WAL: perde no máximo o último commit em queda de energia
+    "cache_size": -16000,       # ~16 MB de page cache por conexão
+    "mmap_size": 268435456,     # 256 MB de leitura via mmap
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+
+class ConnectionPool:
+    """
+    Gerencia uma conexão de escrita e `readers` conexões somente leitura.
+
+    Com `journal_mode=WAL` os leitores não bloqueiam o escritor (nem o contrário),
+    e cada conexão aiosqlite roda em sua própria thread, então leituras de vários
+    usuários deixam de enfileirar atrás das escritas.
+    """
+
+    def __init__(self, db_path, readers=3, pragmas=None):
+        self.db_path = db_path
+        self.reader_count = readers
+        self.pragmas = dict(DEFAULT_PRAGMAS, **(pragmas or {}))
+        self.writer = None
+        self.journal_mode = None
+        self._readers = []
+        self._idle = None
+
+    @property
+    def in_memory(self):
+        return self.db_path == ":memory:"
+
+    async def open(self):
+        self.writer = await aiosqlite.connect(self.db_path)
+        self.writer.row_factory = aiosqlite.Row
+        if not self.in_memory:
+            async with self.writer.execute("PRAGMA journal_mode=WAL") as cursor:
+                self.journal_mode = (await cursor.fetchone())[0]
+        await self._apply_pragmas(self.writer)
+
+    async def open_readers(self):
+        """Abre os leitores. Deve ser chamado depois que o schema existir no disco."""
+        self._idle = asyncio.Queue()
+        if self.in_memory or self.journal_mode != "wal":
+            # Sem WAL os leitores disputariam o lock com o escritor; usa só o escritor
+            return
+        uri = f"file:{pathname2url(self.db_path)}?mode=ro"
+        for _ in range(self.reader_count):
+            conn = await aiosqlite.connect(uri, uri=True)
+            conn.row_factory = aiosqlite.Row
+            await self._apply_pragmas(conn)
+            await conn.execute("PRAGMA query_only=ON")
+            self._readers.append(conn)
+            self._idle.put_nowait(conn)
+
+    async def _apply_pragmas(self, conn):
+        for name, value in self.pragmas.items():
+            await conn.execute(f"PRAGMA {name}={value}")
+
+    @asynccontextmanager
+    async def reader(self):
+        """Empresta uma conexão de leitura (ou o escritor, se não houver leitores)."""
+        if not self._readers:
+            yield self.writer
+            return
+        conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def close(self):
+        for conn in self._readers:
+            await conn.close()
+        self._readers = []
+        if self.writer is not None:
+            await self.writer.close()
+            self.writer = None
@@ -0,0 +1,68 @@
+# debouncer.py
+# Agrupa mensagens seguidas da mesma chave (usuário, canal) numa só
+
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class MessageDebouncer:
+    """
+    Segura as mensagens de cada chave até passar `window` segundos sem nenhuma
+    nova (ou `max_delay` desde a primeira, para quem não para de digitar) e
+    entrega o lote inteiro de uma vez para `on_flush(key, items)`.
+    """
+
+    def __init__(self, on_flush, window=1.0, max_delay=None):
+        self.on_flush = on_flush
+        self.window = window
+        self.max_delay = max_delay if max_delay is not None else window * 4
+        self._pending = {}  # key -> [itens, primeira_chegada, timer]
+        self.metrics = {"received": 0, "batches": 0, "merged": 0}
+
+    def add(self, key, item, earlier=()):
+        """Acrescenta `item` ao lote da chave; `earlier` entra antes (ex.: mensagens de uma geração cancelada)."""
+        self.metrics["received"] += 1
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = self._pending[key] = [[], time.monotonic(), None]
+        entry[0][:0] = list(earlier)
+        entry[0].append(item)
+        if entry[2] is not None:
+            entry[2].cancel()
+        delay = min(self.window, entry[1] + self.max_delay - time.monotonic())
+        entry[2] = asyncio.create_task(self._flush_later(key, max(0.0, delay)))
+
+    async def _flush_later(self, key, delay):
+        await asyncio.sleep(delay)
+        items = self._pending.pop(key)[0]
+        self.metrics["batches"] += 1
+        self.metrics["merged"] += len(items) - 1
+        try:
+            await self.on_flush(key, items)
+        except Exception as e:
+            logger.error(f"Erro ao entregar lote de mensagens {key}: {e}", exc_info=True)
+
+    def discard(self, predicate):
+        """Tira dos lotes pendentes os itens que `predicate` aceita; lotes vazios são cancelados."""
+        removed = 0
+        for key in list(self._pending):
+            entry = self._pending[key]
+            kept = [item for item in entry[0] if not predicate(item)]
+            removed += len(entry[0]) - len(kept)
+            entry[0] = kept
+            if not kept:
+                del self._pending[key]
+                if entry[2] is not None:
+                    entry[2].cancel()
+        return removed
+
+    async def close(self):
+        """Descarta lotes pendentes (usado no desligamento)."""
+        timers = [entry[2] for entry in self._pending.values() if entry[2] is not None]
+        self._pending.clear()
+        for timer in timers:
+            timer.cancel()
+        await asyncio.gather(*timers, return_exceptions=True)
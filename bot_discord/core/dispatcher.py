@@ -0,0 +1,161 @@
+# dispatcher.py
+# Filas FIFO por usuário atendidas por um pool fixo de workers de geração
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+
+from core.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class MessageDispatcher:
+    """
+    Desacopla o evento do Discord da geração. Cada usuário tem uma fila FIFO
+    e no máximo uma mensagem sendo atendida (o histórico dele não sofre
+    corrida); `workers` tarefas fixas atendem os usuários em round-robin.
+
+    Backpressure: `submit` recusa quando a fila do usuário ou o total de
+    mensagens pendentes passa do limite, e quem chamou responde "sobrecarregado".
+    """
+
+    def __init__(self, handler, workers=1, max_per_user=3, max_pending=50):
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.max_per_user = max_per_user
+        self.max_pending = max_pending
+        self._queues = OrderedDict()  # user_id -> deque[(item, enfileirado_em)]
+        self._ready = None  # usuários com trabalho e sem ninguém atendendo
+        self._active = {}  # user_id -> (item, tarefa do handler) em atendimento
+        self._tasks = []
+        self.metrics = {
+            "submitted": 0,
+            "rejected": 0,
+            "processed": 0,
+            "errors": 0,
+            "superseded": 0,
+            "dropped": 0,
+            "wait_ms": Histogram((10, 50, 100, 500, 1000, 5000, 15000, 60000)),
+            "max_depth": 0,
+        }
+
+    @property
+    def queue_depth(self):
+        return sum(len(q) for q in self._queues.values())
+
+    def snapshot(self):
+        return {
+            "workers": self.workers,
+            "busy": len(self._active),
+            "queued": self.queue_depth,
+            "users_waiting": sum(1 for user, q in self._queues.items() if q and user not in self._active),
+            "wait_ms": self.metrics["wait_ms"].snapshot(),
+        }
+
+    def start(self):
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        for user_id, queue in self._queues.items():
+            if queue and user_id not in self._active:
+                self._ready.put_nowait(user_id)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, user_id, item):
+        """Enfileira `item` para o usuário. Retorna False se recusado por excesso de carga."""
+        queue = self._queues.get(user_id)
+        if self.queue_depth >= self.max_pending or (queue is not None and len(queue) >= self.max_per_user):
+            self.metrics["rejected"] += 1
+            logger.warning(f"Fila cheia: mensagem de {user_id} recusada ({self.queue_depth} pendentes)")
+            return False
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+        queue.append((item, time.perf_counter()))
+        self.metrics["submitted"] += 1
+        self.metrics["max_depth"] = max(self.metrics["max_depth"], self.queue_depth)
+        # Usuário em atendimento volta à fila de prontos quando o worker terminar
+        if len(queue) == 1 and user_id not in self._active and self._ready is not None:
+            self._ready.put_nowait(user_id)
+        return True
+
+    def supersede(self, user_id, predicate):
+        """
+        Retira do usuário o trabalho que `predicate(item)` aceita: cancela o item
+        em atendimento e remove os da fila. Retorna os itens na ordem original.
+        """
+        taken = []
+        active = self._active.get(user_id)
+        if active is not None and not active[1].done() and predicate(active[0]):
+            active[1].cancel()
+            taken.append(active[0])
+        queue = self._queues.get(user_id)
+        if queue:
+            kept = deque(entry for entry in queue if not predicate(entry[0]))
+            taken.extend(item for item, _ in queue if predicate(item))
+            queue.clear()
+            queue.extend(kept)
+            if not queue and user_id not in self._active:
+                del self._queues[user_id]
+        return taken
+
+    def rewrite_queued(self, rewrite):
+        """
+        Reescreve os itens ainda na fila: `rewrite(item)` devolve o item (talvez
+        alterado) ou None para descartá-lo. Itens em atendimento não mudam.
+        """
+        dropped = 0
+        for user_id in list(self._queues):
+            queue = self._queues[user_id]
+            kept = deque()
+            for item, enqueued_at in queue:
+                item = rewrite(item)
+                if item is None:
+                    dropped += 1
+                else:
+                    kept.append((item, enqueued_at))
+            queue.clear()
+            queue.extend(kept)
+            if not queue and user_id not in self._active:
+                del self._queues[user_id]
+        self.metrics["dropped"] += dropped
+        return dropped
+
+    async def _worker(self, index):
+        while True:
+            user_id = await self._ready.get()
+            queue = self._queues.get(user_id)
+            # Entrada obsoleta (fila esvaziada por `supersede`) ou usuário já em atendimento
+            if not queue or user_id in self._active:
+                continue
+            item, enqueued_at = queue.popleft()
+            self.metrics["wait_ms"].observe((time.perf_counter() - enqueued_at) * 1000)
+            # O handler roda numa tarefa própria para poder ser cancelado por `supersede`
+            task = asyncio.create_task(self.handler(item))
+            self._active[user_id] = (item, task)
+            try:
+                await asyncio.wait({task})
+                if task.cancelled():
+                    self.metrics["superseded"] += 1
+                elif task.exception() is not None:
+                    self.metrics["errors"] += 1
+                    logger.error(f"Erro no worker de geração {index}: {task.exception()}", exc_info=task.exception())
+                else:
+                    self.metrics["processed"] += 1
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            finally:
+                self._active.pop(user_id, None)
+                if queue:
+                    # Round-robin: o usuário vai para o fim dos prontos
+                    self._ready.put_nowait(user_id)
+                else:
+                    self._queues.pop(user_id, None)
@@ -0,0 +1,142 @@
+# embedding_cache.py
+# Cache de embeddings em dois níveis: LRU em memória + SQLite em disco
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Cache de vetores indexado por (modelo, hash do texto normalizado).
+
+    O primeiro nível é um LRU em memória com até `max_items` vetores, consultado
+    direto no event loop. O segundo é uma tabela SQLite em `path` (opcional) com
+    até `max_disk_rows` linhas; ao passar do limite as linhas usadas há mais
+    tempo são removidas. O acesso ao disco acontece na thread de embeddings.
+    """
+
+    def __init__(self, path=None, max_items=4096, max_disk_rows=200000):
+        self.path = path
+        self.max_items = max_items
+        self.max_disk_rows = max_disk_rows
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disk_rows = 0
+        self.metrics = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def key(model_name, text):
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        return f"{model_name}:{hashlib.sha1(normalized.encode('utf-8')).hexdigest()}"
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embedding_cache_used ON embedding_cache(last_used)")
+            self._disk_rows = self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        return self._conn
+
+    def get(self, key):
+        """Consulta só o LRU em memória (microssegundos). Retorna None se ausente."""
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.metrics["memory_hits"] += 1
+            return vector
+
+    def _remember(self, key, vector):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_items:
+            self._lru.popitem(last=False)
+            self.metrics["evictions"] += 1
+
+    def load(self, keys):
+        """Busca `keys` no LRU e depois no disco. Retorna {key: vetor} dos encontrados."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    found[key] = self._lru[key]
+                    self.metrics["memory_hits"] += 1
+            missing = [k for k in dict.fromkeys(keys) if k not in found]
+            if missing and self.path:
+                conn = self._connect()
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = conn.execute(
+                        f"SELECT key, vector FROM embedding_cache WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = vector
+                        self._remember(key, vector)
+                        self.metrics["disk_hits"] += 1
+                if found:
+                    hits = [(time.time(), k) for k in missing if k in found]
+                    conn.executemany("UPDATE embedding_cache SET last_used = ? WHERE key = ?", hits)
+                    conn.commit()
+            self.metrics["misses"] += sum(1 for k in missing if k not in found)
+        return found
+
+    def store(self, items):
+        """Grava pares (key, vetor) nos dois níveis."""
+        items = [(k, np.array(v, dtype=np.float32)) for k, v in items]
+        for _, vector in items:
+            # Vetores são compartilhados entre chamadores: somente leitura
+            vector.setflags(write=False)
+        if not items:
+            return
+        with self._lock:
+            for key, vector in items:
+                self._remember(key, vector)
+            if not self.path:
+                return
+            conn = self._connect()
+            now = time.time()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (key, vector, last_used) VALUES (?, ?, ?)",
+                [(k, v.tobytes(), now) for k, v in items]
+            )
+            # Contagem aproximada (substituições contam como novas); só recontamos ao passar do limite
+            self._disk_rows += len(items)
+            if self._disk_rows > self.max_disk_rows:
+                self._disk_rows = conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+                excess = self._disk_rows - self.max_disk_rows
+                if excess > 0:
+                    conn.execute(
+                        "DELETE FROM embedding_cache WHERE key IN (SELECT key FROM embedding_cache ORDER BY last_used LIMIT ?)",
+                        (excess,)
+                    )
+                    self._disk_rows -= excess
+                    self.metrics["evictions"] += excess
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -1,20 +1,45 @@
 # embeddings.py
+import asyncio
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+from core.embedding_cache import EmbeddingCache
+from core.metrics import Histogram
+from core.similarity import top_k_similarity
 
 logger = logging.getLogger(__name__)
 
 class EmbeddingManager:
-    def __init__(self, model_name='all-MiniLM-L6-v2'):
+    def __init__(self, model_name='all-MiniLM-L6-v2', batch_size=32, max_wait_ms=5.0, max_queue=256, cache=None):
         self.model_name = model_name
         self._model = None
+        # Sem `cache` explícito usa só o LRU em memória (sem arquivo em disco)
+        self.cache = cache if cache is not None else EmbeddingCache()
+        # Carga do modelo e encode rodam numa thread dedicada, nunca no event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embeddings")
+        # Micro-batching: pedidos concorrentes esperam até `max_wait_ms` e viram um único encode
+        self.batch_size = batch_size
+        self.max_wait_ms = max_wait_ms
+        # Fila limitada: acima de `max_queue` pedidos o chamador espera (backpressure)
+        self.max_queue = max_queue
+        self._queue = None
+        self._worker = None
+        self._loop = None
+        self.metrics = {
+            "batch_size": Histogram((1, 2, 4, 8, 16, 32, 64, 128)),
+            "queue_wait_ms": Histogram((0.5, 1, 2, 5, 10, 20, 50, 100, 250, 1000)),
+            "cancelled": 0,
+        }
 
     @property
     def model(self):
         if self._model is None:
             try:
                 logger.info(f"Carregando modelo de embeddings (Lazy): {self.model_name}")
+                # Import tardio: sentence_transformers/torch só carregam junto com o modelo
+                from sentence_transformers import SentenceTransformer
                 self._model = SentenceTransformer(self.model_name)
             except Exception as e:
                 logger.error(f"Erro ao carregar modelo de embeddings: {e}")
@@ -26,6 +51,108 @@ class EmbeddingManager:
             return None
         return self.model.encode(text)
 
+    def get_embeddings(self, texts):
+        """
+        Gera os vetores de vários textos (matriz N x D). Textos já vistos vêm do
+        cache; os demais (sem repetição) vão para um único encode.
+        """
+        keys = [EmbeddingCache.key(self.model_name, t) for t in texts]
+        found = self.cache.load(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            if not self.model:
+                return None
+            vectors = np.asarray(self.model.encode(list(missing.values())), dtype=np.float32)
+            new = list(zip(missing.keys(), vectors))
+            self.cache.store(new)
+            found.update(new)
+        return np.vstack([found[k] for k in keys]) if keys else None
+
+    async def load(self):
+        """Carrega o modelo na thread de embeddings (aquecimento sem bloquear o loop)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: self.model) is not None
+
+    async def aget_embedding(self, text):
+        """
+        Versão assíncrona de `get_embedding`. Pedidos feitos ao mesmo tempo são
+        agrupados pelo batcher e resolvidos por um único `encode`.
+
+        Se o chamador for cancelado (mensagem abandonada), o pedido sai do lote
+        antes do encode; se o encode já começou, o resultado é descartado.
+        """
+        cached = self.cache.get(EmbeddingCache.key(self.model_name, text))
+        if cached is not None:
+            return cached
+
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._worker = loop.create_task(self._run_batcher())
+        future = loop.create_future()
+        await self._queue.put((text, future, time.perf_counter()))
+        return await future
+
+    async def aget_embeddings(self, texts):
+        return list(await asyncio.gather(*(self.aget_embedding(t) for t in texts)))
+
+    async def _run_batcher(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait_ms / 1000
+            while len(batch) < self.batch_size:
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                remaining = deadline - time.perf_counter()
+                if len(batch) >= self.batch_size or remaining <= 0:
+                    break
+                await asyncio.sleep(remaining)
+
+            now = time.perf_counter()
+            pending = [item for item in batch if not item[1].done()]
+            self.metrics["cancelled"] += len(batch) - len(pending)
+            batch = pending
+            if not batch:
+                continue
+            self.metrics["batch_size"].observe(len(batch))
+            for _, _, queued_at in batch:
+                self.metrics["queue_wait_ms"].observe((now - queued_at) * 1000)
+
+            try:
+                vectors = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self.get_embeddings, [item[0] for item in batch]
+                )
+            except Exception as e:
+                logger.error(f"Erro no lote de embeddings: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for i, (_, future, _) in enumerate(batch):
+                if not future.done():
+                    future.set_result(None if vectors is None else vectors[i])
+
+    async def close(self):
+        """Encerra o batcher, cancela pedidos pendentes e libera a thread de embeddings."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        while self._queue is not None and not self._queue.empty():
+            self._queue.get_nowait()[1].cancel()
+        self._executor.shutdown(wait=False)
+        self.cache.close()
+
+    # Top-k vetorizado (lote Q x D contra matriz N x D); ver core.similarity
+    top_k_similarity = staticmethod(top_k_similarity)
+
     @staticmethod
     def cosine_similarity(v1, v2):
         """Calcula a similaridade de cosseno entre dois vetores."""
@@ -0,0 +1,152 @@
+# global_index.py
+# Índice somente leitura, mapeado em memória, das memórias globais (global_legacy)
+
+import json
+import logging
+import os
+
+import numpy as np
+
+from core.similarity import select_top_k
+from core.vector_index import normalize
+
+logger = logging.getLogger(__name__)
+
+
+class GlobalMemoryIndex:
+    """
+    As memórias globais são compartilhadas por todos os usuários, então são
+    compiladas uma única vez em arquivos no diretório de dados:
+
+        global_memories.npy          matriz float32 N x D de vetores unitários
+        global_memories.ids.npy      ids das linhas na tabela memories
+        global_memories.offsets.npy  offsets (N + 1) de cada conteúdo no .txt
+        global_memories.txt          conteúdos UTF-8 concatenados
+        global_memories.json         assinatura (count, max_id, dim) do build
+
+    Os arquivos são abertos com `mmap_mode='r'`: nada é copiado para o heap e o
+    page cache do SO é compartilhado entre processos. A consulta é um único
+    produto matriz-vetor. O build só é refeito quando a assinatura muda.
+    """
+
+    BASENAME = "global_memories"
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.signature = None
+        self.matrix = None
+        self.ids = None
+        self._offsets = None
+        self._text = None
+        self._total = None
+        self.metrics = {"builds": 0, "searches": 0}
+
+    def _path(self, suffix):
+        return os.path.join(self.directory, f"{self.BASENAME}{suffix}")
+
+    @property
+    def count(self):
+        return 0 if self.ids is None else len(self.ids)
+
+    @property
+    def dim(self):
+        return None if self.matrix is None else self.matrix.shape[1]
+
+    def open(self):
+        """Abre um build existente em disco. Retorna False se não houver build válido."""
+        if not self.directory or not os.path.exists(self._path(".json")):
+            return False
+        try:
+            with open(self._path(".json"), encoding="utf-8") as f:
+                signature = tuple(json.load(f)["signature"])
+            self._attach(
+                np.load(self._path(".npy"), mmap_mode="r"),
+                np.load(self._path(".ids.npy"), mmap_mode="r"),
+                np.load(self._path(".offsets.npy"), mmap_mode="r"),
+                np.memmap(self._path(".txt"), dtype=np.uint8, mode="r") if os.path.getsize(self._path(".txt")) else np.empty(0, dtype=np.uint8),
+                signature,
+            )
+            return True
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Índice global inválido, será reconstruído: {e}")
+            return False
+
+    def build(self, rows, dim, signature):
+        """
+        Compila linhas (id, content, embedding_blob, norm) ordenadas por id.
+        Pode rodar fora do event loop; o índice só troca de arquivos no final.
+        """
+        vectors, ids, encoded = [], [], []
+        for mem_id, content, blob, norm in rows:
+            vec = np.frombuffer(blob, dtype=np.float32)
+            if vec.shape[0] != dim:
+                continue
+            vec = normalize(vec) if norm is None else (None if norm == 0.0 else vec)
+            if vec is None:
+                continue
+            vectors.append(vec)
+            ids.append(mem_id)
+            encoded.append(content.encode("utf-8"))
+
+        matrix = np.vstack(vectors).astype(np.float32) if vectors else np.empty((0, dim), dtype=np.float32)
+        id_array = np.asarray(ids, dtype=np.int64)
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+        text = b"".join(encoded)
+        self.metrics["builds"] += 1
+
+        if not self.directory:
+            self._attach(matrix, id_array, offsets, np.frombuffer(text, dtype=np.uint8), signature)
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        # Solta os mmaps atuais: no Windows arquivos mapeados não podem ser substituídos
+        self._attach(None, None, None, None, None)
+        # Escreve em arquivos temporários e troca com os.replace (leitores nunca veem build parcial)
+        for suffix, array in ((".npy", matrix), (".ids.npy", id_array), (".offsets.npy", offsets)):
+            tmp = self._path(f".tmp{suffix}")
+            np.save(tmp, array)
+            os.replace(tmp, self._path(suffix))
+        with open(self._path(".tmp.txt"), "wb") as f:
+            f.write(text)
+        os.replace(self._path(".tmp.txt"), self._path(".txt"))
+        with open(self._path(".tmp.json"), "w", encoding="utf-8") as f:
+            json.dump({"signature": list(signature)}, f)
+        os.replace(self._path(".tmp.json"), self._path(".json"))
+        self.open()
+
+    def _attach(self, matrix, ids, offsets, text, signature):
+        self.matrix, self.ids, self._offsets, self._text = matrix, ids, offsets, text
+        self.signature = signature
+        self._total = None
+
+    def centroid(self):
+        """(soma dos vetores, quantidade) das memórias globais; calculada uma vez por build."""
+        if not self.count:
+            return None
+        if self._total is None:
+            self._total = np.asarray(self.matrix, dtype=np.float32).sum(axis=0)
+        return self._total, self.count
+
+    def content(self, row):
+        return bytes(self._text[self._offsets[row]:self._offsets[row + 1]]).decode("utf-8")
+
+    def search(self, unit_query, limit=3, threshold=0.7):
+        """Retorna até `limit` tuplas (id, content, score) com score >= threshold."""
+        if not self.count or unit_query.shape[0] != self.dim or limit <= 0:
+            return []
+        self.metrics["searches"] += 1
+        top, scores = select_top_k(self.matrix @ unit_query, limit, threshold)
+        return [(int(self.ids[i]), self.content(i), float(s)) for i, s in zip(top, scores)]
+
+    def score_ids(self, unit_query, mem_ids):
+        """Scores de memórias globais específicas (ids ordenados permitem busca binária)."""
+        if not self.count or unit_query.shape[0] != self.dim:
+            return []
+        wanted = np.asarray(mem_ids, dtype=np.int64)
+        rows = np.searchsorted(self.ids, wanted)
+        rows = rows[(rows < self.count) & (self.ids[np.minimum(rows, self.count - 1)] == wanted)]
+        if rows.size == 0:
+            return []
+        scores = self.matrix[rows] @ unit_query
+        return [(int(self.ids[r]), self.content(r), float(s)) for r, s in zip(rows, scores)]
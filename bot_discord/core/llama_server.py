@@ -7,6 +7,8 @@ import os
 import shlex
 import sys
 
+from core.config import Config
+
 logger = logging.getLogger(__name__)
 
 class LlamaServerManager:
@@ -18,6 +20,7 @@ class LlamaServerManager:
         self.host = config.get_config_value("llama_server_host", "127.0.0.1")
         self.port = config.get_config_value("llama_server_port", 8080)
         self.flags = config.get_config_value("llama_server_flags", "-c 4096")
+        self.parallel = int(config.get_config_value("llm_parallel_slots", 1))
         self.api_url = f"http://{self.host}:{self.port}"
         self._log_file = None
 
@@ -44,6 +47,13 @@ class LlamaServerManager:
             except Exception as e:
                 logger.error(f"Erro ao processar flags: {e}")
 
+        # Os slots do servidor precisam bater com os do bot (id_slot, fila de prioridade)
+        parallel = Config._parallel_from_flags(self.flags)
+        if parallel is None:
+            cmd.extend(["--parallel", str(self.parallel)])
+        elif parallel != self.parallel:
+            logger.warning(f"LLAMA_SERVER_FLAGS usa --parallel {parallel}, mas LLM_PARALLEL_SLOTS={self.parallel}; o bot usará {parallel}")
+
         logger.info(f"Iniciando Llama Server: {' '.join(cmd)}")
 
         try:
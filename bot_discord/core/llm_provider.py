@@ -1,9 +1,14 @@
 # llm_provider.py
 from abc import ABC, abstractmethod
 import aiohttp
+import asyncio
 import logging
 import os
 import json
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from core.llm_scheduler import LLMScheduler, PRIORITY_INTERACTIVE
 
 logger = logging.getLogger(__name__)
 
@@ -17,19 +22,77 @@ class LLMProvider(ABC):
         pass
 
 class OpenAICompatibleProvider(LLMProvider):
-    def __init__(self, api_url, model, name="OpenAI-Compatible"):
+    def __init__(self, api_url, model, name="OpenAI-Compatible", slots=1):
         self.api_url = api_url
         self.model = model
         self.name = name
         self._session = None
-        self.metrics = {"latency": [], "total_requests": 0, "errors": 0}
+        # Fila de prioridade: chat interativo passa na frente de extração/resumo
+        self.scheduler = LLMScheduler(slots)
+        # Cache opt-in (LLMResponseCache) para chamadas determinísticas; None desliga
+        self.response_cache = None
+        self.metrics = {
+            "latency": [], "total_requests": 0, "errors": 0,
+            "prompt_tokens_cached": 0, "prompt_tokens_evaluated": 0,
+            # Streams cancelados: tokens gerados e descartados, e o que sobrou do max_tokens (não decodificado)
+            "cancelled": 0, "cancelled_tokens": 0, "cancelled_tokens_saved": 0,
+        }
+        self.last_prompt_cache = None
 
     async def _get_session(self):
         if self._session is None or self._session.closed:
             self._session = aiohttp.ClientSession()
         return self._session
 
-    async def generate(self, messages, temperature=0.7, max_tokens=2048, top_p=0.95, frequency_penalty=0.0):
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def generate(self, messages, temperature=0.7, max_tokens=2048, top_p=0.95, frequency_penalty=0.0, priority=PRIORITY_INTERACTIVE, user_id=None, cacheable=False):
+        # Só chamadas com temperature 0 ou marcadas como cacheáveis usam o cache de respostas
+        cache_key = None
+        if self.response_cache is not None and (cacheable or temperature == 0):
+            cache_key = self.response_cache.key(self.model, messages, {
+                "temperature": temperature, "max_tokens": max_tokens,
+                "top_p": top_p, "frequency_penalty": frequency_penalty,
+            })
+            cached = await self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        async with self.scheduler.slot(priority, user_id):
+            errors = self.metrics["errors"]
+            # Só o chat fixa o usuário num slot do backend; tarefas de fundo têm outro prefixo
+            # e sobrescreveriam o KV cache da conversa
+            affinity = user_id if priority == PRIORITY_INTERACTIVE else None
+            content = await self._generate(messages, temperature, max_tokens, top_p, frequency_penalty, affinity)
+        # Mensagens de erro não são guardadas
+        if cache_key is not None and self.metrics["errors"] == errors and content is not None:
+            await self.response_cache.put(cache_key, content)
+        return content
+
+    @asynccontextmanager
+    async def _backend_slot(self, user_id):
+        """Parâmetros extras do payload para a requisição (ex.: slot do servidor)."""
+        yield {}
+
+    def _record_prompt_cache(self, data):
+        """Registra tokens do prompt reaproveitados do KV cache, quando o backend informa."""
+        timings = data.get("timings") or {}
+        details = (data.get("usage") or {}).get("prompt_tokens_details") or {}
+        if "cache_n" in timings:
+            cached, evaluated = timings.get("cache_n", 0), timings.get("prompt_n", 0)
+        elif "cached_tokens" in details:
+            cached = details["cached_tokens"]
+            evaluated = data["usage"].get("prompt_tokens", 0) - cached
+        else:
+            return
+        self.metrics["prompt_tokens_cached"] += cached
+        self.metrics["prompt_tokens_evaluated"] += evaluated
+        self.last_prompt_cache = {"cached": cached, "evaluated": evaluated}
+        logger.debug(f"Prompt cache ({self.name}): {cached} tokens reaproveitados, {evaluated} avaliados")
+
+    async def _generate(self, messages, temperature, max_tokens, top_p, frequency_penalty, user_id=None):
         import time
         payload = {
             "model": self.model,
@@ -44,9 +107,9 @@ class OpenAICompatibleProvider(LLMProvider):
         self.metrics["total_requests"] += 1
         
         try:
-            async with session.post(
+            async with self._backend_slot(user_id) as extra, session.post(
                 f"{self.api_url}/chat/completions",
-                json=payload,
+                json={**payload, **extra},
                 timeout=120
             ) as response:
                 latency = time.time() - start_time
@@ -54,6 +117,7 @@ class OpenAICompatibleProvider(LLMProvider):
                 
                 if response.status == 200:
                     result = await response.json()
+                    self._record_prompt_cache(result)
                     content = result["choices"][0]["message"]["content"]
                     logger.info(f"LLM Success ({self.name}) | Latency: {latency:.2f}s")
                     return content
@@ -67,7 +131,24 @@ class OpenAICompatibleProvider(LLMProvider):
             logger.error(f"LLM Connection Error ({self.name}): {e}")
             return f"Erro de conexão com o servidor {self.name}."
 
-    async def generate_stream(self, messages, temperature=0.7, max_tokens=2048, top_p=0.95):
+    async def generate_stream(self, messages, temperature=0.7, max_tokens=2048, top_p=0.95, priority=PRIORITY_INTERACTIVE, user_id=None, cancel_token=None):
+        if cancel_token is not None and cancel_token.cancelled:
+            return
+        # O slot fica ocupado durante todo o stream
+        async with self.scheduler.slot(priority, user_id):
+            # Cancelado enquanto esperava na fila: libera o slot sem chamar o backend
+            if cancel_token is not None and cancel_token.cancelled:
+                return
+            async for chunk in self._generate_stream(messages, temperature, max_tokens, top_p, user_id, cancel_token):
+                yield chunk
+
+    def _record_cancel(self, streamed, max_tokens, reason):
+        self.metrics["cancelled"] += 1
+        self.metrics["cancelled_tokens"] += streamed
+        self.metrics["cancelled_tokens_saved"] += max(0, max_tokens - streamed)
+        logger.info(f"Stream cancelado ({self.name}, {reason}) após {streamed} tokens")
+
+    async def _generate_stream(self, messages, temperature, max_tokens, top_p, user_id=None, cancel_token=None):
         payload = {
             "model": self.model,
             "messages": messages,
@@ -77,42 +158,108 @@ class OpenAICompatibleProvider(LLMProvider):
             "stream": True
         }
         session = await self._get_session()
+        streamed = 0
         try:
-            async with session.post(
+            async with self._backend_slot(user_id) as extra, session.post(
                 f"{self.api_url}/chat/completions",
-                json=payload,
+                json={**payload, **extra},
                 timeout=120
             ) as response:
-                if response.status == 200:
-                    async for line in response.content:
-                        line = line.decode('utf-8').strip()
-                        if line.startswith('data: '):
-                            if line == 'data: [DONE]':
+                # Fechar a conexão faz o llama-server parar de decodificar na hora
+                remove_callback = cancel_token.add_callback(response.close) if cancel_token is not None else None
+                try:
+                    if response.status == 200:
+                        async for line in response.content:
+                            if cancel_token is not None and cancel_token.cancelled:
                                 break
-                            try:
-                                chunk = json.loads(line[6:])
-                                if 'choices' in chunk and len(chunk['choices']) > 0:
-                                    delta = chunk['choices'][0].get('delta', {})
-                                    content = delta.get('content', '')
-                                    if content:
-                                        yield content
-                            except:
-                                continue
-                else:
-                    logger.error(f"Stream Error ({self.name}): {response.status}")
-                    yield f"Erro no streaming {self.name}: {response.status}"
+                            line = line.decode('utf-8').strip()
+                            if line.startswith('data: '):
+                                if line == 'data: [DONE]':
+                                    break
+                                try:
+                                    chunk = json.loads(line[6:])
+                                    if 'timings' in chunk or 'usage' in chunk:
+                                        self._record_prompt_cache(chunk)
+                                    if 'choices' in chunk and len(chunk['choices']) > 0:
+                                        delta = chunk['choices'][0].get('delta', {})
+                                        content = delta.get('content', '')
+                                        if content:
+                                            streamed += 1
+                                            yield content
+                                except:
+                                    continue
+                    else:
+                        logger.error(f"Stream Error ({self.name}): {response.status}")
+                        yield f"Erro no streaming {self.name}: {response.status}"
+                finally:
+                    if remove_callback is not None:
+                        remove_callback()
+                    if cancel_token is not None and cancel_token.cancelled:
+                        response.close()
+        except asyncio.CancelledError:
+            # Tarefa cancelada (ex.: resposta substituída); o `async with` já fechou a resposta
+            self._record_cancel(streamed, max_tokens, cancel_token.reason if cancel_token is not None and cancel_token.cancelled else "task")
+            raise
         except Exception as e:
-            logger.error(f"Stream Connection Error ({self.name}): {e}")
-            yield f"Erro de conexão no stream {self.name}."
+            if cancel_token is None or not cancel_token.cancelled:
+                logger.error(f"Stream Connection Error ({self.name}): {e}")
+                yield f"Erro de conexão no stream {self.name}."
+        if cancel_token is not None and cancel_token.cancelled:
+            self._record_cancel(streamed, max_tokens, cancel_token.reason)
 
 class LMStudioProvider(OpenAICompatibleProvider):
-    def __init__(self, api_url, model):
-        super().__init__(api_url, model, name="LM Studio")
+    def __init__(self, api_url, model, slots=1):
+        super().__init__(api_url, model, name="LM Studio", slots=slots)
 
 class OllamaProvider(OpenAICompatibleProvider):
-    def __init__(self, api_url, model):
-        super().__init__(api_url, model, name="Ollama")
+    def __init__(self, api_url, model, slots=1):
+        super().__init__(api_url, model, name="Ollama", slots=slots)
 
 class LlamaCppProvider(OpenAICompatibleProvider):
-    def __init__(self, api_url, model):
-        super().__init__(api_url, model, name="Llama.cpp")
\ No newline at end of file
+    """
+    llama-server mantém um KV cache por slot. Fixar cada usuário no mesmo slot
+    e enviar `cache_prompt` faz o servidor reavaliar só o sufixo novo do prompt
+    (persona e histórico já vistos vêm do cache).
+    """
+
+    def __init__(self, api_url, model, slots=1):
+        super().__init__(api_url, model, name="Llama.cpp", slots=slots)
+        self._slot_owner = OrderedDict()  # usuário -> slot, do menos para o mais recente
+        self._slot_used = {}  # slot -> contador do último uso
+        self._use_counter = 0
+        self._busy_slots = set()
+
+    def _claim_slot(self, user_id=None):
+        """
+        Slot anterior do usuário se estiver livre; senão o slot livre usado há mais
+        tempo. Sem usuário (tarefas de fundo) o slot também é ocupado, para o chat
+        não ser fixado num slot em uso, mas prefere um que não seja de ninguém e
+        não registra dono.
+        """
+        slot = self._slot_owner.get(user_id) if user_id is not None else None
+        if slot is None or slot in self._busy_slots or slot >= self.scheduler.slots:
+            free = [s for s in range(self.scheduler.slots) if s not in self._busy_slots]
+            if not free:
+                return None
+            owned = set(self._slot_owner.values()) if user_id is None else ()
+            slot = min(free, key=lambda s: (s in owned, self._slot_used.get(s, 0)))
+        self._use_counter += 1
+        self._slot_used[slot] = self._use_counter
+        if user_id is not None:
+            self._slot_owner.pop(user_id, None)
+            self._slot_owner[user_id] = slot
+            while len(self._slot_owner) > 1024:
+                self._slot_owner.popitem(last=False)
+        return slot
+
+    @asynccontextmanager
+    async def _backend_slot(self, user_id):
+        slot = self._claim_slot(user_id)
+        if slot is None:
+            yield {"cache_prompt": True}
+            return
+        self._busy_slots.add(slot)
+        try:
+            yield {"cache_prompt": True, "id_slot": slot}
+        finally:
+            self._busy_slots.discard(slot)
\ No newline at end of file
@@ -0,0 +1,110 @@
+# llm_scheduler.py
+# Fila de prioridade com fairness por usuário na frente do backend LLM local
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from core.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Classes de prioridade (menor = mais urgente)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_EXTRACTION = 1
+PRIORITY_SUMMARIZATION = 2
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_EXTRACTION: "extraction",
+    PRIORITY_SUMMARIZATION: "summarization",
+}
+
+
+class LLMScheduler:
+    """
+    Limita as requisições simultâneas ao backend a `slots` (os slots paralelos
+    do llama.cpp / LM Studio) e decide quem usa o próximo slot livre:
+
+    1. a classe de prioridade mais urgente com alguém esperando;
+    2. dentro da classe, round-robin entre usuários (um usuário com muitas
+       requisições não bloqueia os outros);
+    3. dentro do usuário, ordem de chegada.
+
+    Tarefas de fundo (extração, resumo) só pegam um slot quando não há chat
+    interativo na fila.
+    """
+
+    def __init__(self, slots=1):
+        self.slots = max(1, int(slots))
+        self.in_flight = 0
+        # prioridade -> OrderedDict(user_id -> deque de futures)
+        self._queues = {p: OrderedDict() for p in PRIORITY_NAMES}
+        self.metrics = {
+            "wait_ms": {name: Histogram((1, 10, 50, 100, 500, 1000, 5000, 15000, 60000)) for name in PRIORITY_NAMES.values()},
+            "completed": {name: 0 for name in PRIORITY_NAMES.values()},
+        }
+
+    def queue_depth(self, priority=None):
+        """Requisições esperando (numa classe ou no total)."""
+        priorities = [priority] if priority is not None else list(self._queues)
+        return sum(len(waiters) for p in priorities for waiters in self._queues[p].values())
+
+    def snapshot(self):
+        return {
+            "slots": self.slots,
+            "in_flight": self.in_flight,
+            "queued": {PRIORITY_NAMES[p]: self.queue_depth(p) for p in self._queues},
+            "wait_ms": {name: h.snapshot() for name, h in self.metrics["wait_ms"].items()},
+        }
+
+    async def acquire(self, priority=PRIORITY_INTERACTIVE, user_id=None):
+        start = time.perf_counter()
+        if self.in_flight < self.slots and not self.queue_depth():
+            self.in_flight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._queues[priority].setdefault(user_id, deque()).append(future)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # O slot já tinha sido repassado: devolve para o próximo
+                    self.release()
+                else:
+                    self._discard(priority, user_id, future)
+                raise
+        self.metrics["wait_ms"][PRIORITY_NAMES[priority]].observe((time.perf_counter() - start) * 1000)
+
+    def _discard(self, priority, user_id, future):
+        waiters = self._queues[priority].get(user_id)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            if not waiters:
+                del self._queues[priority][user_id]
+
+    def release(self):
+        """Libera um slot, repassando-o direto ao próximo da fila quando houver."""
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            while users:
+                user_id, waiters = next(iter(users.items()))
+                future = waiters.popleft()
+                # Round-robin: o usuário atendido vai para o fim da classe
+                del users[user_id]
+                if waiters:
+                    users[user_id] = waiters
+                if not future.done():
+                    future.set_result(None)
+                    return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority=PRIORITY_INTERACTIVE, user_id=None):
+        await self.acquire(priority, user_id)
+        try:
+            yield
+        finally:
+            self.metrics["completed"][PRIORITY_NAMES[priority]] += 1
+            self.release()
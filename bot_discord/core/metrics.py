@@ -0,0 +1,56 @@
+# metrics.py
+# Histogramas leves em memória para instrumentação interna
+
+import bisect
+
+
+class Histogram:
+    """
+    Histograma de buckets fixos (limites superiores inclusivos) com contagem,
+    soma e máximo. Percentis são aproximados pelo limite do bucket.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def percentile(self, q):
+        """Limite superior do bucket que contém o percentil `q` (0-100)."""
+        if not self.count:
+            return 0.0
+        target = q / 100.0 * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target and c:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": round(self.mean, 3),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "max": self.max,
+        }
+
+    def describe(self, unit=""):
+        """Resumo de uma linha para logs e para o !status."""
+        if not self.count:
+            return "n=0"
+        return f"n={self.count} p50={self.percentile(50):g}{unit} p95={self.percentile(95):g}{unit} max={self.max:.0f}{unit}"
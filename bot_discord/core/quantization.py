@@ -0,0 +1,76 @@
+# quantization.py
+# Armazenamento quantizado de embeddings (float16 / int8 afim por linha)
+
+import struct
+
+import numpy as np
+
+STORAGE_MODES = ("float32", "float16", "int8")
+
+_INT8_HEADER = struct.Struct("<ff")  # scale, offset
+
+
+def quantize_rows(matrix, mode):
+    """
+    Quantiza uma matriz float32 (N x D). Retorna (codes, scales, offsets); para
+    float16/float32 `scales` e `offsets` são None.
+
+    No modo int8 cada linha usa um mapeamento afim próprio:
+    x ≈ scale * code + offset, com code em [-128, 127].
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if mode == "float32":
+        return matrix, None, None
+    if mode == "float16":
+        return matrix.astype(np.float16), None, None
+    if mode != "int8":
+        raise ValueError(f"Modo de armazenamento desconhecido: {mode}")
+
+    low = matrix.min(axis=1)
+    high = matrix.max(axis=1)
+    scales = (high - low) / 255.0
+    scales[scales == 0] = 1.0
+    offsets = low + 128.0 * scales
+    codes = np.clip(np.rint((matrix - offsets[:, None]) / scales[:, None]), -128, 127).astype(np.int8)
+    return codes, scales.astype(np.float32), offsets.astype(np.float32)
+
+
+def dequantize_rows(codes, scales=None, offsets=None):
+    if scales is None:
+        return np.asarray(codes, dtype=np.float32)
+    return codes.astype(np.float32) * scales[:, None] + offsets[:, None]
+
+
+def approx_scores(codes, query, scales=None, offsets=None, chunk=4096):
+    """
+    Produto escalar aproximado entre `query` (float32) e as linhas quantizadas.
+    A conversão para float32 é feita em blocos para não materializar a matriz
+    inteira; no int8 usa-se x·q = scale * (code·q) + offset * sum(q).
+    """
+    if codes.dtype == np.float32:
+        return codes @ query
+    n = codes.shape[0]
+    scores = np.empty(n, dtype=np.float32)
+    for start in range(0, n, chunk):
+        block = codes[start:start + chunk].astype(np.float32)
+        scores[start:start + chunk] = block @ query
+    if scales is not None:
+        scores = scores * scales + offsets * float(query.sum())
+    return scores
+
+
+def encode_blob(vector, mode):
+    """Serializa um vetor float32 no formato de `mode` (coluna `embedding_q`)."""
+    codes, scales, offsets = quantize_rows(np.asarray(vector, dtype=np.float32)[None, :], mode)
+    if mode == "int8":
+        return _INT8_HEADER.pack(float(scales[0]), float(offsets[0])) + codes.tobytes()
+    return codes.tobytes()
+
+
+def decode_blob(blob, mode):
+    """Inverso de `encode_blob`. Retorna (codes, scale, offset)."""
+    if mode == "int8":
+        scale, offset = _INT8_HEADER.unpack_from(blob)
+        return np.frombuffer(blob, dtype=np.int8, offset=_INT8_HEADER.size), scale, offset
+    dtype = np.float16 if mode == "float16" else np.float32
+    return np.frombuffer(blob, dtype=dtype), None, None
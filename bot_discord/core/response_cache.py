@@ -0,0 +1,49 @@
+# response_cache.py
+# Cache opt-in de respostas do LLM para chamadas determinísticas
+
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LLMResponseCache:
+    """
+    Guarda respostas do LLM na tabela `llm_cache` do banco, indexadas por um
+    hash de (modelo, mensagens, parâmetros de amostragem). Só deve ser usado
+    em chamadas com temperature 0 ou marcadas como cacheáveis: nelas a mesma
+    entrada pode reaproveitar a mesma saída.
+    """
+
+    def __init__(self, db, ttl=7 * 24 * 3600, max_entries=5000):
+        self.db = db
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.metrics = {"hits": 0, "misses": 0, "stores": 0}
+
+    @staticmethod
+    def key(model, messages, params):
+        payload = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @property
+    def hit_rate(self):
+        total = self.metrics["hits"] + self.metrics["misses"]
+        return self.metrics["hits"] / total if total else 0.0
+
+    async def get(self, key):
+        try:
+            response = await self.db.get_llm_response(key, self.ttl)
+        except Exception as e:
+            logger.warning(f"Falha ao ler cache de respostas: {e}")
+            response = None
+        self.metrics["hits" if response is not None else "misses"] += 1
+        return response
+
+    async def put(self, key, response):
+        try:
+            await self.db.set_llm_response(key, response, self.ttl, self.max_entries)
+            self.metrics["stores"] += 1
+        except Exception as e:
+            logger.warning(f"Falha ao gravar cache de respostas: {e}")
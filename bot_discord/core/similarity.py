@@ -0,0 +1,68 @@
+# similarity.py
+# Top-k vetorizado: uma consulta (ou lote Q x D) contra uma matriz N x D
+
+import numpy as np
+
+
+def _top_k_rows(scores, k, threshold=None, weights=None):
+    """
+    Seleciona o top-k de cada linha de `scores` (Q x N) com `argpartition`
+    (O(N) por linha) e ordena só os k escolhidos. O ranking usa
+    `scores * weights` quando `weights` (N,) é informado; o threshold vale
+    sobre o score bruto e é aplicado antes da seleção, para um item abaixo dele
+    (mas com peso alto) não tomar a vaga de um que passa. Retorna uma lista de
+    (índices, scores) por linha.
+    """
+    n = scores.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in range(scores.shape[0])]
+
+    ranked = scores if weights is None else scores * np.asarray(weights, dtype=np.float32)
+    if threshold is not None and weights is not None:
+        ranked = np.where(scores >= threshold, ranked, -np.inf)
+    if k < n:
+        top = np.argpartition(-ranked, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(n), ranked.shape)
+    order = np.argsort(-np.take_along_axis(ranked, top, axis=1), axis=1, kind="stable")
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(scores, top, axis=1)
+
+    if threshold is None:
+        return list(zip(top, top_scores))
+    keep = top_scores >= threshold
+    return [(t[m], s[m]) for t, s, m in zip(top, top_scores, keep)]
+
+
+def select_top_k(scores, k, threshold=None, weights=None):
+    """Top-k de um vetor de scores (N,). Retorna (índices, scores) em ordem decrescente."""
+    return _top_k_rows(np.asarray(scores)[None, :], k, threshold, weights)[0]
+
+
+def top_k_similarity(queries, matrix, k, threshold=None, weights=None, normalized=True, chunk=4096):
+    """
+    Similaridade de cosseno entre `queries` (Q x D ou D) e `matrix` (N x D).
+
+    `matrix` pode ser float16: a conversão para float32 é feita em blocos de
+    `chunk` linhas. Com `normalized=False` as normas são calculadas aqui; caso
+    contrário as linhas já devem ser unitárias. `weights` (N,) pondera o
+    ranking (ex.: importância ou recência) sem alterar o score retornado.
+
+    Retorna uma lista com um par (índices, scores) por consulta.
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    if not normalized:
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1.0, norms)
+
+    n = matrix.shape[0]
+    scores = np.empty((queries.shape[0], n), dtype=np.float32)
+    for start in range(0, n, chunk):
+        block = np.asarray(matrix[start:start + chunk], dtype=np.float32)
+        block_scores = queries @ block.T
+        if not normalized:
+            norms = np.linalg.norm(block, axis=1)
+            block_scores /= np.where(norms == 0, 1.0, norms)
+        scores[:, start:start + chunk] = block_scores
+    return _top_k_rows(scores, k, threshold, weights)
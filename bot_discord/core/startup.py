@@ -0,0 +1,88 @@
+# startup.py
+# Orquestrador de inicialização: fases concorrentes com dependências e relatório de tempos
+
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StartupOrchestrator:
+    """
+    Executa as fases de inicialização em paralelo, respeitando dependências.
+
+    Cada fase é uma função assíncrona sem argumentos registrada com `add`. Uma
+    fase começa assim que todas as suas dependências terminam com sucesso; se
+    alguma dependência falhar, a fase é marcada como "skipped". `wait(name)`
+    permite esperar só o necessário (ex.: conectar ao Discord) enquanto o resto
+    continua em segundo plano.
+    """
+
+    def __init__(self):
+        self._phases = {}
+        self._tasks = {}
+        self.status = {}
+        self.timings = {}
+        self._started_at = None
+
+    def add(self, name, func, depends_on=()):
+        self._phases[name] = (func, tuple(depends_on))
+        self.status[name] = "pending"
+
+    def start(self):
+        """Agenda todas as fases. Retorna imediatamente."""
+        unknown = {d for _, deps in self._phases.values() for d in deps} - set(self._phases)
+        if unknown:
+            raise ValueError(f"Dependências desconhecidas: {', '.join(sorted(unknown))}")
+        self._started_at = time.perf_counter()
+        for name in self._phases:
+            self._task(name)
+
+    def _task(self, name):
+        if name not in self._tasks:
+            self._tasks[name] = asyncio.ensure_future(self._run_phase(name))
+        return self._tasks[name]
+
+    async def _run_phase(self, name):
+        func, deps = self._phases[name]
+        if deps:
+            ok = await asyncio.gather(*(self._task(d) for d in deps))
+            if not all(ok):
+                self.status[name] = "skipped"
+                logger.warning(f"[startup] {name}: ignorada (dependência falhou)")
+                return False
+        self.status[name] = "running"
+        start = time.perf_counter()
+        try:
+            await func()
+            self.status[name] = "ready"
+            return True
+        except Exception as e:
+            self.status[name] = "failed"
+            logger.error(f"[startup] {name}: falhou: {e}", exc_info=True)
+            return False
+        finally:
+            self.timings[name] = (start - self._started_at, time.perf_counter() - start)
+            logger.info(f"[startup] {name}: {self.status[name]} em {self.timings[name][1]:.2f}s")
+
+    async def wait(self, *names):
+        """Espera as fases indicadas (ou todas). Retorna True se todas ficaram prontas."""
+        names = names or tuple(self._phases)
+        return all(await asyncio.gather(*(self._task(n) for n in names)))
+
+    def ready(self, name):
+        return self.status.get(name) == "ready"
+
+    def report(self):
+        """Relatório por fase: status, início relativo e duração."""
+        lines = ["Relatório de inicialização:"]
+        for name in self._phases:
+            offset, duration = self.timings.get(name, (0.0, 0.0))
+            lines.append(f"  {name:<14} {self.status[name]:<8} +{offset:6.2f}s  {duration:6.2f}s")
+        return "\n".join(lines)
+
+    async def cancel(self):
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
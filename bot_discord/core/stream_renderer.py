@@ -0,0 +1,239 @@
+# stream_renderer.py
+# Renderiza respostas em stream no Discord com edições agrupadas por tempo
+
+import asyncio
+import logging
+import time
+from contextlib import suppress
+
+import discord
+
+from core.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Limite de caracteres de uma mensagem do Discord
+MESSAGE_LIMIT = 2000
+
+
+def split_message(text, limit=MESSAGE_LIMIT):
+    """Divide o texto em partes <= limit, preferindo quebrar em linha ou espaço."""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", limit // 2, limit + 1)
+        if cut < 0:
+            cut = text.rfind(" ", limit // 2, limit + 1)
+        if cut < 0:
+            parts.append(text[:limit])
+            text = text[limit:]
+        else:
+            parts.append(text[:cut])
+            text = text[cut + 1:]
+    parts.append(text)
+    return parts
+
+
+def _retry_after(error):
+    """
+    Segundos de espera pedidos pelo Discord num erro de rate limit (None se não
+    for). `discord.RateLimited` não é um HTTPException: só aparece quando a
+    espera passa do `max_ratelimit_timeout` do cliente.
+    """
+    if isinstance(error, discord.RateLimited):
+        return error.retry_after
+    if getattr(error, "status", None) != 429:
+        return None
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for header in ("Retry-After", "X-RateLimit-Reset-After"):
+        try:
+            return float(headers[header])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return 1.0
+
+
+class ChannelPacer:
+    """
+    Ritmo de edições de um canal. O intervalo dobra (ou segue o Retry-After)
+    a cada rate limit e volta aos poucos ao mínimo com edições bem-sucedidas.
+    """
+
+    def __init__(self, min_interval=1.0, max_interval=10.0):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.next_at = 0.0
+
+    def delay(self):
+        return max(0.0, self.next_at - time.monotonic())
+
+    def on_success(self):
+        self.interval = max(self.min_interval, self.interval * 0.8)
+        self.next_at = time.monotonic() + self.interval
+
+    def on_rate_limited(self, retry_after):
+        self.interval = min(self.max_interval, max(self.interval * 2, retry_after))
+        self.next_at = time.monotonic() + max(retry_after, self.interval)
+
+
+class StreamRenderer:
+    """
+    Uma resposta em stream. `feed` acumula o texto e agenda no máximo uma
+    edição por intervalo do canal; `finish` sempre entrega o texto final.
+    Textos acima de 2000 caracteres continuam em mensagens seguintes.
+    """
+
+    def __init__(self, channel, pacer, metrics, min_chars=5, limit=MESSAGE_LIMIT):
+        self.channel = channel
+        self.pacer = pacer
+        self.metrics = metrics
+        self.min_chars = min_chars
+        self.limit = limit
+        self.text = ""
+        self.messages = []  # mensagens enviadas, uma por parte
+        self._rendered = []  # conteúdo atual de cada mensagem
+        self._broken = set()  # partes cuja mensagem não aceita mais edição (apagada, sem permissão)
+        self._lock = asyncio.Lock()
+        self._timer = None
+        self._edits = 0
+        self._failed = False  # para as edições intermediárias; a final ainda é tentada
+
+    def feed(self, chunk):
+        self.text += chunk
+        if self._timer is None and not self._failed and len(self.text.strip()) > self.min_chars:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.pacer.delay())
+            await self._flush(final=False)
+        finally:
+            self._timer = None
+
+    async def _settle(self):
+        """Cancela a edição agendada que ainda espera; uma já em andamento termina antes (senão a mensagem enviada se perderia)."""
+        timer = self._timer
+        if timer is None:
+            return
+        if not self._lock.locked():
+            timer.cancel()
+        with suppress(asyncio.CancelledError):
+            await timer
+
+    async def _flush(self, final):
+        async with self._lock:
+            for index, part in enumerate(split_message(self.text, self.limit)):
+                if index < len(self._rendered) and self._rendered[index] == part and index not in self._broken:
+                    continue
+                if not part.strip():
+                    continue
+                if not await self._apply(index, part, final):
+                    return False
+        return True
+
+    async def _apply(self, index, content, final, attempts=3):
+        for _ in range(attempts if final else 1):
+            await asyncio.sleep(self.pacer.delay())
+            started = time.monotonic()
+            try:
+                if index < len(self.messages) and index not in self._broken:
+                    await self.messages[index].edit(content=content)
+                    self._edits += 1
+                    self._rendered[index] = content
+                elif index < len(self.messages):
+                    # A mensagem original não aceita edição: a parte vai numa mensagem nova
+                    self.messages[index] = await self.channel.send(content)
+                    self._rendered[index] = content
+                    self._broken.discard(index)
+                else:
+                    self.messages.append(await self.channel.send(content))
+                    self._rendered.append(content)
+                self._paced(time.monotonic() - started)
+                return True
+            except (discord.HTTPException, discord.RateLimited) as e:
+                retry_after = _retry_after(e)
+                if retry_after is not None:
+                    self.metrics["rate_limited"] += 1
+                    self.pacer.on_rate_limited(retry_after)
+                    logger.debug(f"Rate limit ao editar resposta; próximo intervalo {self.pacer.interval:.1f}s")
+                    continue
+                self.metrics["errors"] += 1
+                if getattr(e, "status", 0) >= 500:
+                    # Erro transitório do Discord: espera e tenta de novo
+                    self.pacer.on_rate_limited(self.pacer.min_interval)
+                    logger.debug(f"Erro {e.status} do Discord ao atualizar resposta; tentando de novo")
+                    continue
+                logger.warning(f"Falha ao atualizar resposta no canal: {e}")
+                self._failed = True
+                if index < len(self.messages) and index not in self._broken:
+                    # Edição recusada (mensagem apagada etc.): a final cai para uma mensagem nova
+                    self._broken.add(index)
+                    if final:
+                        continue
+                return False
+        return False
+
+    def _paced(self, elapsed):
+        """
+        Ajusta o ritmo após uma chamada bem-sucedida. O discord.py dorme nos 429
+        curtos dentro da própria chamada, então uma chamada mais lenta que o
+        intervalo atual é tratada como rate limit.
+        """
+        if elapsed > self.pacer.interval:
+            self.metrics["rate_limited"] += 1
+            self.pacer.on_rate_limited(elapsed)
+        else:
+            self.pacer.on_success()
+
+    async def finish(self, text=None):
+        """Entrega o texto final (aguardando o rate limit se preciso) e registra as métricas."""
+        if text is not None:
+            self.text = text
+        await self._settle()
+        delivered = await self._flush(final=True)
+        self.metrics["replies"] += 1
+        self.metrics["edits_per_reply"].observe(self._edits)
+        if len(self.messages) > 1:
+            self.metrics["rollovers"] += len(self.messages) - 1
+        return delivered
+
+    async def discard(self):
+        """Apaga as mensagens já enviadas (resposta substituída por outra geração)."""
+        await self._settle()
+        async with self._lock:
+            for msg in self.messages:
+                try:
+                    await msg.delete()
+                except discord.HTTPException as e:
+                    logger.debug(f"Falha ao apagar resposta parcial: {e}")
+            self.messages, self._rendered, self._broken = [], [], set()
+        self.metrics["discarded"] += 1
+
+
+class StreamRendererPool:
+    """Cria renderers compartilhando o ritmo por canal (o rate limit de edição é por canal)."""
+
+    def __init__(self, min_interval=1.0, max_interval=10.0, max_channels=1024):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_channels = max_channels
+        self._pacers = {}
+        self.metrics = {
+            "replies": 0,
+            "rate_limited": 0,
+            "errors": 0,
+            "rollovers": 0,
+            "discarded": 0,
+            "edits_per_reply": Histogram((0, 1, 2, 5, 10, 20, 50)),
+        }
+
+    def pacer(self, channel_id):
+        pacer = self._pacers.pop(channel_id, None) or ChannelPacer(self.min_interval, self.max_interval)
+        # Reinsere no fim: o dict funciona como LRU
+        self._pacers[channel_id] = pacer
+        if len(self._pacers) > self.max_channels:
+            self._pacers.pop(next(iter(self._pacers)))
+        return pacer
+
+    def renderer(self, channel):
+        return StreamRenderer(channel, self.pacer(getattr(channel, "id", None)), self.metrics)
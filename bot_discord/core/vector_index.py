@@ -0,0 +1,358 @@
+# vector_index.py
+# Índice vetorial residente em memória para a busca semântica
+
+import logging
+import os
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+from core.ann_index import IVFIndex
+from core.quantization import approx_scores, decode_blob, dequantize_rows, quantize_rows
+from core.similarity import select_top_k
+
+_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    """
+    Matriz contígua (linhas já normalizadas) de um único usuário. Em modo
+    float32 guarda os vetores exatos; em float16/int8 guarda apenas os códigos
+    quantizados usados para a busca de candidatos (ver `core.quantization`).
+    """
+
+    __slots__ = ("ids", "contents", "matrix", "scales", "offsets", "count", "dim", "storage", "content_bytes", "ann", "total", "_positions")
+
+    def __init__(self, dim, capacity=16, storage="float32"):
+        self.ann = None
+        self._positions = None
+        self.ids = []
+        self.contents = []
+        self.dim = dim
+        self.storage = storage
+        self.count = 0
+        self.content_bytes = 0
+        self.total = np.zeros(dim, dtype=np.float32)  # soma das linhas unitárias (centroide = total / count)
+        capacity = max(capacity, 1)
+        self.matrix = np.empty((capacity, dim), dtype=_DTYPES[storage])
+        self.scales = np.empty(capacity, dtype=np.float32) if storage == "int8" else None
+        self.offsets = np.empty(capacity, dtype=np.float32) if storage == "int8" else None
+
+    @property
+    def nbytes(self):
+        extra = 2 * self.scales.nbytes if self.scales is not None else 0
+        return self.matrix.nbytes + extra + self.content_bytes
+
+    def reserve(self, capacity):
+        if capacity <= self.matrix.shape[0]:
+            return
+        # Crescimento geométrico: append amortizado O(D)
+        grown = np.empty((capacity, self.dim), dtype=self.matrix.dtype)
+        grown[:self.count] = self.matrix[:self.count]
+        self.matrix = grown
+        if self.scales is not None:
+            self.scales = np.resize(self.scales, capacity)
+            self.offsets = np.resize(self.offsets, capacity)
+
+    def append(self, mem_id, content, unit_vector):
+        if self.count == self.matrix.shape[0]:
+            self.reserve(self.matrix.shape[0] * 2)
+        codes, scales, offsets = quantize_rows(unit_vector[None, :], self.storage)
+        self.matrix[self.count] = codes[0]
+        if scales is not None:
+            self.scales[self.count] = scales[0]
+            self.offsets[self.count] = offsets[0]
+        self.total += unit_vector
+        self.ids.append(mem_id)
+        self.contents.append(content)
+        self.content_bytes += len(content.encode("utf-8"))
+        if self._positions is not None:
+            self._positions[mem_id] = self.count
+        self.count += 1
+
+    def positions(self, mem_ids):
+        """Posições das linhas com os ids dados (ids ausentes são ignorados)."""
+        if self._positions is None:
+            self._positions = {mem_id: pos for pos, mem_id in enumerate(self.ids)}
+        found = [self._positions[m] for m in mem_ids if m in self._positions]
+        return np.asarray(found, dtype=np.int64)
+
+    def vectors(self, rows=None):
+        """Linhas em float32 (exatas em float32, aproximadas nos modos quantizados)."""
+        rows = slice(0, self.count) if rows is None else rows
+        if self.scales is None:
+            return np.asarray(self.matrix[rows], dtype=np.float32)
+        return dequantize_rows(self.matrix[rows], self.scales[rows], self.offsets[rows])
+
+    def scores(self, unit_query, rows=None):
+        rows = slice(0, self.count) if rows is None else rows
+        if self.scales is None:
+            return approx_scores(self.matrix[rows], unit_query)
+        return approx_scores(self.matrix[rows], unit_query, self.scales[rows], self.offsets[rows])
+
+
+def normalize(vector):
+    """Converte um vetor para float32 unitário. Retorna None para vetores nulos."""
+    vec = np.asarray(vector, dtype=np.float32).ravel()
+    norm = float(np.linalg.norm(vec))
+    if norm == 0.0 or not np.isfinite(norm):
+        return None
+    return vec / norm
+
+
+class VectorIndex:
+    """
+    Cache LRU de matrizes de embeddings por usuário.
+
+    Cada usuário carregado possui uma matriz float32 contígua com as linhas
+    pré-normalizadas, de modo que a consulta é um único produto matriz-vetor
+    seguido de `argpartition` para o top-k. Usuários menos recentes são
+    descartados quando o orçamento de memória (`max_bytes`) é excedido.
+
+    Entradas com pelo menos `ann_threshold` linhas ganham um índice IVF
+    (`core.ann_index`) persistido em `ann_dir`; abaixo disso a varredura exata
+    continua sendo usada.
+
+    Com `storage` float16/int8 as matrizes residentes são quantizadas e os
+    scores de `search` são aproximados; o chamador re-pontua os candidatos com
+    os vetores float32 (ver `DatabaseManager.get_semantic_memories`).
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ann_threshold=20000, ann_dir=None, nprobe=16, storage="float32"):
+        if storage not in _DTYPES:
+            raise ValueError(f"Modo de armazenamento desconhecido: {storage}")
+        self.storage = storage
+        self.max_bytes = max_bytes
+        self.ann_threshold = ann_threshold
+        self.ann_dir = ann_dir
+        self.nprobe = nprobe
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.metrics = {"hits": 0, "misses": 0, "evictions": 0, "exact_searches": 0, "ann_searches": 0}
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def load(self, key, rows):
+        """Constrói e registra a entrada de `key` a partir de linhas (id, content, embedding_blob)."""
+        return self.insert(key, self.build_entry(key, rows))
+
+    def build_entry(self, key, rows, dim=None):
+        """
+        Constrói a entrada de `key` sem registrá-la. Não toca no estado
+        compartilhado, então pode rodar fora do event loop (`asyncio.to_thread`).
+
+        `rows` são tuplas (id, content, embedding_blob[, norm[, embedding_q]]).
+        Linhas com `norm` preenchido já estão gravadas como vetores unitários e não
+        são renormalizadas; `embedding_q`, quando presente, já está no formato de
+        `self.storage` e é usado sem passar pelo float32.
+        """
+        ids, contents = [], []
+        float_pos, float_vecs = [], []
+        coded_pos, coded = [], []
+        for row in rows:
+            mem_id, content, blob = row[0], row[1], row[2]
+            qblob = row[4] if len(row) > 4 else None
+            if qblob is not None and self.storage != "float32":
+                codes, scale, offset = decode_blob(qblob, self.storage)
+                vec_dim = codes.shape[0]
+            elif blob is not None:
+                vec = np.frombuffer(blob, dtype=np.float32)
+                if len(row) < 4 or row[3] is None:
+                    vec = normalize(vec)
+                elif row[3] == 0.0:
+                    vec = None
+                if vec is None:
+                    continue
+                vec_dim = vec.shape[0]
+            else:
+                continue
+            if dim is None:
+                dim = vec_dim
+            elif vec_dim != dim:
+                # Blobs de dimensão diferente quebrariam o vstack; são ignorados
+                logger.debug(f"Memória {mem_id} ignorada: dimensão {vec_dim} != {dim}")
+                continue
+            if qblob is not None and self.storage != "float32":
+                coded_pos.append(len(ids))
+                coded.append((codes, scale, offset))
+            else:
+                float_pos.append(len(ids))
+                float_vecs.append(vec)
+            ids.append(mem_id)
+            contents.append(content)
+
+        entry = _Entry(dim or 0, capacity=len(ids), storage=self.storage)
+        if float_vecs:
+            codes, scales, offsets = quantize_rows(np.vstack(float_vecs), self.storage)
+            entry.matrix[float_pos] = codes
+            if scales is not None:
+                entry.scales[float_pos] = scales
+                entry.offsets[float_pos] = offsets
+        if coded:
+            entry.matrix[coded_pos] = np.vstack([c[0] for c in coded])
+            if entry.scales is not None:
+                entry.scales[coded_pos] = [c[1] for c in coded]
+                entry.offsets[coded_pos] = [c[2] for c in coded]
+        entry.ids = ids
+        entry.contents = contents
+        entry.count = len(ids)
+        entry.content_bytes = sum(len(c.encode("utf-8")) for c in contents)
+        if entry.count:
+            entry.total = entry.vectors().sum(axis=0)
+
+        if entry.count >= self.ann_threshold:
+            vectors = entry.vectors()
+            path = self._ann_path(key)
+            entry.ann = IVFIndex.load(path, entry.ids, vectors) if path else None
+            if entry.ann is None:
+                entry.ann = IVFIndex.build(vectors, nprobe=self.nprobe)
+                self._save_ann(key, entry)
+        return entry
+
+    def insert(self, key, entry):
+        self.discard(key)
+        self._entries[key] = entry
+        self._bytes += entry.nbytes
+        self._evict(keep=key)
+        return entry
+
+    def add(self, key, mem_id, content, vector):
+        """Atualiza incrementalmente uma entrada já carregada (no-op caso contrário)."""
+        entry = self._entries.get(key)
+        if entry is None or vector is None:
+            return
+        vec = normalize(vector)
+        if vec is None:
+            return
+        if entry.count == 0 and entry.dim != vec.shape[0]:
+            entry = self.insert(key, _Entry(vec.shape[0], storage=self.storage))
+        if vec.shape[0] != entry.dim:
+            logger.debug(f"Memória {mem_id} fora do índice: dimensão {vec.shape[0]} != {entry.dim}")
+            return
+        before = entry.nbytes
+        entry.append(mem_id, content, vec)
+        self._bytes += entry.nbytes - before
+        if entry.ann is not None:
+            if entry.count > 2 * entry.ann.built_rows:
+                # Listas desbalanceadas: volta à varredura exata até o próximo `prepare_ann`
+                entry.ann = None
+            else:
+                entry.ann.add(entry.count - 1, vec)
+        self._entries.move_to_end(key)
+        self._evict(keep=key)
+
+    def dim(self, key):
+        entry = self._entries.get(key)
+        return entry.dim if entry is not None else None
+
+    def ids(self, key):
+        entry = self._entries.get(key)
+        return entry.ids[:entry.count] if entry is not None else []
+
+    def centroid(self, key):
+        """(soma dos vetores unitários, quantidade) das memórias residentes de `key`, ou None."""
+        entry = self._entries.get(key)
+        return (entry.total, entry.count) if entry is not None else None
+
+    def size(self, key):
+        entry = self._entries.get(key)
+        return entry.count if entry is not None else 0
+
+    def needs_ann(self, key):
+        entry = self._entries.get(key)
+        return entry is not None and entry.ann is None and entry.count >= self.ann_threshold
+
+    def prepare_ann(self, key):
+        """Treina um IVF sobre um snapshot da entrada (seguro para rodar em thread)."""
+        entry = self._entries.get(key)
+        count = entry.count
+        return entry, IVFIndex.build(entry.vectors(slice(0, count)), nprobe=self.nprobe), count
+
+    def attach_ann(self, key, entry, ann, count):
+        """Anexa um IVF preparado, atribuindo as linhas inseridas durante o treino."""
+        if self._entries.get(key) is not entry:
+            return
+        for row in range(count, entry.count):
+            ann.add(row, entry.vectors([row])[0])
+        entry.ann = ann
+        self._save_ann(key, entry)
+
+    def _ann_path(self, key):
+        if not self.ann_dir:
+            return None
+        return os.path.join(self.ann_dir, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', key)}.ivf.npz")
+
+    def _save_ann(self, key, entry):
+        path = self._ann_path(key)
+        if not path:
+            return
+        try:
+            entry.ann.save(path, entry.ids)
+        except OSError as e:
+            logger.warning(f"Não foi possível salvar o índice ANN de {key}: {e}")
+
+    def discard(self, key=None):
+        """Remove uma entrada (ou todas, se `key` for None)."""
+        if key is None:
+            self._entries.clear()
+            self._bytes = 0
+            return
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+
+    def search(self, key, unit_query, limit=3, threshold=0.7, nprobe=None):
+        """
+        Retorna até `limit` tuplas (id, content, score) com score >= threshold.
+        `unit_query` precisa estar normalizado (ver `normalize`). Nos modos
+        quantizados o score é aproximado.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.metrics["misses"] += 1
+            return []
+        self.metrics["hits"] += 1
+        self._entries.move_to_end(key)
+
+        if entry.count == 0 or unit_query.shape[0] != entry.dim or limit <= 0:
+            return []
+
+        if entry.ann is not None:
+            self.metrics["ann_searches"] += 1
+            rows = entry.ann.candidates(unit_query, nprobe=nprobe)
+            scores = entry.scores(unit_query, rows)
+        else:
+            self.metrics["exact_searches"] += 1
+            rows = None
+            scores = entry.scores(unit_query)
+
+        top, top_scores = select_top_k(scores, limit, threshold)
+        positions = rows[top] if rows is not None else top
+        return [(entry.ids[p], entry.contents[p], float(s)) for p, s in zip(positions, top_scores)]
+
+    def score_ids(self, key, unit_query, mem_ids):
+        """Scores de memórias específicas (ex.: candidatos do FTS), sem varrer a matriz."""
+        entry = self._entries.get(key)
+        if entry is None or entry.count == 0 or unit_query.shape[0] != entry.dim:
+            return []
+        rows = entry.positions(mem_ids)
+        if rows.size == 0:
+            return []
+        scores = entry.scores(unit_query, rows)
+        return [(entry.ids[p], entry.contents[p], float(s)) for p, s in zip(rows, scores)]
+
+    def _evict(self, keep=None):
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            # A entrada recém-usada (`keep`) nunca é descartada
+            key = next(k for k in self._entries if k != keep)
+            entry = self._entries.pop(key)
+            self._bytes -= entry.nbytes
+            self.metrics["evictions"] += 1
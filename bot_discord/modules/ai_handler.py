@@ -1,9 +1,14 @@
 # ai_handler.py
+import asyncio
 import logging
 import json
 import re
 from typing import List, Dict, Any, AsyncGenerator, Optional, Tuple
+from core.config import Config
 from core.llm_provider import LMStudioProvider, OllamaProvider, LlamaCppProvider
+from core.response_cache import LLMResponseCache
+from modules.context_builder import ContextBuilder, TokenCounter
+from core.llm_scheduler import PRIORITY_INTERACTIVE, PRIORITY_EXTRACTION, PRIORITY_SUMMARIZATION
 
 logger = logging.getLogger(__name__)
 
@@ -19,20 +24,45 @@ class AIHandler:
         """
         self.config = config
         backend = config.get_config_value("llm_backend", "lm_studio")
+        # Concurrent requests allowed by the backend (llama.cpp --parallel / LM Studio slots)
+        slots = int(config.get_config_value("llm_parallel_slots", 1))
         
+        flags = ""
         if backend == "llama_cpp":
+            # The server runs with the -np from its flags (or the --parallel we append); follow it
+            flags = config.get_config_value("llama_server_flags", "")
+            slots = Config._parallel_from_flags(flags, slots)
             host = config.get_config_value("llama_server_host", "127.0.0.1")
             port = config.get_config_value("llama_server_port", 8080)
             api_url = f"http://{host}:{port}/v1"
-            self.provider = LlamaCppProvider(api_url, "local-model")
+            self.provider = LlamaCppProvider(api_url, "local-model", slots=slots)
         elif backend == "ollama":
             api_url = config.get_config_value("ollama_api_url", "http://localhost:11434/v1")
             model = config.get_config_value("ollama_model", "ministral-3:3b")
-            self.provider = OllamaProvider(api_url, model)
+            self.provider = OllamaProvider(api_url, model, slots=slots)
         else:
             api_url = config.get_config_value("lm_studio_api_url", "http://localhost:1234/v1")
             model = config.get_config_value("ai_model", "ministral-3:3b")
-            self.provider = LMStudioProvider(api_url, model)
+            self.provider = LMStudioProvider(api_url, model, slots=slots)
+            
+        # Token-budgeted prompt assembly; llama.cpp exposes /tokenize for exact counts
+        tokenize_url = f"http://{host}:{port}/tokenize" if backend == "llama_cpp" else None
+        context_tokens = int(config.get_config_value("llm_context_tokens", 4096))
+        if backend == "llama_cpp":
+            # llama-server splits -c across its parallel slots
+            context_tokens = Config.context_per_slot(context_tokens, slots, flags)
+        # Never reserve more than half of the (per-slot) window for the reply
+        self.reply_tokens = min(int(config.get_config_value("llm_reply_tokens", 1024)), max(128, context_tokens // 2))
+        # llama.cpp reuses the KV cache of a matching prompt prefix, so keep the prefix stable there
+        self.context_builder = ContextBuilder(
+            TokenCounter(tokenize_url), budget=max(512, context_tokens - self.reply_tokens),
+            stable_prefix=backend == "llama_cpp"
+        )
+        self.last_context_usage: Dict[str, int] = {}
+
+        # Opt-in cache for deterministic background calls (extraction / summaries), stored in the bot database
+        if config.get_config_value("llm_response_cache", False) is True and getattr(config, "db", None) is not None:
+            self.provider.response_cache = LLMResponseCache(config.db)
             
         logger.info(f"LLM Backend: {self.provider.name} | URL: {self.provider.api_url}")
 
@@ -51,27 +81,14 @@ class AIHandler:
         except Exception:
             logger.error(f"Failed to connect to {self.provider.name} at {self.provider.api_url}")
 
-    def _trim_context(self, messages: List[Dict[str, str]], max_msgs: int = 14) -> List[Dict[str, str]]:
+    async def close(self) -> None:
         """
-        Prunes message history to stay within context limits while preserving the system prompt.
-        
-        Args:
-            messages: Full list of context messages.
-            max_msgs: Number of recent messages to keep.
-            
-        Returns:
-            Trimmed list of messages.
-            
-        Big (O): O(N) - Linear pass to filter system messages and slice the recent history.
+        Closes the HTTP sessions of the token counter and of the provider (bot shutdown).
+
+        Big (O): O(1).
         """
-        if len(messages) <= 10:
-            return messages
-        
-        system_msg = [m for m in messages if m['role'] == 'system']
-        chat_msgs = [m for m in messages if m['role'] != 'system']
-        
-        # Preserve system prompt + last N messages
-        return system_msg + chat_msgs[-max_msgs:]
+        await self.context_builder.counter.close()
+        await self.provider.close()
 
     def _sanitize_context(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
         """
@@ -99,7 +116,7 @@ class AIHandler:
                 
         return sanitized
 
-    async def generate_response_stream(self, prompt: str, personality: Optional[str] = None, context: Optional[List[Dict[str, str]]] = None) -> AsyncGenerator[str, None]:
+    async def generate_response_stream(self, prompt: str, personality: Optional[str] = None, context: Optional[List[Dict[str, str]]] = None, user_id: Optional[str] = None, memories: Optional[List[str]] = None, journal: Optional[List[str]] = None, cancel_token: Optional[Any] = None) -> AsyncGenerator[str, None]:
         """
         Prepares context and generates a streaming response from the provider.
         
@@ -107,26 +124,29 @@ class AIHandler:
             prompt: User message.
             personality: System prompt for the persona.
             context: Short-term conversation history.
+            user_id: Requesting user, for fair queuing in the LLM scheduler.
+            memories: Retrieved long-term memories.
+            journal: Summaries of earlier conversations.
+            cancel_token: Optional CancellationToken; cancelling it closes the backend stream.
             
         Yields:
             Response chunks (tokens).
             
         Big (O): O(N + LLM_Inference) - N is context size. Inference time is the dominant bottleneck.
         """
-        messages = []
-        if personality:
-            messages.append({"role": "system", "content": personality})
-        if context:
-            messages.extend(context)
-        messages.append({"role": "user", "content": prompt})
-        
-        # Optimize context before sending to LLM
-        messages = self._trim_context(self._sanitize_context(messages))
+        # Fill the token budget by priority: persona > prompt > memories > journal > history
+        messages, self.last_context_usage = await self.context_builder.build(
+            prompt, personality, memories, journal, self._sanitize_context(context or []), cache_key=user_id
+        )
+        messages = self._sanitize_context(messages)
+        logger.debug(f"Context tokens: {self.last_context_usage}")
         
-        async for chunk in self.provider.generate_stream(messages):
+        async for chunk in self.provider.generate_stream(
+            messages, max_tokens=self.reply_tokens, priority=PRIORITY_INTERACTIVE, user_id=user_id, cancel_token=cancel_token
+        ):
             yield chunk
 
-    async def detect_memory_triggers(self, text: str, memory_module: Any, user_id: str) -> bool:
+    async def detect_memory_triggers(self, text: str, memory_module: Any, user_id: str, pipeline: Optional[Any] = None) -> bool:
         """
         Analyzes user input to extract facts for permanent memory.
         
@@ -134,11 +154,12 @@ class AIHandler:
             text: Input text to analyze.
             memory_module: The memory cog instance.
             user_id: Discord ID of the user.
+            pipeline: Optional per-message context; facts identical to the message reuse its embedding.
             
         Returns:
             True if facts were extracted and saved.
             
-        Big (O): O(LLM_Inference + M) - Requires a separate LLM call. M is number of facts.
+        Big (O): O(LLM_Inference + M) - Requires a separate LLM call. M is number of facts, embedded in a single batch.
         """
         extract_prompt = (
             "Extraia fatos importantes sobre o usuário da frase abaixo. "
@@ -146,15 +167,19 @@ class AIHandler:
             f"Frase: '{text}'"
         )
         try:
-            response = await self.provider.generate([{"role": "user", "content": extract_prompt}], max_tokens=128)
+            response = await self.provider.generate(
+                [{"role": "user", "content": extract_prompt}], max_tokens=128, temperature=0.0,
+                priority=PRIORITY_EXTRACTION, user_id=user_id
+            )
             # Find JSON array using regex for robustness
             match = re.search(r"\[.*\]", response.replace("\n", ""))
             if match:
                 facts = json.loads(match.group(0))
                 if isinstance(facts, list) and facts:
-                    for fact in facts:
-                        # Background task for memory storage is handled by the caller or here
-                        await memory_module.store_permanent_info(user_id, fact)
+                    # Stored concurrently so the embedding service encodes all facts in one batch
+                    stores = (memory_module.store_permanent_info(user_id, fact, pipeline=pipeline) if pipeline
+                              else memory_module.store_permanent_info(user_id, fact) for fact in facts)
+                    await asyncio.gather(*stores)
                     return True
         except Exception as e:
             logger.debug(f"Memory extraction failed: {e}")
@@ -197,4 +222,5 @@ class AIHandler:
         formatted_history = "\n".join([f"{m['role']}: {m['content']}" for m in history])
         prompt = f"Resuma a conversa abaixo em um parágrafo curto:\n\n{formatted_history}"
         
-        return await self.provider.generate([{"role": "user", "content": prompt}], max_tokens=256)
+        # Background work: yields to interactive chat in the scheduler
+        return await self.provider.generate([{"role": "user", "content": prompt}], max_tokens=256, priority=PRIORITY_SUMMARIZATION, cacheable=True)
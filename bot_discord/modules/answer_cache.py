@@ -0,0 +1,118 @@
+# answer_cache.py
+import hashlib
+import logging
+import time
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.embeddings import EmbeddingManager
+
+logger = logging.getLogger(__name__)
+
+
+def persona_key(identity_json: Optional[str], personality_json: Optional[str]) -> str:
+    """
+    Stable identifier of a persona, derived from its stored JSON pillars.
+
+    Big (O): O(L) - L is the length of the JSON strings.
+    """
+    if identity_json is None and personality_json is None:
+        return "default"
+    return hashlib.sha1(f"{identity_json}\x00{personality_json}".encode("utf-8")).hexdigest()[:16]
+
+
+class AnswerCache:
+    def __init__(self, enabled: bool = False, threshold: float = 0.95, ttl: float = 3600.0, max_entries: int = 500):
+        """
+        Semantic cache of generated answers, shared by all users of the same persona.
+
+        A question whose embedding has cosine similarity >= `threshold` with a cached
+        question of the active persona reuses the stored answer instead of calling the LLM.
+
+        Big (O): O(1) - Constant time initialization.
+        """
+        self.enabled = enabled
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # persona -> (unit vectors N x D, [(answer, created_at)])
+        self._entries: Dict[str, Tuple[np.ndarray, List[Tuple[str, float]]]] = {}
+        self.active_persona: Optional[str] = None
+        self.metrics = {"lookups": 0, "hits": 0, "stores": 0, "invalidations": 0}
+
+    def _expire(self, persona: str) -> None:
+        """Drops entries older than the TTL. Big (O): O(N)."""
+        matrix, answers = self._entries[persona]
+        cutoff = time.time() - self.ttl
+        keep = [i for i, (_, created) in enumerate(answers) if created >= cutoff]
+        if len(keep) != len(answers):
+            self._entries[persona] = (matrix[keep], [answers[i] for i in keep])
+
+    def lookup(self, persona: str, query_vec: np.ndarray) -> Optional[str]:
+        """
+        Returns a cached answer for a near-identical question, or None.
+
+        Big (O): O(N * D) - One vectorized similarity pass over the persona's cached questions.
+        """
+        if not self.enabled:
+            return None
+        self.active_persona = persona
+        self.metrics["lookups"] += 1
+        if persona not in self._entries:
+            return None
+        self._expire(persona)
+        matrix, answers = self._entries[persona]
+        if not answers or matrix.shape[1] != np.asarray(query_vec).shape[-1]:
+            return None
+        top, scores = EmbeddingManager.top_k_similarity(query_vec, matrix, 1, self.threshold, normalized=False)[0]
+        if not len(top):
+            return None
+        self.metrics["hits"] += 1
+        logger.debug(f"Answer cache hit (similarity {scores[0]:.3f})")
+        return answers[top[0]][0]
+
+    def store(self, persona: str, query_vec: np.ndarray, answer: str) -> None:
+        """
+        Caches an answer; the oldest entry is evicted beyond `max_entries`.
+
+        Big (O): O(N * D) - Copy-on-append of the persona's matrix.
+        """
+        if not self.enabled or not answer:
+            return
+        self.active_persona = persona
+        vec = np.asarray(query_vec, dtype=np.float32)
+        matrix, answers = self._entries.get(persona, (np.empty((0, vec.shape[0]), dtype=np.float32), []))
+        if matrix.shape[1] != vec.shape[0]:
+            matrix, answers = np.empty((0, vec.shape[0]), dtype=np.float32), []
+        matrix = np.vstack([matrix, vec[None, :]])[-self.max_entries:]
+        answers = (answers + [(answer, time.time())])[-self.max_entries:]
+        self._entries[persona] = (matrix, answers)
+        self.metrics["stores"] += 1
+
+    def invalidate(self, persona: Optional[str] = None) -> None:
+        """
+        Forgets cached answers of one persona (or all when None).
+
+        Big (O): O(1) - Dictionary removal.
+        """
+        if persona is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(persona, None)
+        self.metrics["invalidations"] += 1
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of lookups answered from the cache. Big (O): O(1)."""
+        return self.metrics["hits"] / self.metrics["lookups"] if self.metrics["lookups"] else 0.0
+
+    @staticmethod
+    async def replay(answer: str, chunk_size: int = 40) -> AsyncGenerator[str, None]:
+        """
+        Streams a cached answer in chunks, mimicking the provider's stream.
+
+        Big (O): O(L) - L is the answer length.
+        """
+        for start in range(0, len(answer), chunk_size):
+            yield answer[start:start + chunk_size]
@@ -2,7 +2,6 @@
 import discord
 from discord.ext import commands
 import json
-import psutil
 import os
 import logging
 from typing import Optional
@@ -58,10 +57,13 @@ class CommandHandler(commands.Cog):
     @commands.command(name='status')
     async def status(self, ctx):
         """
-        Displays system resource usage and AI backend status.
+        Displays system resource usage, AI backend status and internal metrics.
         
-        Big (O): O(1) - Rapid syscalls for CPU/RAM and single DB lookup.
+        Big (O): O(1) - Rapid syscalls for CPU/RAM, single DB lookup and counter formatting.
         """
+        # Imported on demand: only this command needs psutil
+        import psutil
+
         # psutil calls are efficient C-level lookups
         cpu = psutil.cpu_percent()
         ram = psutil.virtual_memory().percent
@@ -82,6 +84,13 @@ class CommandHandler(commands.Cog):
         embed.add_field(name="💻 CPU", value=f"{cpu}%")
         embed.add_field(name="🧠 RAM", value=f"{ram}%")
         embed.add_field(name="🤖 AI", value=ai_status, inline=False)
+
+        # Queues, caches and embedding batches (the same lines go to the periodic metrics log)
+        owner = getattr(self.bot, 'owner_instance', None)
+        lines = owner.metrics_report() if hasattr(owner, 'metrics_report') else []
+        if lines:
+            # Embed field values are capped at 1024 characters
+            embed.add_field(name="📈 Métricas", value="\n".join(lines)[:1024], inline=False)
         await ctx.send(embed=embed)
 
     @commands.command(name='limpar')
@@ -0,0 +1,269 @@
+# context_builder.py
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Chat-template overhead per message (role markers, separators)
+MESSAGE_OVERHEAD = 4
+
+
+class TokenCounter:
+    def __init__(self, tokenize_url: Optional[str] = None, cache_size: int = 4096, retry_after: float = 30.0):
+        """
+        Counts tokens with the backend's `/tokenize` endpoint (llama.cpp) when available,
+        falling back to a byte-length estimate. Counts are cached per text hash.
+        After a failed call the endpoint is skipped for `retry_after` seconds, then tried again
+        (the server may still be starting when the first messages arrive).
+
+        Big (O): O(1) - Constant time initialization.
+        """
+        self.tokenize_url = tokenize_url
+        self.cache_size = cache_size
+        self.retry_after = retry_after
+        self._retry_at = 0.0
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._session = None
+        self.metrics = {"hits": 0, "misses": 0, "remote": 0, "estimated": 0}
+
+    @staticmethod
+    def estimate(text: str) -> int:
+        """
+        Local estimate (~4 UTF-8 bytes per token), slightly pessimistic for Portuguese.
+
+        Big (O): O(L) - L is the text length.
+        """
+        return max(1, (len(text.encode("utf-8")) + 3) // 4)
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, count: int) -> None:
+        self._cache[key] = count
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def count(self, text: str) -> int:
+        """
+        Synchronous count: cached value or local estimate.
+
+        Big (O): O(L) - Hashing the text.
+        """
+        key = self._key(text)
+        if key in self._cache:
+            self.metrics["hits"] += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        self.metrics["misses"] += 1
+        self.metrics["estimated"] += 1
+        return self.estimate(text)
+
+    async def _tokenize(self, text: str) -> Optional[int]:
+        import aiohttp
+        try:
+            if self._session is None or self._session.closed:
+                self._session = aiohttp.ClientSession()
+            async with self._session.post(self.tokenize_url, json={"content": text}, timeout=5) as response:
+                if response.status == 200:
+                    return len((await response.json())["tokens"])
+                logger.debug(f"/tokenize returned {response.status}; using estimates")
+        except Exception as e:
+            logger.debug(f"/tokenize unavailable ({e}); using estimates")
+        # Down or still starting: estimate this call and retry after the cooldown
+        self._retry_at = time.monotonic() + self.retry_after
+        return None
+
+    @property
+    def remote_available(self) -> bool:
+        """Whether the next count may use `/tokenize`. Big (O): O(1)."""
+        return bool(self.tokenize_url) and time.monotonic() >= self._retry_at
+
+    async def count_many(self, texts: List[str]) -> List[int]:
+        """
+        Counts several texts; uncached ones are tokenized concurrently by the backend.
+
+        Big (O): O(T) - T is the total text length; one HTTP call per new distinct text.
+        """
+        keys = [self._key(t) for t in texts]
+        missing = {k: t for k, t in zip(keys, texts) if k not in self._cache}
+        self.metrics["hits"] += len(texts) - len(missing)
+        self.metrics["misses"] += len(missing)
+        if missing and self.remote_available:
+            counts = await asyncio.gather(*(self._tokenize(t) for t in missing.values()))
+            for key, count in zip(list(missing), counts):
+                if count is not None:
+                    self.metrics["remote"] += 1
+                    self._remember(key, count)
+                    del missing[key]
+        for key, text in missing.items():
+            self.metrics["estimated"] += 1
+            self._remember(key, self.estimate(text))
+        return [self._cache[k] for k in keys]
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+class ContextBuilder:
+    def __init__(self, counter: TokenCounter, budget: int = 3072, stable_prefix: bool = False, refill_ratio: float = 0.75):
+        """
+        Assembles the prompt within a token budget, filling sections by priority:
+        persona > current message > retrieved memories > journal > recent history.
+
+        With `stable_prefix`, the layout favours the backend's prompt (KV) cache: the system
+        message holds only the persona, per-turn memories/journal move next to the current
+        message, and the history window start is kept across turns, sliding forward only when
+        it overflows (then refilled to `refill_ratio` of the room left, so it does not slide
+        again on the very next turn).
+
+        Big (O): O(1) - Constant time initialization.
+        """
+        self.counter = counter
+        self.budget = budget
+        self.stable_prefix = stable_prefix
+        self.refill_ratio = refill_ratio
+        # cache_key -> key of the oldest history message kept in the previous turn
+        self._anchors: "OrderedDict[str, str]" = OrderedDict()
+
+    async def build(
+        self,
+        prompt: str,
+        personality: Optional[str] = None,
+        memories: Optional[List[str]] = None,
+        journal: Optional[List[str]] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        cache_key: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """
+        Returns (messages, tokens used per section).
+
+        Memories and journal entries are appended to the system prompt while they fit;
+        history is added newest-first and then restored to chronological order. A prompt
+        larger than the room left after the persona keeps only its end (see `_truncate`).
+        `cache_key` (usually the user id) identifies the conversation for `stable_prefix`.
+
+        Big (O): O(N) - N is the number of candidate texts (counts are cached across calls).
+        """
+        memories, journal, history = memories or [], journal or [], history or []
+        texts = [personality or "", prompt] + [f"- {m}" for m in memories] + [f"- {j}" for j in journal] + [h["content"] for h in history]
+        counts = await self.counter.count_many(texts)
+        persona_tokens, prompt_tokens = counts[0], counts[1]
+        memory_counts = counts[2:2 + len(memories)]
+        journal_counts = counts[2 + len(memories):2 + len(memories) + len(journal)]
+        history_counts = counts[2 + len(memories) + len(journal):]
+
+        persona_used = persona_tokens + MESSAGE_OVERHEAD if personality else 0
+        prompt_room = max(1, self.budget - persona_used - MESSAGE_OVERHEAD)
+        if prompt_tokens > prompt_room:
+            logger.warning(f"Prompt with {prompt_tokens} tokens truncated to the {prompt_room} left in the budget")
+            prompt, prompt_tokens = await self._truncate(prompt, prompt_tokens, prompt_room)
+
+        used = {"persona": persona_used, "prompt": prompt_tokens + MESSAGE_OVERHEAD}
+        remaining = self.budget - used["persona"] - used["prompt"]
+
+        def take(items, item_counts, header):
+            nonlocal remaining
+            chosen, spent = [], 0
+            header_tokens = self.counter.estimate(header)
+            for item, count in zip(items, item_counts):
+                cost = count + (0 if chosen else header_tokens)
+                if cost > remaining:
+                    break
+                chosen.append(item)
+                spent += cost
+                remaining -= cost
+            return chosen, spent
+
+        memory_header = "\n\nMemórias relevantes:"
+        journal_header = "\n\nResumo de conversas anteriores:"
+        kept_memories, used["memories"] = take(memories, memory_counts, memory_header)
+        kept_journal, used["journal"] = take(journal, journal_counts, journal_header)
+
+        start = self._history_start(history, history_counts, remaining, cache_key)
+        kept_history = history[start:]
+        used["history"] = sum(history_counts[start:]) + MESSAGE_OVERHEAD * len(kept_history)
+
+        context = ""
+        if kept_memories:
+            context += memory_header + "".join(f"\n- {m}" for m in kept_memories)
+        if kept_journal:
+            context += journal_header + "".join(f"\n- {j}" for j in kept_journal)
+
+        if self.stable_prefix:
+            # Only the current turn changes: persona + history stay a byte-identical prefix
+            system = (personality or "").strip()
+            user_content = f"{context.strip()}\n\n{prompt}" if context else prompt
+        else:
+            system = ((personality or "") + context).strip()
+            user_content = prompt
+
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.extend(kept_history)
+        messages.append({"role": "user", "content": user_content})
+        used["total"] = sum(used.values())
+        return messages, used
+
+    async def _truncate(self, text: str, tokens: int, limit: int) -> Tuple[str, int]:
+        """
+        Keeps the end of `text` (the latest merged message, or the question after a paste)
+        within `limit` tokens. The cut is proportional to the count and re-counted, shrinking
+        until it fits.
+
+        Big (O): O(L) per attempt - L is the text length; at most a few attempts.
+        """
+        marker = "…"
+        while tokens > limit:
+            keep = int(len(text) * limit / tokens * 0.95) - len(marker)
+            if keep <= 0:
+                return marker, self.counter.estimate(marker)
+            text = marker + text[-keep:]
+            tokens = (await self.counter.count_many([text]))[0]
+        return text, tokens
+
+    @staticmethod
+    def _message_key(message: Dict[str, str]) -> str:
+        return hashlib.sha1(f"{message.get('role')}\x00{message.get('content')}".encode("utf-8")).hexdigest()
+
+    def _history_start(self, history: List[Dict[str, str]], counts: List[int], room: int, cache_key: Optional[str]) -> int:
+        """
+        Index of the oldest history message to keep.
+
+        Default: newest-first while it fits. With `stable_prefix`, the previous turn's start is
+        reused while everything from it still fits; on overflow the window is refilled to
+        `refill_ratio` of the room.
+
+        Big (O): O(H) - H is the number of history messages.
+        """
+        costs = [c + MESSAGE_OVERHEAD for c in counts]
+
+        def newest_first(limit):
+            start, spent = len(history), 0
+            while start > 0 and spent + costs[start - 1] <= limit:
+                start -= 1
+                spent += costs[start]
+            return start
+
+        if not self.stable_prefix or cache_key is None or not history:
+            return newest_first(room)
+
+        anchor = self._anchors.get(cache_key)
+        keys = [self._message_key(m) for m in history]
+        if anchor in keys:
+            start = keys.index(anchor)
+            if sum(costs[start:]) <= room:
+                self._anchors.move_to_end(cache_key)
+                return start
+        start = newest_first(int(room * self.refill_ratio))
+        if start < len(history):
+            self._anchors[cache_key] = keys[start]
+            self._anchors.move_to_end(cache_key)
+            while len(self._anchors) > self.counter.cache_size:
+                self._anchors.popitem(last=False)
+        return start
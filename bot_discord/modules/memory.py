@@ -1,8 +1,14 @@
 # memory.py
 import logging
+import os
+from contextlib import nullcontext
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 from core.embeddings import EmbeddingManager
+from core.embedding_cache import EmbeddingCache
+from modules.answer_cache import AnswerCache
+from modules.pipeline import MessageContext
+from modules.retrieval_gate import RetrievalGate
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +22,21 @@ class Memory:
         self.config = config
         self.db = db
         self.memory_limit = config.get_memory_limit()
-        self.embeddings = EmbeddingManager()
+        # Embedding cache lives next to the database so repeated texts skip model inference across restarts
+        db_path = getattr(db, "db_path", None)
+        cache_path = None
+        if isinstance(db_path, str) and db_path != ":memory:":
+            cache_path = os.path.join(os.path.dirname(db_path), "embedding_cache.db")
+        self.embeddings = EmbeddingManager(cache=EmbeddingCache(cache_path))
+        # Skips embedding + memory scan for greetings, laughter and bare mentions (and, opt-in,
+        # for queries far from every stored memory)
+        centroid_threshold = config.get_config_value("retrieval_centroid_threshold", None)
+        self.retrieval_gate = RetrievalGate(
+            min_tokens=int(config.get_config_value("retrieval_min_tokens", 1)),
+            centroid_threshold=float(centroid_threshold) if isinstance(centroid_threshold, (int, float)) else None,
+        )
+        # Opt-in semantic cache of generated answers, shared across users of the same persona
+        self.answer_cache = AnswerCache(enabled=config.get_config_value("answer_cache", False) is True)
         
         # Pre-compiled sets for O(1) average lookup performance in sentiment analysis
         self.POSITIVE_WORDS = {"obrigado", "vlw", "bom", "legal", "amo", "gosto", "feliz", "amigo", "curti"}
@@ -66,19 +86,22 @@ class Memory:
         
         return True
     
-    async def get_context(self, user_id: str, query_text: Optional[str] = None) -> Dict[str, Any]:
+    async def get_context(self, user_id: str, query_text: Optional[str] = None, pipeline: Optional[MessageContext] = None) -> Dict[str, Any]:
         """
         Retrieves complete context: History + RAG Memories + Journal Summaries.
         
         Args:
             user_id: Discord User ID.
             query_text: The current user message to use for semantic search.
+            pipeline: Optional per-message context; receives the query embedding and the
+                retrieved memory ids so later stages can reuse them.
             
         Returns:
             Context dictionary for the LLM.
             
         Big (O): O(H + S + (M * D)) - H: history size, S: summaries, M: total memories, D: vector dimensions.
-                Semantic search is vectorized via Numpy in the database layer.
+                Semantic search is vectorized via Numpy in the database layer; trivial messages
+                are rejected by the retrieval gate in O(L) before any model inference.
         """
         # Fetch history and summaries in parallel
         import asyncio
@@ -88,13 +111,25 @@ class Memory:
         history, summaries = await asyncio.gather(history_task, summaries_task)
         
         relevant_memories = []
-        if query_text:
-            # Embedding generation is the bottleneck here
-            query_vec = self.embeddings.get_embedding(query_text)
-            if query_vec is not None:
-                # Semantic retrieval using cosine similarity
-                mems = await self.db.get_semantic_memories(user_id, query_vec)
+        if query_text and self.retrieval_gate.should_retrieve(query_text):
+            query_vec = pipeline.embedding_for(query_text) if pipeline else None
+            if query_vec is None:
+                # Embedding generation is the bottleneck here; concurrent requests share one batched encode
+                with pipeline.stage("embedding") if pipeline else nullcontext():
+                    query_vec = await self.embeddings.aget_embedding(query_text)
+                if pipeline and query_vec is not None and pipeline.normalized_text:
+                    pipeline.query_embedding = query_vec
+            centroids = []
+            if query_vec is not None and self.retrieval_gate.centroid_threshold is not None:
+                # Centroids come from the resident indexes, so memories from earlier runs count too
+                centroids = await self.db.memory_centroids(user_id, len(query_vec))
+            if query_vec is not None and self.retrieval_gate.matches_centroids(query_vec, centroids):
+                # Hybrid retrieval: cosine similarity fused with FTS5 lexical matches
+                with pipeline.stage("retrieval") if pipeline else nullcontext():
+                    mems = await self.db.get_semantic_memories(user_id, query_vec, query_text=query_text)
                 relevant_memories = [m[0] for m in mems]
+                if pipeline:
+                    pipeline.retrieved_memory_ids = [m[2] for m in mems if len(m) > 2]
         
         return {
             "history": history,
@@ -118,13 +153,16 @@ class Memory:
             await self.db.clear_history(user_id)
             logger.debug("History summarized and cleared.")
 
-    async def store_permanent_info(self, user_id: str, content: str, importance: int = 1) -> bool:
+    async def store_permanent_info(self, user_id: str, content: str, importance: int = 1, pipeline: Optional[MessageContext] = None) -> bool:
         """
         Stores a fact in long-term vector memory.
         
-        Big (O): O(Embed) - Dominant cost is the model encoding.
+        Big (O): O(Embed) - Dominant cost is the model encoding (batched with concurrent callers),
+                skipped when the pipeline already embedded the same text.
         """
-        embedding = self.embeddings.get_embedding(content)
+        embedding = pipeline.embedding_for(content) if pipeline else None
+        if embedding is None:
+            embedding = await self.embeddings.aget_embedding(content)
         await self.db.add_memory(user_id, content, importance, embedding)
         return True
 
@@ -0,0 +1,66 @@
+# pipeline.py
+import time
+import unicodedata
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """
+    Canonical form used to compare message texts (NFC, collapsed whitespace).
+
+    Big (O): O(L) - L is the text length.
+    """
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+@dataclass
+class MessageContext:
+    """
+    Per-message pipeline state shared by every stage that handles one user message.
+
+    Stages store what they compute (query embedding, retrieved memory ids, ...) so later
+    stages reuse it instead of recomputing, and each stage's wall time is recorded.
+    """
+    user_id: str
+    text: str
+    normalized_text: str = ""
+    token_count: int = 0
+    query_embedding: Optional[np.ndarray] = None
+    retrieved_memory_ids: List[int] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def __post_init__(self):
+        """Derives the cheap text artifacts once. Big (O): O(L)."""
+        self.normalized_text = normalize_text(self.text)
+        self.token_count = len(self.normalized_text.split())
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Times a pipeline stage; repeated stages accumulate.
+
+        Big (O): O(1) - Two clock reads.
+        """
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def embedding_for(self, text: str) -> Optional[np.ndarray]:
+        """
+        Returns the already computed query embedding when `text` is the message itself.
+
+        Big (O): O(L) - One normalization and string comparison.
+        """
+        if self.query_embedding is not None and normalize_text(text) == self.normalized_text:
+            return self.query_embedding
+        return None
+
+    def report(self) -> str:
+        """Compact per-stage timing summary for logs. Big (O): O(S) - S stages."""
+        return " | ".join(f"{name}: {ms:.1f}ms" for name, ms in self.timings.items())
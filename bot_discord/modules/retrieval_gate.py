@@ -0,0 +1,91 @@
+# retrieval_gate.py
+import logging
+import re
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Greetings, acknowledgements and fillers that never need long-term memory
+FILLER_WORDS = {
+    "oi", "oii", "olá", "ola", "opa", "eae", "eai", "salve", "hey", "ok", "okay", "blz", "beleza",
+    "valeu", "vlw", "obg", "obrigado", "obrigada", "tmj", "sim", "não", "nao", "s", "n", "hm", "hmm",
+    "ah", "aham", "uhum", "ué", "ue", "tá", "ta", "certo", "show", "top", "boa", "bom", "dia", "tarde",
+    "noite", "tchau", "flw", "falou", "e", "aí", "ai",
+}
+STOP_PHRASES = {"bom dia", "boa tarde", "boa noite", "tudo bem", "tudo bom", "e aí", "e ai", "de nada"}
+_LAUGHTER = re.compile(r"^(k{2,}|(ha){2,}h?|(he){2,}h?|(hi){2,}h?|rs+|lol|kek)$")
+_MENTION = re.compile(r"<[@#!&:][^>]*>")
+_WORD = re.compile(r"\w+")
+
+
+class RetrievalGate:
+    def __init__(self, min_tokens: int = 1, centroid_threshold: Optional[float] = None):
+        """
+        Cheap pre-gate deciding whether a message is worth an embedding + memory scan.
+
+        Args:
+            min_tokens: Minimum number of content tokens (after removing fillers/laughter).
+            centroid_threshold: If set, skip the memory scan when the query's similarity to the
+                centroid of every searched store (the user's and the global memories) is below this value.
+
+        Big (O): O(1) - Constant time initialization.
+        """
+        self.min_tokens = min_tokens
+        self.centroid_threshold = centroid_threshold
+        self.metrics = {"checked": 0, "skipped_empty": 0, "skipped_trivial": 0, "skipped_centroid": 0, "passed": 0}
+
+    def content_tokens(self, text: str) -> list:
+        """
+        Tokens that carry meaning: mentions, fillers and laughter are removed.
+
+        Big (O): O(L) - L is the message length (single regex pass + set lookups).
+        """
+        words = _WORD.findall(_MENTION.sub(" ", text).lower())
+        return [w for w in words if w not in FILLER_WORDS and not _LAUGHTER.match(w)]
+
+    def should_retrieve(self, text: Optional[str]) -> bool:
+        """
+        Text-only decision, taken before any model inference.
+
+        Big (O): O(L) - L is the message length.
+        """
+        self.metrics["checked"] += 1
+        normalized = " ".join(_WORD.findall(_MENTION.sub(" ", text or "").lower()))
+        if not normalized:
+            self.metrics["skipped_empty"] += 1
+            return False
+        if normalized in STOP_PHRASES or len(self.content_tokens(normalized)) < self.min_tokens:
+            self.metrics["skipped_trivial"] += 1
+            return False
+        return True
+
+    def matches_centroids(self, query_vec: np.ndarray, centroids: Sequence[Tuple[np.ndarray, int]]) -> bool:
+        """
+        Optional second stage: compares the query embedding with the centroid of each store
+        that would be searched, given as (sum of unit vectors, count) pairs kept by the
+        resident indexes. The scan is skipped only when no store is close enough; with the
+        check disabled (or no stored memories) the query always passes.
+
+        Big (O): O(S * D) - One dot product per store (S is at most 2: user and global).
+        """
+        if self.centroid_threshold is not None and centroids:
+            norm = np.linalg.norm(query_vec)
+            close = False
+            for total, count in centroids:
+                mean_norm = np.linalg.norm(total)
+                if not norm or not mean_norm or float(total @ query_vec) / (norm * mean_norm) >= self.centroid_threshold:
+                    close = True
+                    break
+            if not close:
+                self.metrics["skipped_centroid"] += 1
+                return False
+        self.metrics["passed"] += 1
+        return True
+
+    @property
+    def skip_ratio(self) -> float:
+        """Share of checked messages that skipped retrieval. Big (O): O(1)."""
+        skipped = self.metrics["skipped_empty"] + self.metrics["skipped_trivial"] + self.metrics["skipped_centroid"]
+        return skipped / self.metrics["checked"] if self.metrics["checked"] else 0.0
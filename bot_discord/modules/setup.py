@@ -6,6 +6,8 @@ import asyncio
 import logging
 from typing import Dict, Any
 
+from modules.answer_cache import persona_key
+
 logger = logging.getLogger(__name__)
 
 class CharacterWizard(commands.Cog):
@@ -70,28 +72,26 @@ class CharacterWizard(commands.Cog):
         Args:
             r: Dictionary containing all 7 pillars data.
             
-        Big (O): O(1) - Single transaction with fixed number of fields.
-        """
-        # Deactivate previous profiles in one step
-        await self.db._db.execute("UPDATE character_profiles SET is_active = 0")
-        
-        query = """
-            INSERT INTO character_profiles 
-            (identity_json, personality_json, history_json, emotions_json, social_json, interaction_json, technical_json, is_active)
-            VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+        Big (O): O(1) - Single transaction with fixed number of fields, plus answer cache invalidation.
         """
-        
         # Serialize all components to JSON (O(1) given small fixed keys)
-        await self.db._db.execute(query, (
-            json.dumps(r['identity']),
-            json.dumps(r['personality']),
+        identity_json = json.dumps(r['identity'])
+        personality_json = json.dumps(r['personality'])
+        # Goes through the write-behind buffer so it never commits a half-written group commit
+        await self.db.save_active_profile(
+            identity_json,
+            personality_json,
             json.dumps(r['history']),
             json.dumps(r['emotions']),
             json.dumps(r['social']),
             json.dumps(r['interaction']),
             json.dumps(r['technical'])
-        ))
-        await self.db._db.commit()
+        )
+
+        # Cached answers were written in the previous persona's voice
+        answer_cache = self.memory.answer_cache
+        answer_cache.invalidate(answer_cache.active_persona)
+        answer_cache.invalidate(persona_key(identity_json, personality_json))
 
 async def setup(bot):
     # Cog loading handled via bot.py
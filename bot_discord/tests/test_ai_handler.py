@@ -4,14 +4,18 @@ from unittest.mock import AsyncMock, MagicMock
 from bot_discord.modules.ai_handler import AIHandler
 
 
-def test_trim_context_keeps_system_and_last_messages():
-    handler = AIHandler(config=MagicMock())
-    messages = [{"role": "system", "content": "sys"}] + [
-        {"role": "user", "content": f"msg{i}"} for i in range(20)
-    ]
-    trimmed = handler._trim_context(messages, max_tokens=12000)
-    assert trimmed[0]["role"] == "system"
-    assert len(trimmed) <= 15
+def test_context_keeps_system_and_last_messages():
+    async def run_test():
+        handler = AIHandler(config=MagicMock())
+        handler.context_builder.budget = 60
+        history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"msg{i}"} for i in range(20)]
+        messages, _ = await handler.context_builder.build("agora", personality="sys", history=history)
+        assert messages[0] == {"role": "system", "content": "sys"}
+        assert messages[-1]["content"] == "agora"
+        assert messages[-2]["content"] == "msg19"
+        assert len(messages) < len(history) + 2
+
+    asyncio.run(run_test())
 
 
 def test_detect_memory_triggers_adds_memory():
@@ -0,0 +1,44 @@
+import numpy as np
+
+from bot_discord.core.ann_index import IVFIndex
+from bot_discord.core.vector_index import VectorIndex, normalize
+
+
+def _unit_rows(rows, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    matrix = rng.standard_normal((rows, dim)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def test_ivf_candidates_contain_exact_match():
+    matrix = _unit_rows(500)
+    index = IVFIndex.build(matrix, n_lists=10, nprobe=3)
+
+    rows = index.candidates(matrix[42])
+    assert 42 in rows
+    assert len(rows) < 500
+
+
+def test_ivf_load_reuses_saved_prefix(tmp_path):
+    matrix = _unit_rows(300)
+    path = str(tmp_path / "u1.ivf.npz")
+    ids = list(range(1, 301))
+    built = IVFIndex.build(matrix[:200], n_lists=8)
+    built.save(path, ids[:200])
+
+    loaded = IVFIndex.load(path, ids, matrix)
+    assert loaded.n_rows == 300
+    assert np.array_equal(loaded.assignments()[:200], built.assignments())
+    assert IVFIndex.load(path, [999] + ids[1:], matrix) is None
+
+
+def test_vector_index_uses_ann_above_threshold(tmp_path):
+    matrix = _unit_rows(400)
+    rows = [(i, f"fato {i}", matrix[i].tobytes()) for i in range(400)]
+    index = VectorIndex(ann_threshold=100, ann_dir=str(tmp_path))
+    index.load("u1", rows)
+
+    results = index.search("u1", normalize(matrix[7]), limit=1, threshold=0.5)
+    assert results[0][0] == 7
+    assert index.metrics["ann_searches"] == 1
+    assert (tmp_path / "u1.ivf.npz").exists()
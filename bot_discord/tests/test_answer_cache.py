@@ -0,0 +1,32 @@
+import asyncio
+
+import numpy as np
+
+from bot_discord.modules.answer_cache import AnswerCache, persona_key
+
+
+def test_hit_requires_same_persona_and_high_similarity():
+    cache = AnswerCache(enabled=True, threshold=0.95)
+    question = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+    cache.store("p1", question, "Este servidor é sobre jogos.")
+
+    assert cache.lookup("p1", np.array([0.99, 0.05, 0.0], dtype=np.float32)) == "Este servidor é sobre jogos."
+    assert cache.lookup("p1", np.array([0.7, 0.7, 0.0], dtype=np.float32)) is None
+    assert cache.lookup("p2", question) is None
+    assert cache.metrics["hits"] == 1 and cache.metrics["lookups"] == 3
+
+    cache.invalidate("p1")
+    assert cache.lookup("p1", question) is None
+    assert AnswerCache(enabled=False).lookup("p1", question) is None
+
+
+def test_ttl_expiry_and_replay():
+    cache = AnswerCache(enabled=True, ttl=-1)
+    cache.store("p", np.ones(2, dtype=np.float32), "resposta")
+    assert cache.lookup("p", np.ones(2, dtype=np.float32)) is None
+
+    async def collect():
+        return [chunk async for chunk in AnswerCache.replay("abcdef", chunk_size=4)]
+
+    assert asyncio.run(collect()) == ["abcd", "ef"]
+    assert persona_key('{"name": "A"}', "{}") != persona_key('{"name": "B"}', "{}")
@@ -1,34 +1,17 @@
 import asyncio
 import json
-from types import SimpleNamespace
 from unittest.mock import AsyncMock, MagicMock
 
 from bot_discord.core.bot import DiscordBot
 
 
-class AsyncCursor:
-    def __init__(self, row):
-        self._row = row
-
-    async def __aenter__(self):
-        return self
-
-    async def __aexit__(self, exc_type, exc, tb):
-        return False
-
-    async def fetchone(self):
-        return self._row
-
-
 def test_get_active_profile_prompt_returns_profile():
     async def run_test():
         bot = DiscordBot()
         identity = {"name": "Blepp"}
         personality = {"traits": "amigável"}
         row = (json.dumps(identity), json.dumps(personality))
-        db = SimpleNamespace()
-        db.execute = MagicMock(return_value=AsyncCursor(row))
-        bot.db._db = db
+        bot.db.get_active_profile = AsyncMock(return_value=row)
 
         result = await bot._get_active_profile_prompt()
         assert "Blepp" in result
@@ -40,11 +23,122 @@ def test_get_active_profile_prompt_returns_profile():
 def test_get_active_profile_prompt_returns_default_on_empty():
     async def run_test():
         bot = DiscordBot()
-        db = SimpleNamespace()
-        db.execute = MagicMock(return_value=AsyncCursor(None))
-        bot.db._db = db
+        bot.db.get_active_profile = AsyncMock(return_value=None)
 
         result = await bot._get_active_profile_prompt()
         assert result == "Você é um assistente útil."
 
     asyncio.run(run_test())
+
+
+def test_overload_notice_is_sent_once_per_user_and_channel():
+    async def run_test():
+        bot = DiscordBot()
+        bot.dispatcher.submit = MagicMock(return_value=False)
+        message = MagicMock()
+        message.channel.send = AsyncMock()
+
+        for _ in range(5):
+            await bot._submit_batch(("u1", 10), [message])
+        await bot._submit_batch(("u1", 11), [message])
+        assert message.channel.send.await_count == 2
+
+    asyncio.run(run_test())
+
+
+def test_run_aborts_without_connecting_when_database_fails(monkeypatch):
+    from discord.ext import commands
+
+    start = AsyncMock()
+    monkeypatch.setattr(commands.Bot, "start", start)
+    bot = DiscordBot()
+    bot.config.get_token = lambda: "token"
+    bot.db.connect = AsyncMock(side_effect=RuntimeError("disco cheio"))
+
+    bot.run()
+
+    start.assert_not_awaited()
+    assert bot.startup.status["modules"] == "skipped"
+
+
+def test_partial_delete_requeues_the_rest_of_the_batch():
+    from bot_discord.core.cancellation import CancellationToken
+
+    async def run_test():
+        bot = DiscordBot()
+        bot.dispatcher.submit = MagicMock(return_value=True)
+        messages = [MagicMock(id=i) for i in (1, 2, 3)]
+        token = CancellationToken()
+        bot.cancellations.register(token, [1, 2, 3], channel_id=10)
+
+        bot.cancellations.cancel_message(2, "deleted")
+        await bot._requeue_remaining(messages, token)
+        assert bot.dispatcher.submit.call_args.args[1] == [messages[0], messages[2]]
+
+        # Lote inteiro apagado: nada volta para a fila
+        bot.dispatcher.submit.reset_mock()
+        token = CancellationToken()
+        bot.cancellations.register(token, [1], channel_id=10)
+        bot.cancellations.cancel_message(1, "deleted")
+        await bot._requeue_remaining(messages[:1], token)
+        bot.dispatcher.submit.assert_not_called()
+
+    asyncio.run(run_test())
+
+
+def test_metrics_report_summarizes_embedding_batches():
+    from bot_discord.core.metrics import Histogram
+    from bot_discord.modules.answer_cache import AnswerCache
+    from bot_discord.modules.retrieval_gate import RetrievalGate
+
+    bot = DiscordBot()
+    assert bot.metrics_report() == [
+        "Mensagens: 0/1 workers ocupados, 0 na fila (0 usuários), espera p95=0ms, recusadas 0, substituídas 0, descartadas 0"
+    ]
+
+    bot.stream_renderers.metrics.update(replies=2, rate_limited=1)
+    bot.stream_renderers.metrics["edits_per_reply"].observe(3)
+    assert bot.metrics_report()[1] == (
+        "Stream: 2 respostas, edições/resposta n=1 p50=5 p95=5 max=3, rate limits 1, erros 0, continuações 0, descartadas 0"
+    )
+    bot.stream_renderers.metrics["replies"] = 0
+
+    batch_size, queue_wait = Histogram((1, 2, 4, 8)), Histogram((1, 5, 10))
+    for size in (1, 4, 4):
+        batch_size.observe(size)
+    queue_wait.observe(3)
+    bot._modules['memory'] = MagicMock()
+    bot._modules['memory'].embeddings.metrics = {"batch_size": batch_size, "queue_wait_ms": queue_wait, "cancelled": 0}
+    bot._modules['memory'].answer_cache = AnswerCache(enabled=False)
+    bot._modules['memory'].retrieval_gate = RetrievalGate()
+    assert bot.metrics_report()[1:] == ["Embeddings: lote n=3 p50=4 p95=4 max=4, espera n=1 p50=5ms p95=5ms max=3ms, cancelados 0"]
+
+    answers = bot._modules['memory'].answer_cache = AnswerCache(enabled=True)
+    answers.metrics.update(lookups=10, hits=2, stores=5)
+    assert bot.metrics_report()[2] == "Cache semântico: 20% de acerto (2/10), 5 gravadas"
+
+
+def test_metrics_report_includes_llm_scheduler_and_caches():
+    from bot_discord.core.llm_scheduler import LLMScheduler
+    from bot_discord.core.response_cache import LLMResponseCache
+
+    bot = DiscordBot()
+    scheduler = LLMScheduler(2)
+    scheduler.metrics["wait_ms"]["interactive"].observe(40)
+    response_cache = LLMResponseCache(MagicMock())
+    response_cache.metrics.update(hits=3, misses=1, stores=1)
+    bot._modules['ai_handler'] = MagicMock()
+    bot._modules['ai_handler'].provider.scheduler = scheduler
+    bot._modules['ai_handler'].provider.response_cache = response_cache
+    bot._modules['ai_handler'].provider.metrics = {"cancelled": 0, "cancelled_tokens": 0, "cancelled_tokens_saved": 0}
+
+    assert bot.metrics_report()[1:] == [
+        "LLM: 0/2 slots ocupados, fila: interactive 0, extraction 0, summarization 0, espera: interactive p95=50ms",
+        "Cache de respostas LLM: 75% de acerto (3/4), 1 gravadas",
+    ]
+
+    bot._modules['ai_handler'].provider.metrics.update(cancelled=2, cancelled_tokens=30, cancelled_tokens_saved=900)
+    bot.cancellations.metrics["cancelled"] = {"deleted": 1, "superseded": 1}
+    assert bot.metrics_report()[2] == (
+        "Gerações canceladas: 2 (30 tokens descartados, ~900 não gerados), motivos: deleted 1, superseded 1"
+    )
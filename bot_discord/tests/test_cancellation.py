@@ -0,0 +1,37 @@
+from unittest.mock import MagicMock
+
+from bot_discord.core.cancellation import CancellationRegistry, CancellationToken
+
+
+def test_token_runs_callbacks_once_and_supports_removal():
+    token = CancellationToken()
+    close, removed = MagicMock(), MagicMock()
+    token.add_callback(close)
+    remove = token.add_callback(removed)
+    remove()
+
+    token.cancel("deleted")
+    token.cancel("again")
+    assert token.cancelled and token.reason == "deleted"
+    close.assert_called_once()
+    removed.assert_not_called()
+
+    late = MagicMock()
+    token.add_callback(late)
+    late.assert_called_once()
+
+
+def test_registry_cancels_by_message_and_channel():
+    registry = CancellationRegistry()
+    first, second, other = CancellationToken(), CancellationToken(), CancellationToken()
+    registry.register(first, [1, 2], channel_id=10)
+    registry.register(second, [3], channel_id=10)
+    registry.register(other, [4], channel_id=20)
+
+    assert registry.cancel_message(2)
+    assert first.cancelled and not second.cancelled
+    assert registry.cancel_channel(10) == 2
+    assert second.cancelled and not other.cancelled
+    registry.unregister([4])
+    assert not registry.cancel_message(4)
+    assert registry.metrics["cancelled"] == {"deleted": 1, "channel_deleted": 1}
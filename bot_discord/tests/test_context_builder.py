@@ -0,0 +1,86 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+from bot_discord.modules.context_builder import ContextBuilder, TokenCounter
+
+
+def test_budget_is_filled_by_priority_and_reported():
+    async def run_test():
+        builder = ContextBuilder(TokenCounter(), budget=120)
+        history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"mensagem {i} " + "x" * 40} for i in range(10)]
+        messages, used = await builder.build(
+            "qual meu hobby?", personality="Você é Blepp.",
+            memories=["Gosta de xadrez"], journal=["Conversaram sobre jogos"], history=history,
+        )
+
+        assert messages[0]["role"] == "system"
+        assert "Gosta de xadrez" in messages[0]["content"]
+        assert "Conversaram sobre jogos" in messages[0]["content"]
+        assert messages[-1] == {"role": "user", "content": "qual meu hobby?"}
+        # Só as mensagens mais recentes cabem, em ordem cronológica
+        kept = messages[1:-1]
+        assert 0 < len(kept) < len(history)
+        assert kept[-1]["content"].startswith("mensagem 9")
+        assert used["total"] <= 120
+        assert set(used) == {"persona", "prompt", "memories", "journal", "history", "total"}
+
+    asyncio.run(run_test())
+
+
+def test_long_paste_does_not_push_out_persona_or_prompt():
+    async def run_test():
+        counter = TokenCounter()
+        builder = ContextBuilder(counter, budget=200)
+        history = [{"role": "user", "content": "y" * 4000}, {"role": "assistant", "content": "ok"}]
+        messages, used = await builder.build("e agora?", personality="Persona", history=history)
+
+        assert [m["content"] for m in messages] == ["Persona", "ok", "e agora?"]
+        await builder.build("e agora?", personality="Persona", history=history)
+        assert counter.metrics["hits"] >= 4  # contagens reaproveitadas do cache
+
+    asyncio.run(run_test())
+
+
+def test_stable_prefix_keeps_history_window_across_turns():
+    async def run_test():
+        builder = ContextBuilder(TokenCounter(), budget=160, stable_prefix=True)
+        history = [{"role": "user", "content": f"mensagem {i} " + "x" * 40} for i in range(6)]
+        first, _ = await builder.build("oi?", personality="Persona", memories=["Gosta de xadrez"], history=history, cache_key="u1")
+
+        assert first[0] == {"role": "system", "content": "Persona"}
+        assert "Gosta de xadrez" in first[-1]["content"] and first[-1]["content"].endswith("oi?")
+        # O turno seguinte só acrescenta mensagens: o prefixo anterior continua idêntico
+        history.append({"role": "assistant", "content": "curta"})
+        second, _ = await builder.build("e?", personality="Persona", history=history, cache_key="u1")
+        assert second[:len(first) - 1] == first[:-1]
+
+    asyncio.run(run_test())
+
+
+def test_tokenize_failure_only_falls_back_until_cooldown():
+    async def run_test():
+        # Nada escuta na porta 1: a chamada falha como um llama-server ainda subindo
+        counter = TokenCounter("http://127.0.0.1:1/tokenize", retry_after=0.05)
+        assert await counter.count_many(["primeira"]) == [TokenCounter.estimate("primeira")]
+        assert counter.tokenize_url and not counter.remote_available
+
+        await asyncio.sleep(0.06)
+        counter._tokenize = AsyncMock(return_value=42)
+        assert await counter.count_many(["segunda"]) == [42]
+        await counter.close()
+
+    asyncio.run(run_test())
+
+
+def test_oversized_prompt_is_truncated_to_the_budget():
+    async def run_test():
+        builder = ContextBuilder(TokenCounter(), budget=100)
+        prompt = "texto colado " * 200 + "qual o resumo?"
+        messages, used = await builder.build(prompt, personality="Você é Blepp.", history=[{"role": "user", "content": "oi"}])
+
+        assert messages[-1]["content"].endswith("qual o resumo?")
+        assert messages[-1]["content"].startswith("…")
+        assert used["total"] <= 100
+        assert used["prompt"] == TokenCounter.estimate(messages[-1]["content"]) + 4
+
+    asyncio.run(run_test())
@@ -1,4 +1,5 @@
 import asyncio
+import threading
 import numpy as np
 
 from bot_discord.core.database import DatabaseManager
@@ -38,3 +39,264 @@ def test_database_semantic_memories(tmp_path):
         await manager.close()
 
     asyncio.run(run_test())
+
+
+def test_importance_reorders_semantic_results(tmp_path):
+    async def run_test():
+        manager = DatabaseManager(db_path=str(tmp_path / "test.db"), importance_weight=0.5)
+        await manager.connect()
+        await manager.add_memory("user1", "gosta de pizza", embedding=np.array([1.0, 0.0], dtype=np.float32))
+        await manager.add_memory("user1", "alérgico a camarão", importance=3, embedding=np.array([0.8, 0.6], dtype=np.float32))
+
+        results = await manager.get_semantic_memories("user1", np.array([1.0, 0.0], dtype=np.float32), limit=2, threshold=0.5)
+        assert [r[0] for r in results] == ["alérgico a camarão", "gosta de pizza"]
+        assert abs(results[0][1] - 0.8) < 1e-5  # o score continua sendo o cosseno
+        await manager.close()
+
+    asyncio.run(run_test())
+
+
+def test_semantic_memories_index_tracks_new_and_global_rows(tmp_path):
+    async def run_test():
+        manager = DatabaseManager(db_path=str(tmp_path / "test.db"))
+        await manager.connect()
+
+        await manager.add_memory("global_legacy", "regra do servidor", embedding=np.array([0.0, 1.0], dtype=np.float32))
+        await manager.add_memory("user1", "gosta de pizza", embedding=np.array([1.0, 0.0], dtype=np.float32))
+        assert await manager.get_semantic_memories("user1", np.array([1.0, 0.0], dtype=np.float32), threshold=0.9)
+
+        # Inserção após o carregamento deve atualizar o índice residente
+        await manager.add_memory("user1", "gosta de massa", embedding=np.array([0.6, 0.8], dtype=np.float32))
+        results = await manager.get_semantic_memories("user1", np.array([0.0, 1.0], dtype=np.float32), limit=2, threshold=0.5)
+        assert [r[0] for r in results] == ["regra do servidor", "gosta de massa"]
+
+        await manager.close()
+
+    asyncio.run(run_test())
+
+
+def test_memory_committed_while_index_builds_is_searchable(tmp_path):
+    async def run_test():
+        manager = DatabaseManager(db_path=str(tmp_path / "test.db"))
+        await manager.connect()
+        await manager.add_memory("user1", "gosta de pizza", embedding=np.array([1.0, 0.0], dtype=np.float32))
+        await manager.flush()
+
+        started, release = threading.Event(), threading.Event()
+        build_entry = manager.vector_index.build_entry
+
+        def slow_build(*args):
+            started.set()
+            release.wait(5)
+            return build_entry(*args)
+
+        manager.vector_index.build_entry = slow_build
+        query = np.array([0.0, 1.0], dtype=np.float32)
+        search = asyncio.create_task(manager.get_semantic_memories("user1", query, threshold=0.5))
+        await asyncio.to_thread(started.wait, 5)
+        # Gravada enquanto a entrada é construída a partir do SELECT anterior
+        await manager.add_memory("user1", "mora em lisboa", embedding=query)
+        await manager.flush()
+        release.set()
+
+        assert [r[0] for r in await search] == ["mora em lisboa"]
+        assert [r[0] for r in await manager.get_semantic_memories("user1", query, threshold=0.5)] == ["mora em lisboa"]
+        await manager.close()
+
+    asyncio.run(run_test())
+
+
+def test_global_memories_are_shared_and_rebuilt_only_on_change(tmp_path):
+    async def run_test():
+        manager = DatabaseManager(db_path=str(tmp_path / "test.db"))
+        await manager.connect()
+        await manager.add_memory("global_legacy", "regra do servidor", embedding=np.array([1.0, 0.0], dtype=np.float32))
+
+        query = np.array([1.0, 0.0], dtype=np.float32)
+        assert (await manager.get_semantic_memories("user1", query))[0][0] == "regra do servidor"
+        assert (await manager.get_semantic_memories("user2", query))[0][0] == "regra do servidor"
+        assert manager.global_index.metrics["builds"] == 1
+        assert "global_legacy" not in manager.vector_index
+
+        await manager.add_memory("global_legacy", "eventos aos sábados", embedding=np.array([0.0, 1.0], dtype=np.float32))
+        results = await manager.get_semantic_memories("user1", np.array([0.0, 1.0], dtype=np.float32))
+        assert results[0][0] == "eventos aos sábados"
+        assert manager.global_index.metrics["builds"] == 2
+        await manager.close()
+
+        # Um novo processo reaproveita os arquivos mapeados sem reconstruir
+        manager = DatabaseManager(db_path=str(tmp_path / "test.db"))
+        await manager.connect()
+        assert (await manager.get_semantic_memories("user3", query))[0][0] == "regra do servidor"
+        assert manager.global_index.metrics["builds"] == 0
+        await manager.close()
+
+    asyncio.run(run_test())
+
+
+def test_write_behind_groups_commits_and_reads_own_writes(tmp_path):
+    async def run_test():
+        db_path = str(tmp_path / "test.db")
+        manager = DatabaseManager(db_path=db_path, flush_interval=60)
+        await manager.connect()
+
+        commits = 0
+        original_commit = manager._db.commit
+
+        async def counting_commit():
+            nonlocal commits
+            commits += 1
+            await original_commit()
+
+        manager._db.commit = counting_commit
+
+        await manager.add_history("user1", "user", "oi")
+        await manager.update_user_interaction("user1", "Fulano")
+        await manager.update_affinity("user1", 0.05)
+        await manager.update_mood("user1", "happy")
+        assert commits == 0
+
+        history = await manager.get_history("user1")
+        assert history == [{"role": "user", "content": "oi"}]
+        assert commits == 1
+
+        await manager.add_summary("user1", "resumo")
+        await manager.close()
+
+        reopened = DatabaseManager(db_path=db_path)
+        await reopened.connect()
+        assert await reopened.get_summaries("user1") == ["resumo"]
+        assert (await reopened.get_user("user1"))["mood"] == "happy"
+        await reopened.close()
+
+    asyncio.run(run_test())
+
+
+def test_legacy_embeddings_are_migrated_to_unit_vectors(tmp_path):
+    async def run_test():
+        import sqlite3
+
+        db_path = str(tmp_path / "legacy.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE memories (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, content TEXT NOT NULL, embedding BLOB, importance INTEGER DEFAULT 1, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+        conn.execute("INSERT INTO memories (user_id, content, embedding) VALUES ('user1', 'antigo', ?)", (np.array([3.0, 4.0], dtype=np.float32).tobytes(),))
+        conn.execute("INSERT INTO memories (user_id, content, embedding) VALUES ('user1', 'outro modelo', ?)", (np.array([1.0, 0.0, 0.0], dtype=np.float32).tobytes(),))
+        conn.commit()
+        conn.close()
+
+        manager = DatabaseManager(db_path=db_path)
+        await manager.connect()
+        await manager._backfill_task
+
+        async with manager._db.execute("SELECT embedding, dim, norm FROM memories ORDER BY id") as cursor:
+            rows = await cursor.fetchall()
+        assert np.allclose(np.frombuffer(rows[0][0], dtype=np.float32), [0.6, 0.8])
+        assert (rows[0][1], rows[0][2]) == (2, 5.0)
+        assert rows[1][1] == 3
+
+        results = await manager.get_semantic_memories("user1", np.array([0.6, 0.8], dtype=np.float32), threshold=0.5)
+        assert [r[0] for r in results] == ["antigo"]
+        await manager.close()
+
+    asyncio.run(run_test())
+
+
+def test_int8_storage_rescores_with_exact_embeddings(tmp_path):
+    async def run_test():
+        manager = DatabaseManager(db_path=str(tmp_path / "test.db"), embedding_storage="int8")
+        await manager.connect()
+
+        await manager.add_memory("user1", "gosta de pizza", embedding=np.array([0.6, 0.8], dtype=np.float32))
+        await manager.add_memory("user1", "joga xadrez", embedding=np.array([1.0, 0.0], dtype=np.float32))
+
+        results = await manager.get_semantic_memories("user1", np.array([0.6, 0.8], dtype=np.float32), limit=1, threshold=0.9)
+        assert results[0][0] == "gosta de pizza"
+        assert abs(results[0][1] - 1.0) < 1e-6
+        assert manager.vector_index._entries["user1"].matrix.dtype == np.int8
+
+        await manager.close()
+
+    asyncio.run(run_test())
+
+
+def test_hybrid_search_recovers_lexical_match_below_threshold(tmp_path):
+    async def run_test():
+        manager = DatabaseManager(db_path=str(tmp_path / "test.db"))
+        await manager.connect()
+
+        await manager.add_memory("user1", "O jogo favorito é Hollow Knight", embedding=np.array([0.5, 0.866], dtype=np.float32))
+        await manager.add_memory("user1", "Mora em Recife", embedding=np.array([0.0, 1.0], dtype=np.float32))
+        query = np.array([1.0, 0.0], dtype=np.float32)
+
+        assert await manager.get_semantic_memories("user1", query, threshold=0.7) == []
+
+        results = await manager.get_semantic_memories("user1", query, threshold=0.7, query_text="hollow knight?")
+        assert [r[0] for r in results] == ["O jogo favorito é Hollow Knight"]
+
+        await manager.close()
+
+    asyncio.run(run_test())
+
+
+def test_llm_response_cache_respects_ttl_and_size(tmp_path):
+    async def run_test():
+        manager = DatabaseManager(db_path=str(tmp_path / "test.db"))
+        await manager.connect()
+
+        for i in range(4):
+            await manager.set_llm_response(f"k{i}", f"resposta {i}", ttl=3600, max_entries=2)
+        assert await manager.get_llm_response("k3", ttl=3600) == "resposta 3"
+        assert await manager.get_llm_response("k0", ttl=3600) is None
+        assert await manager.get_llm_response("k3", ttl=-1) is None
+
+        async with manager._pool.reader() as conn, conn.execute("SELECT COUNT(*) FROM llm_cache") as cursor:
+            assert (await cursor.fetchone())[0] == 2
+        await manager.close()
+
+    asyncio.run(run_test())
+
+
+def test_failed_write_only_drops_the_bad_statement(tmp_path):
+    async def run_test():
+        manager = DatabaseManager(db_path=str(tmp_path / "test.db"), flush_interval=60)
+        await manager.connect()
+
+        await manager.add_history("alice", "user", "oi")
+        await manager.add_summary("bob", "resumo")
+        await manager.add_history("carol", "moderator", "papel inválido")  # viola o CHECK de role
+        await manager.flush()
+
+        assert await manager.get_history("alice") == [{"role": "user", "content": "oi"}]
+        assert await manager.get_summaries("bob") == ["resumo"]
+        assert await manager.get_history("carol") == []
+        assert manager.failed_writes == 1
+
+        await manager.save_active_profile('{"name": "A"}', "{}", "{}", "{}", "{}", "{}", "{}")
+        await manager.save_active_profile('{"name": "B"}', "{}", "{}", "{}", "{}", "{}", "{}")
+        assert (await manager.get_active_profile())[0] == '{"name": "B"}'
+        await manager.close()
+
+    asyncio.run(run_test())
+
+
+def test_memory_centroids_cover_stored_user_and_global_memories(tmp_path):
+    async def run_test():
+        manager = DatabaseManager(db_path=str(tmp_path / "test.db"))
+        await manager.connect()
+        await manager.add_memory("user1", "gosta de pizza", embedding=np.array([2.0, 0.0], dtype=np.float32))
+        await manager.add_memory("global_legacy", "regra do servidor", embedding=np.array([0.0, 1.0], dtype=np.float32))
+        await manager.close()
+
+        # Novo processo: os centroides vêm do banco, não só do que foi gravado nesta execução
+        manager = DatabaseManager(db_path=str(tmp_path / "test.db"))
+        await manager.connect()
+        centroids = await manager.memory_centroids("user1", 2)
+        assert [(c[0].tolist(), c[1]) for c in centroids] == [([1.0, 0.0], 1), ([0.0, 1.0], 1)]
+
+        await manager.add_memory("user1", "mora em lisboa", embedding=np.array([0.0, 1.0], dtype=np.float32))
+        total, count = (await manager.memory_centroids("user1", 2))[0]
+        assert total.tolist() == [1.0, 1.0] and count == 2
+        assert await manager.memory_centroids("user2", 2) == [centroids[1]]
+        await manager.close()
+
+    asyncio.run(run_test())
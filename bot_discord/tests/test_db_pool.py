@@ -0,0 +1,38 @@
+import asyncio
+
+from bot_discord.core.db_pool import ConnectionPool
+
+
+def test_pool_uses_wal_and_readers_see_committed_writes(tmp_path):
+    async def run_test():
+        pool = ConnectionPool(str(tmp_path / "pool.db"), readers=2)
+        await pool.open()
+        assert pool.journal_mode == "wal"
+
+        await pool.writer.execute("CREATE TABLE t (v TEXT)")
+        await pool.writer.commit()
+        await pool.open_readers()
+
+        await pool.writer.execute("INSERT INTO t VALUES ('ok')")
+        await pool.writer.commit()
+
+        async def read():
+            async with pool.reader() as conn, conn.execute("SELECT v FROM t") as cursor:
+                return (await cursor.fetchone())[0]
+
+        assert await asyncio.gather(read(), read(), read()) == ["ok", "ok", "ok"]
+        await pool.close()
+
+    asyncio.run(run_test())
+
+
+def test_in_memory_pool_falls_back_to_writer():
+    async def run_test():
+        pool = ConnectionPool(":memory:")
+        await pool.open()
+        await pool.open_readers()
+        async with pool.reader() as conn:
+            assert conn is pool.writer
+        await pool.close()
+
+    asyncio.run(run_test())
@@ -0,0 +1,69 @@
+import asyncio
+
+from bot_discord.core.debouncer import MessageDebouncer
+
+
+def test_burst_is_merged_into_one_batch():
+    async def run_test():
+        batches = []
+
+        async def on_flush(key, items):
+            batches.append((key, items))
+
+        debouncer = MessageDebouncer(on_flush, window=0.05)
+        for text in ("oi bro", "tudo bem?", "me ajuda com python"):
+            debouncer.add(("u1", 10), text)
+            await asyncio.sleep(0.01)
+        debouncer.add(("u2", 10), "outro usuário")
+        debouncer.add(("u1", 11), "outro canal", earlier=["cancelada"])
+        await asyncio.sleep(0.15)
+
+        assert sorted(batches) == [
+            (("u1", 10), ["oi bro", "tudo bem?", "me ajuda com python"]),
+            (("u1", 11), ["cancelada", "outro canal"]),
+            (("u2", 10), ["outro usuário"]),
+        ]
+        assert debouncer.metrics == {"received": 5, "batches": 3, "merged": 3}
+
+    asyncio.run(run_test())
+
+
+def test_max_delay_flushes_continuous_typing():
+    async def run_test():
+        batches = []
+
+        async def on_flush(key, items):
+            batches.append(items)
+
+        debouncer = MessageDebouncer(on_flush, window=0.05, max_delay=0.1)
+        for i in range(10):
+            debouncer.add("k", i)
+            await asyncio.sleep(0.03)
+        await asyncio.sleep(0.1)
+        await debouncer.close()
+
+        assert len(batches) >= 2
+        assert [i for batch in batches for i in batch] == list(range(10))
+
+    asyncio.run(run_test())
+
+
+def test_discard_drops_held_items():
+    async def run_test():
+        batches = []
+
+        async def on_flush(key, items):
+            batches.append((key, items))
+
+        debouncer = MessageDebouncer(on_flush, window=0.05)
+        debouncer.add("a", 1)
+        debouncer.add("a", 2)
+        debouncer.add("b", 3)
+        # Mensagens apagadas antes do lote sair não chegam ao on_flush
+        assert debouncer.discard(lambda item: item in (2, 3)) == 2
+        await asyncio.sleep(0.1)
+
+        assert batches == [("a", [1])]
+        assert debouncer.metrics["batches"] == 1
+
+    asyncio.run(run_test())
@@ -0,0 +1,107 @@
+import asyncio
+
+from bot_discord.core.dispatcher import MessageDispatcher
+
+
+def test_users_are_served_in_order_with_bounded_concurrency():
+    async def run_test():
+        running, peak, done = set(), [0], []
+
+        async def handler(item):
+            user, n = item
+            assert user not in running  # uma mensagem por usuário por vez
+            running.add(user)
+            peak[0] = max(peak[0], len(running))
+            await asyncio.sleep(0.01)
+            running.discard(user)
+            done.append(item)
+
+        dispatcher = MessageDispatcher(handler, workers=2, max_per_user=5)
+        dispatcher.start()
+        for n in range(3):
+            for user in ("a", "b", "c"):
+                assert dispatcher.submit(user, (user, n))
+        while len(done) < 9:
+            await asyncio.sleep(0.01)
+        await dispatcher.stop()
+
+        assert peak[0] == 2
+        for user in ("a", "b", "c"):
+            assert [n for u, n in done if u == user] == [0, 1, 2]
+        assert dispatcher.metrics["wait_ms"].count == 9
+        assert dispatcher.queue_depth == 0
+
+    asyncio.run(run_test())
+
+
+def test_submit_rejects_beyond_caps():
+    async def run_test():
+        dispatcher = MessageDispatcher(lambda item: asyncio.sleep(0), workers=1, max_per_user=2, max_pending=3)
+        assert dispatcher.submit("a", 1) and dispatcher.submit("a", 2)
+        assert not dispatcher.submit("a", 3)
+        assert dispatcher.submit("b", 1)
+        assert not dispatcher.submit("c", 1)
+        assert dispatcher.metrics["rejected"] == 2
+
+        dispatcher.start()
+        while dispatcher.metrics["processed"] < 3:
+            await asyncio.sleep(0.01)
+        await dispatcher.stop()
+        assert dispatcher.metrics["processed"] == 3
+
+    asyncio.run(run_test())
+
+
+def test_supersede_cancels_in_flight_and_takes_queued_items():
+    async def run_test():
+        started = asyncio.Event()
+
+        async def handler(item):
+            started.set()
+            await asyncio.sleep(10)
+
+        dispatcher = MessageDispatcher(handler, workers=1)
+        dispatcher.start()
+        dispatcher.submit("a", ["m1"])
+        await started.wait()
+        dispatcher.submit("a", ["m2"])
+        dispatcher.submit("a", ["outro canal"])
+
+        taken = dispatcher.supersede("a", lambda batch: batch[0] != "outro canal")
+        assert taken == [["m1"], ["m2"]]
+        await asyncio.sleep(0.01)
+        assert dispatcher.metrics["superseded"] == 1
+        assert dispatcher.queue_depth == 0  # "outro canal" já está em atendimento
+        await dispatcher.stop()
+
+    asyncio.run(run_test())
+
+
+def test_rewrite_queued_drops_deleted_items():
+    async def run_test():
+        done = []
+        release = asyncio.Event()
+
+        async def handler(batch):
+            await release.wait()
+            done.append(batch)
+
+        dispatcher = MessageDispatcher(handler, workers=1, max_per_user=5)
+        dispatcher.start()
+        dispatcher.submit("a", [1])
+        await asyncio.sleep(0.01)  # [1] já está em atendimento
+        dispatcher.submit("a", [2, 3])
+        dispatcher.submit("b", [4])
+
+        dropped = dispatcher.rewrite_queued(lambda batch: [n for n in batch if n not in (1, 3, 4)] or None)
+        release.set()
+        while len(done) < 2:
+            await asyncio.sleep(0.01)
+        await dispatcher.stop()
+
+        assert dropped == 1
+        assert done == [[1], [2]]
+        assert dispatcher.metrics["dropped"] == 1
+        assert dispatcher.queue_depth == 0
+
+    asyncio.run(run_test())
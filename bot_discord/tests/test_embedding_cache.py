@@ -0,0 +1,25 @@
+import numpy as np
+
+from bot_discord.core.embedding_cache import EmbeddingCache
+
+
+def test_key_normalizes_whitespace_and_separates_models():
+    assert EmbeddingCache.key("m", "  olá   mundo ") == EmbeddingCache.key("m", "olá mundo")
+    assert EmbeddingCache.key("m", "olá") != EmbeddingCache.key("outro", "olá")
+
+
+def test_disk_level_survives_restart_and_is_bounded(tmp_path):
+    path = str(tmp_path / "embedding_cache.db")
+    cache = EmbeddingCache(path, max_items=2, max_disk_rows=3)
+    cache.store([(f"k{i}", np.full(4, i, dtype=np.float32)) for i in range(5)])
+    assert cache.get("k0") is None  # saiu do LRU
+    assert cache.get("k4") is not None
+    cache.close()
+
+    reopened = EmbeddingCache(path)
+    found = reopened.load(["k0", "k2", "k4"])
+    assert sorted(found) == ["k2", "k4"]
+    assert found["k2"].tolist() == [2.0] * 4
+    assert reopened.metrics["disk_hits"] == 2 and reopened.metrics["misses"] == 1
+    assert reopened.get("k2") is not None
+    reopened.close()
@@ -1,3 +1,5 @@
+import asyncio
+
 import numpy as np
 
 from bot_discord.core.embeddings import EmbeddingManager
@@ -19,3 +21,81 @@ def test_get_embedding_uses_loaded_model():
     manager._model = FakeModel()
     result = manager.get_embedding("teste")
     assert result.tolist() == [1.0, 2.0]
+
+
+def test_concurrent_requests_share_one_batched_encode():
+    async def run_test():
+        manager = EmbeddingManager(batch_size=8, max_wait_ms=20)
+        calls = []
+
+        class FakeModel:
+            def encode(self, texts):
+                calls.append(list(texts))
+                return np.array([[float(len(t)), 1.0] for t in texts], dtype=np.float32)
+
+        manager._model = FakeModel()
+        results = await asyncio.gather(*(manager.aget_embedding("x" * i) for i in range(1, 6)))
+        await manager.close()
+
+        assert calls == [["x", "xx", "xxx", "xxxx", "xxxxx"]]
+        assert [r[0] for r in results] == [1.0, 2.0, 3.0, 4.0, 5.0]
+        assert manager.metrics["batch_size"].count == 1
+        assert manager.metrics["queue_wait_ms"].count == 5
+
+    asyncio.run(run_test())
+
+
+def test_encode_runs_off_loop_and_skips_cancelled_requests():
+    async def run_test():
+        manager = EmbeddingManager(batch_size=8, max_wait_ms=20)
+        threads, calls = [], []
+
+        class FakeModel:
+            def encode(self, texts):
+                import threading
+                threads.append(threading.current_thread().name)
+                calls.append(list(texts))
+                return np.ones((len(texts), 2), dtype=np.float32)
+
+        manager._model = FakeModel()
+        abandoned = asyncio.ensure_future(manager.aget_embedding("abandonada"))
+        kept = asyncio.ensure_future(manager.aget_embedding("mantida"))
+        await asyncio.sleep(0)
+        abandoned.cancel()
+
+        assert (await kept).tolist() == [1.0, 1.0]
+        await manager.close()
+        assert calls == [["mantida"]]
+        assert threads[0].startswith("embeddings")
+        assert manager.metrics["cancelled"] == 1
+
+    asyncio.run(run_test())
+
+
+def test_cached_texts_skip_model_inference(tmp_path):
+    from bot_discord.core.embedding_cache import EmbeddingCache
+
+    async def run_test():
+        calls = []
+
+        class FakeModel:
+            def encode(self, texts):
+                calls.append(list(texts))
+                return np.ones((len(texts), 2), dtype=np.float32)
+
+        manager = EmbeddingManager(max_wait_ms=1, cache=EmbeddingCache(str(tmp_path / "cache.db")))
+        manager._model = FakeModel()
+        await manager.aget_embeddings(["oi", "oi ", "tudo bem?"])
+        await manager.aget_embedding("oi")
+        await manager.close()
+
+        # Novo processo: o nível em disco evita o modelo
+        restarted = EmbeddingManager(max_wait_ms=1, cache=EmbeddingCache(str(tmp_path / "cache.db")))
+        restarted._model = FakeModel()
+        assert (await restarted.aget_embedding("tudo bem?")).tolist() == [1.0, 1.0]
+        await restarted.close()
+
+        assert calls == [["oi", "tudo bem?"]]
+        assert restarted.cache.metrics["disk_hits"] == 1
+
+    asyncio.run(run_test())
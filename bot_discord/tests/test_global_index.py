@@ -0,0 +1,36 @@
+import numpy as np
+
+from bot_discord.core.global_index import GlobalMemoryIndex
+
+
+def _rows():
+    return [
+        (1, "regra do servidor", np.array([1.0, 0.0], dtype=np.float32).tobytes(), 1.0),
+        (5, "horário de eventos", np.array([0.0, 2.0], dtype=np.float32).tobytes(), None),
+        (7, "errado", np.array([1.0, 0.0, 0.0], dtype=np.float32).tobytes(), 1.0),
+    ]
+
+
+def test_build_persists_memory_mapped_files(tmp_path):
+    index = GlobalMemoryIndex(str(tmp_path))
+    index.build(_rows(), dim=2, signature=(3, 7, 2))
+
+    reopened = GlobalMemoryIndex(str(tmp_path))
+    assert reopened.open()
+    assert isinstance(reopened.matrix, np.memmap)
+    assert reopened.signature == (3, 7, 2)
+    assert reopened.count == 2
+
+    results = reopened.search(np.array([0.0, 1.0], dtype=np.float32), limit=1, threshold=0.5)
+    assert results == [(5, "horário de eventos", 1.0)]
+    assert [r[0] for r in reopened.score_ids(np.array([1.0, 0.0], dtype=np.float32), [1, 3, 7])] == [1]
+
+
+def test_empty_build_and_dimension_mismatch(tmp_path):
+    index = GlobalMemoryIndex(str(tmp_path))
+    index.build([], dim=4, signature=(0, 0, 4))
+
+    assert index.open()
+    assert index.count == 0 and index.dim == 4
+    assert index.search(np.ones(4, dtype=np.float32) / 2, limit=3, threshold=0.0) == []
+    assert index.search(np.array([1.0, 0.0], dtype=np.float32), limit=3, threshold=0.0) == []
@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+
+BOT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+# Orçamento de import a frio de core.bot (ms); ajustável por ambiente em máquinas lentas
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "1500"))
+HEAVY_MODULES = ("sentence_transformers", "torch", "psutil")
+
+
+def _cold_import(code):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BOT_ROOT, capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    return result
+
+
+def test_cold_import_of_core_bot_within_budget():
+    result = _cold_import("import core.bot")
+    cumulative = None
+    for line in result.stderr.splitlines():
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) == 3 and parts[2] == "core.bot":
+            cumulative = int(parts[1]) / 1000
+    assert cumulative is not None
+    assert cumulative <= IMPORT_BUDGET_MS, f"import core.bot levou {cumulative:.0f} ms (orçamento {IMPORT_BUDGET_MS:.0f} ms)"
+
+
+def test_modules_do_not_import_heavy_dependencies():
+    result = _cold_import(
+        "import sys, core.bot, modules.memory, modules.commands, modules.ai_handler; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    assert result.stdout.strip() == ""
@@ -41,6 +41,20 @@ class TestLlamaServerManager(unittest.TestCase):
         self.assertIn("llama-server.exe", cmd)
         self.assertIn("-m", cmd)
 
+    @patch('subprocess.Popen')
+    def test_start_passes_parallel_slots(self, mock_popen):
+        mock_popen.return_value = MagicMock(pid=1)
+        self.manager.parallel = 4
+
+        with patch('builtins.open', new_callable=MagicMock):
+            self.manager.start()
+
+        cmd = mock_popen.call_args[0][0]
+        self.assertEqual(cmd[cmd.index("--parallel") + 1], "4")
+        # O contexto de cada slot é o -c dividido entre os slots
+        self.assertEqual(Config.context_per_slot(4096, 4, self.manager.flags), 1024)
+        self.assertEqual(Config.context_per_slot(4096, 4, "-c 4096 --kv-unified"), 4096)
+
     @patch('subprocess.Popen')
     def test_stop(self, mock_popen):
         mock_process = MagicMock()
@@ -52,3 +52,143 @@ def test_generate_handles_error(monkeypatch):
         assert "Erro no servidor" in result
 
     asyncio.run(run_test())
+
+
+def test_generate_caches_only_deterministic_successes(tmp_path, monkeypatch):
+    from bot_discord.core.database import DatabaseManager
+    from bot_discord.core.response_cache import LLMResponseCache
+
+    async def run_test():
+        db = DatabaseManager(db_path=str(tmp_path / "test.db"))
+        await db.connect()
+        provider = LMStudioProvider("http://localhost:1234/v1", "model")
+        provider.response_cache = LLMResponseCache(db)
+        session = MagicMock()
+        session.post.side_effect = lambda *a, **k: DummyResponse(200, payload={"choices": [{"message": {"content": "ok"}}]})
+        monkeypatch.setattr(provider, "_get_session", AsyncMock(return_value=session))
+        messages = [{"role": "user", "content": "extraia"}]
+
+        assert await provider.generate(messages, temperature=0.0) == "ok"
+        assert await provider.generate(messages, temperature=0.0) == "ok"
+        await provider.generate(messages, temperature=0.7)
+        assert session.post.call_count == 2
+        assert provider.response_cache.metrics == {"hits": 1, "misses": 1, "stores": 1}
+
+        session.post.side_effect = lambda *a, **k: DummyResponse(500, text="erro")
+        await provider.generate([{"role": "user", "content": "outro"}], cacheable=True)
+        assert provider.response_cache.metrics["stores"] == 1
+        await db.close()
+
+    asyncio.run(run_test())
+
+
+def test_llama_cpp_pins_users_to_slots_and_records_cached_prompt(monkeypatch):
+    from bot_discord.core.llm_provider import LlamaCppProvider
+
+    async def run_test():
+        provider = LlamaCppProvider("http://localhost:8080/v1", "local-model", slots=2)
+        payload = {"choices": [{"message": {"content": "ok"}}], "timings": {"cache_n": 90, "prompt_n": 10}}
+        session = MagicMock()
+        session.post.side_effect = lambda *a, **k: DummyResponse(200, payload=payload)
+        monkeypatch.setattr(provider, "_get_session", AsyncMock(return_value=session))
+        messages = [{"role": "user", "content": "hi"}]
+
+        await provider.generate(messages, user_id="a")
+        await provider.generate(messages, user_id="b")
+        await provider.generate(messages, user_id="a")
+        slots = [call.kwargs["json"]["id_slot"] for call in session.post.call_args_list]
+        assert slots[0] == slots[2] != slots[1]
+        assert all(call.kwargs["json"]["cache_prompt"] for call in session.post.call_args_list)
+        assert provider.metrics["prompt_tokens_cached"] == 270
+        assert provider.last_prompt_cache == {"cached": 90, "evaluated": 10}
+
+    asyncio.run(run_test())
+
+
+def test_llama_cpp_background_calls_take_a_tracked_unpinned_slot(monkeypatch):
+    from bot_discord.core.llm_provider import LlamaCppProvider
+    from bot_discord.core.llm_scheduler import PRIORITY_SUMMARIZATION
+
+    async def run_test():
+        provider = LlamaCppProvider("http://localhost:8080/v1", "local-model", slots=3)
+        release = asyncio.Event()
+
+        async def slow_json():
+            await release.wait()
+            return {"choices": [{"message": {"content": "ok"}}]}
+
+        def post(*args, **kwargs):
+            response = DummyResponse(200)
+            response.json = slow_json
+            return response
+
+        session = MagicMock()
+        session.post.side_effect = post
+        monkeypatch.setattr(provider, "_get_session", AsyncMock(return_value=session))
+        messages = [{"role": "user", "content": "hi"}]
+
+        release.set()
+        await provider.generate(messages, user_id="a")
+        await provider.generate(messages, user_id="b")
+        release.clear()
+        background = asyncio.create_task(provider.generate(messages, priority=PRIORITY_SUMMARIZATION, user_id="c"))
+        await asyncio.sleep(0.01)
+        # "c" chega enquanto o resumo ocupa o slot livre: não pode cair nele
+        interactive = asyncio.create_task(provider.generate(messages, user_id="c"))
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(background, interactive)
+
+        slots = [call.kwargs["json"]["id_slot"] for call in session.post.call_args_list]
+        assert slots[2] not in slots[:2]  # o resumo não despeja o cache de "a" nem de "b"
+        assert slots[3] != slots[2]
+        assert provider._busy_slots == set()
+        assert set(provider._slot_owner) == {"a", "b", "c"}
+
+    asyncio.run(run_test())
+
+
+def test_generate_stream_stops_and_closes_response_when_cancelled(monkeypatch):
+    import json
+
+    from bot_discord.core.cancellation import CancellationToken
+
+    class StreamResponse(DummyResponse):
+        def __init__(self, lines):
+            super().__init__(200)
+            self.closed = False
+
+            async def content():
+                for line in lines:
+                    if self.closed:
+                        return
+                    yield line
+
+            self.content = content()
+
+        def close(self):
+            self.closed = True
+
+    async def run_test():
+        provider = LMStudioProvider("http://localhost:1234/v1", "model")
+        lines = [f"data: {json.dumps({'choices': [{'delta': {'content': f't{i}'}}]})}".encode() for i in range(50)]
+        response = StreamResponse(lines)
+        session = MagicMock()
+        session.post.return_value = response
+        monkeypatch.setattr(provider, "_get_session", AsyncMock(return_value=session))
+        token = CancellationToken()
+
+        chunks = []
+        async for chunk in provider.generate_stream([{"role": "user", "content": "hi"}], max_tokens=100, cancel_token=token):
+            chunks.append(chunk)
+            if len(chunks) == 3:
+                token.cancel("deleted")
+
+        assert chunks == ["t0", "t1", "t2"]
+        assert response.closed
+        assert provider.metrics["cancelled"] == 1
+        assert provider.metrics["cancelled_tokens"] == 3
+        assert provider.metrics["cancelled_tokens_saved"] == 97
+        assert provider.scheduler.in_flight == 0
+
+    asyncio.run(run_test())
@@ -0,0 +1,57 @@
+import asyncio
+
+from bot_discord.core.llm_scheduler import (
+    LLMScheduler,
+    PRIORITY_EXTRACTION,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_SUMMARIZATION,
+)
+
+
+def test_interactive_requests_jump_background_work_and_users_alternate():
+    async def run_test():
+        scheduler = LLMScheduler(slots=1)
+        order = []
+
+        async def job(name, priority, user_id):
+            async with scheduler.slot(priority, user_id):
+                order.append(name)
+                await asyncio.sleep(0.001)
+
+        await scheduler.acquire()  # backend ocupado
+        tasks = [
+            asyncio.create_task(job("resumo", PRIORITY_SUMMARIZATION, None)),
+            asyncio.create_task(job("fatos", PRIORITY_EXTRACTION, "a")),
+            asyncio.create_task(job("a1", PRIORITY_INTERACTIVE, "a")),
+            asyncio.create_task(job("a2", PRIORITY_INTERACTIVE, "a")),
+            asyncio.create_task(job("b1", PRIORITY_INTERACTIVE, "b")),
+        ]
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth() == 5
+        scheduler.release()
+        await asyncio.gather(*tasks)
+
+        assert order == ["a1", "b1", "a2", "fatos", "resumo"]
+        assert scheduler.in_flight == 0
+        assert scheduler.metrics["wait_ms"]["interactive"].count == 4  # inclui o acquire inicial
+
+    asyncio.run(run_test())
+
+
+def test_cancelled_waiter_leaves_queue_and_slots_are_respected():
+    async def run_test():
+        scheduler = LLMScheduler(slots=2)
+        await scheduler.acquire()
+        await scheduler.acquire()
+        waiter = asyncio.create_task(scheduler.acquire(PRIORITY_EXTRACTION, "a"))
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth(PRIORITY_EXTRACTION) == 1
+
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert scheduler.queue_depth() == 0
+        scheduler.release()
+        scheduler.release()
+        assert scheduler.in_flight == 0
+
+    asyncio.run(run_test())
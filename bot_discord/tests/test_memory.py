@@ -33,7 +33,7 @@ def test_get_context_collects_memories():
         config = MagicMock()
         config.get_memory_limit.return_value = 25
         memory = Memory(config, db)
-        memory.embeddings.get_embedding = MagicMock(return_value=np.array([1.0], dtype=np.float32))
+        memory.embeddings.aget_embedding = AsyncMock(return_value=np.array([1.0], dtype=np.float32))
 
         context = await memory.get_context("1", query_text="hi")
         assert context["history"]
@@ -41,3 +41,49 @@ def test_get_context_collects_memories():
         assert context["journal"] == ["resumo"]
 
     asyncio.run(run_test())
+
+
+def test_get_context_skips_embedding_for_trivial_message():
+    async def run_test():
+        db = MagicMock()
+        db.get_history = AsyncMock(return_value=[])
+        db.get_summaries = AsyncMock(return_value=[])
+        db.get_semantic_memories = AsyncMock()
+        config = MagicMock()
+        config.get_memory_limit.return_value = 25
+        memory = Memory(config, db)
+        memory.embeddings.aget_embedding = AsyncMock()
+
+        context = await memory.get_context("1", query_text="kkkkk")
+        assert context["memories"] == []
+        memory.embeddings.aget_embedding.assert_not_awaited()
+        db.get_semantic_memories.assert_not_awaited()
+
+    asyncio.run(run_test())
+
+
+def test_pipeline_reuses_query_embedding_when_storing_same_text():
+    async def run_test():
+        from bot_discord.modules.pipeline import MessageContext
+
+        db = MagicMock()
+        db.get_history = AsyncMock(return_value=[])
+        db.get_summaries = AsyncMock(return_value=[])
+        db.get_semantic_memories = AsyncMock(return_value=[("mem", 0.9, 7)])
+        db.add_memory = AsyncMock()
+        config = MagicMock()
+        config.get_memory_limit.return_value = 25
+        memory = Memory(config, db)
+        vec = np.array([1.0, 0.0], dtype=np.float32)
+        memory.embeddings.aget_embedding = AsyncMock(return_value=vec)
+
+        pipeline = MessageContext("1", "Eu  gosto de café")
+        await memory.get_context("1", query_text="Eu  gosto de café", pipeline=pipeline)
+        await memory.store_permanent_info("1", "Eu gosto de café", pipeline=pipeline)
+
+        memory.embeddings.aget_embedding.assert_awaited_once()
+        db.add_memory.assert_awaited_once_with("1", "Eu gosto de café", 1, vec)
+        assert pipeline.retrieved_memory_ids == [7]
+        assert {"embedding", "retrieval"} <= set(pipeline.timings)
+
+    asyncio.run(run_test())
@@ -0,0 +1,27 @@
+import numpy as np
+
+from bot_discord.core.quantization import approx_scores, decode_blob, encode_blob, quantize_rows
+
+
+def _unit_rows(rows, dim=32):
+    matrix = np.random.default_rng(1).standard_normal((rows, dim)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def test_int8_scores_close_to_float32():
+    matrix = _unit_rows(50)
+    query = matrix[3]
+    codes, scales, offsets = quantize_rows(matrix, "int8")
+
+    approx = approx_scores(codes, query, scales, offsets)
+    assert codes.dtype == np.int8
+    assert np.max(np.abs(approx - matrix @ query)) < 0.05
+    assert int(np.argmax(approx)) == 3
+
+
+def test_blob_round_trip():
+    vec = _unit_rows(1)[0]
+    for mode in ("float16", "int8"):
+        codes, scale, offset = decode_blob(encode_blob(vec, mode), mode)
+        restored = codes.astype(np.float32) * scale + offset if scale is not None else codes.astype(np.float32)
+        assert np.allclose(restored, vec, atol=0.02)
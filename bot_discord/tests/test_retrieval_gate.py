@@ -0,0 +1,28 @@
+import numpy as np
+
+from bot_discord.modules.retrieval_gate import RetrievalGate
+
+
+def test_trivial_messages_skip_retrieval():
+    gate = RetrievalGate()
+    assert not gate.should_retrieve("kkkkk")
+    assert not gate.should_retrieve("<@123>")
+    assert not gate.should_retrieve("Oi, bom dia!")
+    assert gate.should_retrieve("qual é minha comida favorita?")
+    assert gate.metrics["skipped_empty"] == 1
+    assert gate.metrics["skipped_trivial"] == 2
+    assert gate.skip_ratio == 0.75
+
+
+def test_centroid_check_is_optional_and_passes_if_any_store_is_close():
+    user = (np.array([1.0, 0.0], dtype=np.float32) + np.array([0.8, 0.6], dtype=np.float32), 2)
+    global_memories = (np.array([0.0, 3.0], dtype=np.float32), 3)
+    gate = RetrievalGate(centroid_threshold=0.2)
+
+    assert gate.matches_centroids(np.array([1.0, 0.1], dtype=np.float32), [user])
+    assert not gate.matches_centroids(np.array([-1.0, 0.0], dtype=np.float32), [user])
+    # Close only to the global memories: the scan still runs
+    assert gate.matches_centroids(np.array([-0.2, 1.0], dtype=np.float32), [user, global_memories])
+    assert gate.matches_centroids(np.array([-1.0, 0.0], dtype=np.float32), [])
+    assert RetrievalGate().matches_centroids(np.array([-1.0, 0.0], dtype=np.float32), [user])
+    assert gate.metrics["skipped_centroid"] == 1
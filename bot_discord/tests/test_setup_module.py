@@ -7,8 +7,7 @@ from bot_discord.modules.setup import CharacterWizard
 def test_save_profile_persists_data():
     async def run_test():
         db = MagicMock()
-        db._db.execute = AsyncMock()
-        db._db.commit = AsyncMock()
+        db.save_active_profile = AsyncMock()
         wizard = CharacterWizard(MagicMock(), db, MagicMock(), MagicMock())
         payload = {
             "identity": {"name": "Teste"},
@@ -21,7 +20,7 @@ def test_save_profile_persists_data():
         }
 
         await wizard.save_profile(payload)
-        db._db.execute.assert_awaited()
-        db._db.commit.assert_awaited_once()
+        db.save_active_profile.assert_awaited_once()
+        assert '"Teste"' in db.save_active_profile.await_args.args[0]
 
     asyncio.run(run_test())
@@ -0,0 +1,27 @@
+import numpy as np
+
+from bot_discord.core.embeddings import EmbeddingManager
+from bot_discord.core.similarity import select_top_k
+
+
+def test_top_k_similarity_batches_queries_and_applies_threshold():
+    matrix = np.array([[1.0, 0.0], [0.0, 1.0], [0.8, 0.6], [-1.0, 0.0]], dtype=np.float16)
+    queries = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+
+    results = EmbeddingManager.top_k_similarity(queries, matrix, k=2, threshold=0.7, chunk=3)
+    assert [r[0].tolist() for r in results] == [[0, 2], [1]]
+    assert np.allclose(results[0][1], [1.0, 0.8], atol=1e-3)
+
+
+def test_weights_change_ranking_but_not_scores():
+    scores = np.array([0.9, 0.8, 0.1], dtype=np.float32)
+    top, top_scores = select_top_k(scores, 2, weights=np.array([1.0, 2.0, 1.0]))
+    assert top.tolist() == [1, 0]
+    assert np.allclose(top_scores, [0.8, 0.9])
+
+    # The threshold is applied before the weighted top-k: item 2 must not take a slot and then be dropped
+    top, top_scores = select_top_k(scores, 2, threshold=0.5, weights=np.array([1.0, 1.0, 20.0]))
+    assert top.tolist() == [0, 1]
+
+    unnormalized = EmbeddingManager.top_k_similarity([3.0, 4.0], np.array([[6.0, 8.0], [0.0, 2.0]]), k=5, normalized=False)
+    assert np.allclose(unnormalized[0][1], [1.0, 0.8])
@@ -0,0 +1,49 @@
+import asyncio
+
+from bot_discord.core.startup import StartupOrchestrator
+
+
+def test_phases_run_concurrently_after_dependencies():
+    async def run_test():
+        order = []
+
+        def phase(name, delay):
+            async def run():
+                order.append(f"{name}:start")
+                await asyncio.sleep(delay)
+                order.append(f"{name}:end")
+            return run
+
+        startup = StartupOrchestrator()
+        startup.add("database", phase("database", 0.01))
+        startup.add("llm", phase("llm", 0.05), depends_on=("database",))
+        startup.add("modules", phase("modules", 0.01), depends_on=("database",))
+        startup.start()
+
+        assert await startup.wait("modules")
+        assert startup.status["llm"] == "running"
+        assert await startup.wait()
+        assert order[:2] == ["database:start", "database:end"]
+        assert order.index("modules:end") < order.index("llm:end")
+        assert "llm" in startup.report()
+
+    asyncio.run(run_test())
+
+
+def test_failed_phase_skips_dependents():
+    async def run_test():
+        async def broken():
+            raise RuntimeError("sem servidor")
+
+        async def never():
+            raise AssertionError("não deveria rodar")
+
+        startup = StartupOrchestrator()
+        startup.add("llm", broken)
+        startup.add("ai_backend", never, depends_on=("llm",))
+        startup.start()
+
+        assert not await startup.wait()
+        assert startup.status == {"llm": "failed", "ai_backend": "skipped"}
+
+    asyncio.run(run_test())
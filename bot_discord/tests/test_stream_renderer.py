@@ -0,0 +1,138 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import discord
+
+from bot_discord.core.stream_renderer import StreamRendererPool, split_message
+
+
+def _channel():
+    channel = MagicMock(id=1)
+    sent = []
+
+    async def send(content):
+        msg = MagicMock()
+        msg.edit = AsyncMock()
+        sent.append(msg)
+        return msg
+
+    channel.send = AsyncMock(side_effect=send)
+    return channel, sent
+
+
+def test_edits_are_coalesced_and_final_text_is_delivered():
+    async def run_test():
+        pool = StreamRendererPool(min_interval=0.05)
+        channel, sent = _channel()
+        renderer = pool.renderer(channel)
+        for i in range(200):
+            renderer.feed(f"tok{i} ")
+            await asyncio.sleep(0.001)
+        text = "".join(f"tok{i} " for i in range(200))
+        assert await renderer.finish(text)
+
+        assert len(sent) == 1
+        edits = sent[0].edit.await_args_list
+        assert 0 < len(edits) < 20
+        assert edits[-1].kwargs["content"] == text
+        assert pool.metrics["edits_per_reply"].count == 1
+
+    asyncio.run(run_test())
+
+
+def test_long_reply_rolls_over_and_rate_limit_backs_off():
+    async def run_test():
+        pool = StreamRendererPool(min_interval=0.01)
+        channel, sent = _channel()
+        response = MagicMock(status=429, reason="Too Many Requests", headers={"Retry-After": "0.05"})
+        rate_limited = discord.HTTPException(response, "rate limited")
+        send = channel.send.side_effect
+        calls = {"n": 0}
+
+        async def flaky_send(content):
+            calls["n"] += 1
+            if calls["n"] == 1:
+                raise rate_limited
+            return await send(content)
+
+        channel.send = AsyncMock(side_effect=flaky_send)
+        renderer = pool.renderer(channel)
+        text = ("palavra " * 300).strip()
+        assert await renderer.finish(text)
+
+        parts = split_message(text)
+        assert len(parts) == 2 and all(len(p) <= 2000 for p in parts)
+        assert [c.args[0] for c in channel.send.await_args_list[1:]] == parts
+        assert pool.metrics["rate_limited"] == 1
+        assert pool.metrics["rollovers"] == 1
+        assert pool.pacer(1).interval > pool.min_interval  # ainda recuperando do rate limit
+
+    asyncio.run(run_test())
+
+
+def test_finish_waits_for_in_flight_send_instead_of_duplicating():
+    async def run_test():
+        pool = StreamRendererPool(min_interval=0.01)
+        channel, sent = _channel()
+        send = channel.send.side_effect
+
+        async def slow_send(content):
+            await asyncio.sleep(0.1)
+            return await send(content)
+
+        channel.send = AsyncMock(side_effect=slow_send)
+        renderer = pool.renderer(channel)
+        renderer.feed("Olá, tudo bem com você?")
+        await asyncio.sleep(0.05)  # primeiro envio em andamento
+        assert await renderer.finish("Olá, tudo bem com você? Fim.")
+
+        assert channel.send.await_count == 1
+        assert sent[0].edit.await_args.kwargs["content"] == "Olá, tudo bem com você? Fim."
+
+    asyncio.run(run_test())
+
+
+def test_final_text_survives_server_errors_and_rejected_edits():
+    async def run_test():
+        pool = StreamRendererPool(min_interval=0.01)
+        channel, sent = _channel()
+        renderer = pool.renderer(channel)
+        renderer.feed("resposta parcial")
+        await asyncio.sleep(0.05)
+
+        server_error = discord.DiscordServerError(MagicMock(status=503, reason="Unavailable"), "indisponível")
+        deleted = discord.NotFound(MagicMock(status=404, reason="Not Found"), "Unknown Message")
+        sent[0].edit.side_effect = [server_error, deleted]
+        assert await renderer.finish("resposta final")
+
+        assert sent[0].edit.await_count == 2
+        assert len(sent) == 2 and channel.send.await_args.args[0] == "resposta final"
+        assert pool.metrics["errors"] == 2
+
+    asyncio.run(run_test())
+
+
+def test_rate_limited_exception_and_slow_edits_back_off():
+    async def run_test():
+        pool = StreamRendererPool(min_interval=0.01)
+        channel, sent = _channel()
+        renderer = pool.renderer(channel)
+        renderer.feed("resposta parcial")
+        await asyncio.sleep(0.05)
+
+        calls = {"n": 0}
+
+        async def edit(content):
+            calls["n"] += 1
+            if calls["n"] == 1:
+                raise discord.RateLimited(0.02)  # não herda de HTTPException
+            await asyncio.sleep(0.05)  # 429 curto absorvido pelo discord.py
+
+        sent[0].edit.side_effect = edit
+        assert await renderer.finish("resposta final")
+
+        assert sent[0].edit.await_args.kwargs["content"] == "resposta final"
+        assert pool.metrics["rate_limited"] == 2
+        assert pool.pacer(1).interval >= 0.05
+
+    asyncio.run(run_test())
@@ -0,0 +1,44 @@
+import numpy as np
+
+from bot_discord.core.vector_index import VectorIndex, normalize
+
+
+def _blob(values):
+    return np.array(values, dtype=np.float32).tobytes()
+
+
+def test_search_returns_top_k_above_threshold():
+    index = VectorIndex()
+    index.load("u1", [
+        (1, "pizza", _blob([1.0, 0.0])),
+        (2, "futebol", _blob([0.0, 1.0])),
+        (3, "massa", _blob([0.9, 0.1])),
+        (4, "quebrado", _blob([1.0, 0.0, 0.0])),
+    ])
+
+    results = index.search("u1", normalize([1.0, 0.0]), limit=2, threshold=0.5)
+    assert [r[1] for r in results] == ["pizza", "massa"]
+    assert results[0][2] > results[1][2]
+
+
+def test_add_updates_loaded_entry_incrementally():
+    index = VectorIndex()
+    index.load("u1", [])
+    for i in range(40):
+        index.add("u1", i, f"fato {i}", np.array([1.0, float(i)], dtype=np.float32))
+    index.add("u2", 99, "ignorado", np.array([1.0, 0.0], dtype=np.float32))
+
+    assert "u2" not in index
+    results = index.search("u1", normalize([0.0, 1.0]), limit=1, threshold=0.0)
+    assert results[0][0] == 39
+
+
+def test_lru_evicts_least_recent_user_over_budget():
+    index = VectorIndex(max_bytes=600)
+    rows = [(i, "x", _blob([1.0] * 8)) for i in range(10)]
+    index.load("old", rows)
+    index.load("new", rows)
+
+    assert "new" in index
+    assert "old" not in index
+    assert index.metrics["evictions"] == 1
@@ -0,0 +1,71 @@
+# benchmark_ann.py
+# Compara a busca IVF (ANN) com a varredura exata: recall@k e latência.
+# Uso: python tools/benchmark_ann.py --rows 20000 50000 --k 3 --nprobe 4 8 16
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot_discord"))
+
+from core.ann_index import IVFIndex
+
+
+def make_corpus(rows, dim, clusters, rng):
+    """Vetores unitários agrupados, parecidos com embeddings reais de frases."""
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, rows)
+    matrix = centers[labels] + 0.6 * rng.standard_normal((rows, dim)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def exact_top_k(matrix, query, k):
+    scores = matrix @ query
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def ann_top_k(index, matrix, query, k, nprobe):
+    rows = index.candidates(query, nprobe=nprobe)
+    scores = matrix[rows] @ query
+    if len(rows) <= k:
+        return rows[np.argsort(-scores)]
+    top = np.argpartition(-scores, k - 1)[:k]
+    return rows[top[np.argsort(-scores[top])]]
+
+
+def run(rows_list, dim, k, nprobes, queries):
+    rng = np.random.default_rng(42)
+    print(f"{'linhas':>8} {'método':>12} {'recall@k':>9} {'ms/consulta':>12}")
+    for rows in rows_list:
+        matrix = make_corpus(rows, dim, clusters=max(8, rows // 500), rng=rng)
+        qs = make_corpus(queries, dim, clusters=8, rng=rng)
+
+        start = time.perf_counter()
+        truth = [exact_top_k(matrix, q, k) for q in qs]
+        exact_ms = (time.perf_counter() - start) * 1000 / queries
+        print(f"{rows:>8} {'exata':>12} {1.0:>9.3f} {exact_ms:>12.3f}")
+
+        start = time.perf_counter()
+        index = IVFIndex.build(matrix)
+        print(f"{rows:>8} {'(treino IVF)':>12} {'':>9} {(time.perf_counter() - start) * 1000:>12.1f}")
+
+        for nprobe in nprobes:
+            start = time.perf_counter()
+            found = [ann_top_k(index, matrix, q, k, nprobe) for q in qs]
+            ann_ms = (time.perf_counter() - start) * 1000 / queries
+            recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+            print(f"{rows:>8} {f'ivf np={nprobe}':>12} {recall:>9.3f} {ann_ms:>12.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ANN (IVF) vs busca exata")
+    parser.add_argument("--rows", type=int, nargs="+", default=[2000, 5000, 20000, 50000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    run(args.rows, args.dim, args.k, args.nprobe, args.queries)
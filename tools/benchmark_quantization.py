@@ -0,0 +1,65 @@
+# benchmark_quantization.py
+# Compara float32, float16 e int8: memória por vetor, vazão da varredura e
+# concordância do ranking (antes e depois da re-pontuação em float32).
+# Uso: python tools/benchmark_quantization.py --rows 20000 --k 3
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot_discord"))
+
+from core.quantization import STORAGE_MODES, approx_scores, encode_blob, quantize_rows
+
+
+def make_corpus(rows, dim, rng):
+    centers = rng.standard_normal((max(8, rows // 500), dim)).astype(np.float32)
+    matrix = centers[rng.integers(0, len(centers), rows)] + 0.6 * rng.standard_normal((rows, dim)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def top_k(scores, k):
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def run(rows, dim, k, queries, rescore_factor):
+    rng = np.random.default_rng(7)
+    matrix = make_corpus(rows, dim, rng)
+    qs = make_corpus(queries, dim, rng)
+    truth = [top_k(matrix @ q, k) for q in qs]
+    candidates = max(k * rescore_factor, 16)
+
+    print(f"{rows} vetores x {dim} dims, k={k}, candidatos re-pontuados={candidates}")
+    print(f"{'modo':>8} {'disco B/vet':>12} {'RAM MB':>8} {'Mvet/s':>8} {'top-k aprox':>12} {'top-k final':>12}")
+    for mode in STORAGE_MODES:
+        codes, scales, offsets = quantize_rows(matrix, mode)
+        ram = codes.nbytes + (2 * scales.nbytes if scales is not None else 0)
+        disk = len(encode_blob(matrix[0], mode))
+
+        start = time.perf_counter()
+        all_scores = [approx_scores(codes, q, scales, offsets) for q in qs]
+        elapsed = time.perf_counter() - start
+
+        approx_agree, final_agree = [], []
+        for scores, q, t in zip(all_scores, qs, truth):
+            approx_agree.append(len(set(top_k(scores, k)) & set(t)) / k)
+            cand = top_k(scores, candidates)
+            exact = cand[top_k(matrix[cand] @ q, k)]
+            final_agree.append(len(set(exact) & set(t)) / k)
+
+        print(f"{mode:>8} {disk:>12} {ram / 2**20:>8.1f} {rows * queries / elapsed / 1e6:>8.1f} "
+              f"{np.mean(approx_agree):>12.3f} {np.mean(final_agree):>12.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de embeddings quantizados")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    args = parser.parse_args()
+    run(args.rows, args.dim, args.k, args.queries, args.rescore_factor)
@@ -0,0 +1,62 @@
+# benchmark_topk.py
+# Compara a seleção top-k com argpartition (core.similarity) contra o sort
+# completo, para consultas isoladas e em lote, com matriz float32 e float16.
+# Uso: python tools/benchmark_topk.py --rows 50000 --queries 32 --k 5
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot_discord"))
+
+from core.similarity import top_k_similarity
+
+
+def full_sort(queries, matrix, k):
+    out = []
+    for q in queries:
+        scores = matrix.astype(np.float32) @ q
+        order = np.argsort(-scores)[:k]
+        out.append((order, scores[order]))
+    return out
+
+
+def timed(func, repeat):
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def run(rows, dim, queries, k, repeat):
+    rng = np.random.default_rng(3)
+    matrix = rng.standard_normal((rows, dim)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    qs = matrix[rng.choice(rows, queries, replace=False)] + 0.1 * rng.standard_normal((queries, dim)).astype(np.float32)
+    qs /= np.linalg.norm(qs, axis=1, keepdims=True)
+
+    print(f"{rows} vetores x {dim} dims, {queries} consultas, k={k} (ms por lote de consultas)")
+    print(f"{'matriz':>8} {'sort completo':>14} {'argpartition 1x1':>17} {'argpartition lote':>18}")
+    for dtype in (np.float32, np.float16):
+        m = matrix.astype(dtype)
+        reference = full_sort(qs, m, k)
+        batched = top_k_similarity(qs, m, k)
+        assert all(np.array_equal(a[0], b[0]) for a, b in zip(reference, batched))
+        t_sort = timed(lambda: full_sort(qs, m, k), repeat)
+        t_single = timed(lambda: [top_k_similarity(q, m, k) for q in qs], repeat)
+        t_batch = timed(lambda: top_k_similarity(qs, m, k), repeat)
+        print(f"{np.dtype(dtype).name:>8} {t_sort:>14.1f} {t_single:>17.1f} {t_batch:>18.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do top-k vetorizado")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=32)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.rows, args.dim, args.queries, args.k, args.repeat)
@@ -0,0 +1,75 @@
+# quantize_embeddings.py
+# Preenche a cópia quantizada (embedding_q) das memórias para EMBEDDING_STORAGE=float16/int8.
+# Uso: python tools/quantize_embeddings.py --mode int8 [--db caminho/bot_database.db]
+import argparse
+import os
+import sqlite3
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot_discord"))
+
+from core.quantization import STORAGE_MODES, encode_blob
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot_discord", "data", "bot_database.db")
+
+
+def ensure_columns(cursor):
+    cursor.execute("PRAGMA table_info(memories)")
+    columns = {row[1] for row in cursor.fetchall()}
+    for name, decl in (("embedding_q", "BLOB"), ("q_dtype", "TEXT")):
+        if name not in columns:
+            cursor.execute(f"ALTER TABLE memories ADD COLUMN {name} {decl}")
+
+
+def quantize(db_file, mode, batch_size=1000):
+    if not os.path.exists(db_file):
+        print(f"Erro: banco de dados não encontrado em {db_file}")
+        return
+
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+    ensure_columns(cursor)
+
+    if mode == "float32":
+        cursor.execute("UPDATE memories SET embedding_q = NULL, q_dtype = NULL")
+        conn.commit()
+        conn.close()
+        print("Cópias quantizadas removidas. Use EMBEDDING_STORAGE=float32.")
+        return
+
+    total = 0
+    last_id = 0
+    while True:
+        cursor.execute(
+            "SELECT id, embedding FROM memories WHERE id > ? AND embedding IS NOT NULL "
+            "AND (q_dtype IS NULL OR q_dtype != ?) ORDER BY id LIMIT ?",
+            (last_id, mode, batch_size)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        updates = []
+        for mem_id, blob in rows:
+            vec = np.frombuffer(blob, dtype=np.float32)
+            norm = float(np.linalg.norm(vec))
+            unit = vec / norm if norm > 0 else vec
+            updates.append((encode_blob(unit, mode), mode, mem_id))
+        cursor.executemany("UPDATE memories SET embedding_q = ?, q_dtype = ? WHERE id = ?", updates)
+        conn.commit()
+        total += len(rows)
+        last_id = rows[-1][0]
+        print(f"  {total} memórias quantizadas...")
+
+    conn.close()
+    print(f"Concluído: {total} memórias em {mode}. Defina EMBEDDING_STORAGE={mode} no .env.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantiza os embeddings salvos na tabela memories")
+    parser.add_argument("--mode", choices=STORAGE_MODES, required=True)
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+    quantize(os.path.abspath(args.db), args.mode, args.batch)